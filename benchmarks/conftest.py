@@ -0,0 +1,32 @@
+"""benchmarks of prestest overhead against the fake docker, hive and presto stand-ins in tests/fakes.py. They need
+pytest-benchmark and are not collected without it.
+"""
+from pathlib import Path
+
+import pytest
+
+from prestest.container import Container
+from tests.conftest import fake_cache, fake_db_manager, fake_engine, fake_teardown  # noqa: F401
+from tests.fakes import attach_fakes
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    collect_ignore_glob = ["test_*.py"]
+
+BASELINE_FOLDER = Path(__file__).resolve().parent / "baselines"
+
+DEFAULT_STORAGE = "file://./.benchmarks"
+
+
+def pytest_configure(config):
+    # compare with and save to the baselines of the repository unless --benchmark-storage is given
+    if getattr(config.option, "benchmark_storage", None) == DEFAULT_STORAGE:
+        config.option.benchmark_storage = f"file://{BASELINE_FOLDER}"
+
+
+@pytest.fixture()
+def container(tmpdir):
+    container = Container(Path(tmpdir))
+    attach_fakes(container)
+    return container
@@ -0,0 +1,58 @@
+"""throughput and peak memory of fetching presto results from a local statement protocol server"""
+import tracemalloc
+
+import pytest
+
+from prestest.presto import Page, StatementClient, decode_page
+from tests.fakes import FakePrestoServer
+
+COLUMNS = [("id", "bigint"), ("value", "double"), ("name", "varchar")]
+
+PAGE_ROWS = 4096
+
+
+def rows(n):
+    return [[i, i / 3, f"name_{i}"] for i in range(n)]
+
+
+@pytest.fixture(scope="module", params=[1000, 10000, 100000])
+def server(request):
+    with FakePrestoServer(COLUMNS, rows(request.param), page_size=PAGE_ROWS) as server:
+        server.size = request.param
+        yield server
+
+
+def test_decode_page(benchmark):
+    page = Page([{"name": name, "type": presto_type} for name, presto_type in COLUMNS], rows(PAGE_ROWS))
+    benchmark(decode_page, page)
+    benchmark.extra_info["rows_per_second"] = PAGE_ROWS / benchmark.stats.stats.mean
+
+
+def measure(benchmark, server, function):
+    result = benchmark.pedantic(function, rounds=3, iterations=1, warmup_rounds=1)
+    assert len(result) == server.size
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    benchmark.extra_info["rows"] = server.size
+    benchmark.extra_info["rows_per_second"] = server.size / benchmark.stats.stats.mean
+    benchmark.extra_info["peak_memory_bytes"] = peak
+
+
+def test_read_sql_columnar(benchmark, fake_db_manager, server):
+    fake_db_manager.get_statement_client = lambda: StatementClient(server.url)
+    measure(benchmark, server, lambda: fake_db_manager.read_sql("SELECT * FROM sandbox.table", columnar=True))
+
+
+def test_iter_sql(benchmark, fake_db_manager, server):
+    fake_db_manager.get_statement_client = lambda: StatementClient(server.url)
+
+    def consume():
+        total = []
+        for batch in fake_db_manager.iter_sql("SELECT * FROM sandbox.table", batch_rows=PAGE_ROWS):
+            total.extend(batch["id"])
+        return total
+
+    measure(benchmark, server, consume)
@@ -0,0 +1,56 @@
+"""overhead of container and table setup per call, excluding the work done by docker and hive"""
+from pathlib import Path
+
+import pytest
+
+from prestest.state import ClusterState
+from prestest.container import CONTAINER_NAMES
+
+
+def test_health_poll(benchmark, container):
+    state = ClusterState(container.api_client, CONTAINER_NAMES, ttl=0)
+    assert benchmark(state.is_healthy)
+
+
+def test_health_check_cached(benchmark, container):
+    assert benchmark(container.is_healthy)
+
+
+def test_exec(benchmark, container):
+    benchmark(container.execute_command, ["test", "-d", "/tmp"])
+
+
+@pytest.mark.parametrize("size", [1024, 1024 ** 2])
+def test_put_files(benchmark, container, tmpdir, size):
+    file = Path(tmpdir.join("table.csv"))
+    file.write_bytes(b"1,abc\n" * (size // 6))
+    benchmark(container.put_files, {"table.csv": file}, "/tmp")
+    benchmark.extra_info["bytes"] = file.stat().st_size
+
+
+def test_upload_staged_file(benchmark, container, tmpdir):
+    file = Path(tmpdir.join("table.csv"))
+    file.write_bytes(b"1,abc\n" * 1000)
+
+    def upload():
+        with container.upload_temp_table_file(file):
+            pass
+
+    benchmark(upload)
+
+
+def test_create_table(benchmark, fake_db_manager, tmpdir):
+    file = Path(tmpdir.join("table.csv"))
+    file.write_text("1,abc\n")
+    query = "CREATE TABLE sandbox.table (col1 INT, col2 STRING)"
+    fake_db_manager.create_table("sandbox.table", query, file)
+    benchmark.extra_info["hive_queries_per_call"] = len(fake_db_manager.hive_client.queries)
+    benchmark(fake_db_manager.create_table, "sandbox.table", query, file)
+
+
+def test_create_table_memoized(benchmark, fake_db_manager, tmpdir):
+    file = Path(tmpdir.join("table.csv"))
+    file.write_text("1,abc\n")
+    query = "CREATE TABLE sandbox.table (col1 INT, col2 STRING)"
+    fake_db_manager.create_table("sandbox.table", query, file, memoize=True)
+    assert not benchmark(fake_db_manager.create_table, "sandbox.table", query, file, memoize=True)
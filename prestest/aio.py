@@ -0,0 +1,177 @@
+"""asyncio counterparts of Container and DBManager. Blocking calls run in a shared thread pool so that independent
+container operations, table setup and queries can be awaited concurrently.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PosixPath
+from typing import Iterable, List, Union
+
+import pandas as pd
+
+from .container import Container
+from .backend import Backend
+from .db import DBManager
+from .partitions import Partitions
+
+MAX_WORKERS = 16
+
+CONCURRENCY = 8
+
+_EXECUTOR = None  # type: ThreadPoolExecutor
+_LOCK = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """return the thread pool running blocking calls of every async object, creating it at first call."""
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="prestest-aio")
+        return _EXECUTOR
+
+
+async def run_in_executor(function, *args, **kwargs):
+    """run a blocking `function` in the shared thread pool and return its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(function, *args, **kwargs))
+
+
+class AsyncContainer:
+    """asyncio wrapper of a Container. Every method awaits the blocking method with the same name. See `Container` for
+    details.
+    """
+    def __init__(self, container: Container):
+        self.container = container
+
+    async def start(self, until_started=True, wait_policy=None, recreate=False):
+        return await run_in_executor(self.container.start, until_started=until_started, wait_policy=wait_policy,
+                                     recreate=recreate)
+
+    async def stop(self):
+        return await run_in_executor(self.container.stop)
+
+    async def is_started(self) -> bool:
+        return await run_in_executor(self.container.is_started)
+
+    async def is_healthy(self) -> bool:
+        return await run_in_executor(self.container.is_healthy)
+
+    async def is_presto_started(self) -> bool:
+        return await run_in_executor(self.container.is_presto_started)
+
+    async def reset(self, allow_table_modification=False, autostart=False, until_started=False):
+        return await run_in_executor(self.container.reset, allow_table_modification=allow_table_modification,
+                                     autostart=autostart, until_started=until_started)
+
+    async def snapshot(self, name: str):
+        return await run_in_executor(self.container.snapshot, name)
+
+    async def restore(self, name: str, until_started=True):
+        return await run_in_executor(self.container.restore, name, until_started=until_started)
+
+    async def copy_from_local(self, *args, **kwargs):
+        return await run_in_executor(self.container.copy_from_local, *args, **kwargs)
+
+    async def download_from_container(self, *args, **kwargs):
+        return await run_in_executor(self.container.download_from_container, *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await run_in_executor(self.container.delete, *args, **kwargs)
+
+    async def execute_command(self, *args, **kwargs) -> str:
+        return await run_in_executor(self.container.execute_command, *args, **kwargs)
+
+
+class AsyncDBManager:
+    """asyncio wrapper of a DBManager, or of any `prestest.backend.Backend`. Queries and table setup can be awaited
+    together with `asyncio.gather`; they share the pooled hive and presto connections of the wrapped DBManager.
+
+    :example:
+    >>> db = AsyncDBManager(DBManager(docker_folder))
+    >>> first, second = await asyncio.gather(db.read_sql(query_1), db.read_sql(query_2))
+    """
+    def __init__(self, db_manager: Backend, concurrency: int=CONCURRENCY):
+        self.db_manager = db_manager
+        self.container = AsyncContainer(db_manager.container)
+        self.concurrency = concurrency
+
+    async def create_database(self, schema: str):
+        return await run_in_executor(self.db_manager.create_database, schema)
+
+    async def create_table(self, table: str, query: str, file: Union[PosixPath, str], memoize: bool=False) -> bool:
+        return await run_in_executor(self.db_manager.create_table, table, query, Path(file), memoize=memoize)
+
+    async def create_tables(self, tables: List[dict], memoize: bool=False, concurrency: int=None) -> List[bool]:
+        """create multiple tables concurrently. Each database is created once first so that tables of the same database
+        do not race to create it, then at most `concurrency` tables are uploaded and loaded at the same time.
+
+        :param tables: a list of dictionaries with keys "table", "query" and "file". See `DBManager.create_table`.
+        :param memoize: reuse existing tables created from the same query and file content.
+        :param concurrency: maximum number of tables created at the same time. Use `self.concurrency` if not provided.
+        :return: a list telling whether each table was created, in the same order as `tables`
+        """
+        schemas = []
+        for spec in tables:
+            schema, _ = spec["table"].split(".")
+            if schema not in schemas:
+                schemas.append(schema)
+        await asyncio.gather(*(self.create_database(schema) for schema in schemas))
+
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def create(spec):
+            async with semaphore:
+                return await self.create_table(spec["table"], spec["query"], spec["file"], memoize=memoize)
+
+        return list(await asyncio.gather(*(create(spec) for spec in tables)))
+
+    async def create_partitioned_table(self, table: str, query: str, partitions: Partitions, **kwargs) -> bool:
+        return await run_in_executor(self.db_manager.create_partitioned_table, table, query, partitions, **kwargs)
+
+    async def create_external_table(self, table: str, query: str, folder: Union[PosixPath, str], **kwargs):
+        return await run_in_executor(self.db_manager.create_external_table, table, query, folder, **kwargs)
+
+    async def create_table_from_dataframe(self, table: str, df: pd.DataFrame, **kwargs):
+        return await run_in_executor(self.db_manager.create_table_from_dataframe, table, df, **kwargs)
+
+    async def drop_table(self, table: str):
+        return await run_in_executor(self.db_manager.drop_table, table)
+
+    async def drop_tables(self, tables: Iterable[str]):
+        """drop tables concurrently, at most `self.concurrency` at the same time."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def drop(table):
+            async with semaphore:
+                await self.drop_table(table)
+
+        await asyncio.gather(*(drop(table) for table in tables))
+
+    async def read_sql(self, query: str, columnar: bool=False) -> pd.DataFrame:
+        return await run_in_executor(self.db_manager.read_sql, query, columnar=columnar)
+
+    async def read_sqls(self, queries: Iterable[str], columnar: bool=False) -> List[pd.DataFrame]:
+        """run presto queries concurrently, at most `self.concurrency` at the same time.
+
+        :param queries: presto queries
+        :param columnar: see `DBManager.read_sql`
+        :return: a list of dataframes in the same order as `queries`
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def read(query):
+            async with semaphore:
+                return await self.read_sql(query, columnar=columnar)
+
+        return list(await asyncio.gather(*(read(query) for query in queries)))
+
+    async def read_arrow(self, query: str):
+        return await run_in_executor(self.db_manager.read_arrow, query)
+
+    async def run_hive_query(self, query: str):
+        return await run_in_executor(self.db_manager.run_hive_query, query)
+
+    async def fetch_hive_query(self, query: str) -> List[tuple]:
+        return await run_in_executor(self.db_manager.fetch_hive_query, query)
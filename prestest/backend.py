@@ -0,0 +1,81 @@
+"""the interface of every backend creating tables and running queries for tests: `prestest.db.DBManager` on the docker
+stack, `prestest.lite.LiteDBManager` in memory and `prestest.daemon.DaemonDBManager` through the daemon. Fixtures only
+depend on this interface, so tests run unchanged on any backend.
+"""
+import abc
+from pathlib import PosixPath
+from typing import Iterator, List, Optional, Union
+
+import pandas as pd
+
+from .partitions import Partitions
+
+
+class Backend(abc.ABC):
+    """tables and queries of one backend. Table names are logical names such as 'sandbox.my_table'. A backend missing
+    one of the methods below cannot be created. `container` is the Container of the stack, None without containers.
+    """
+    container = None
+
+    @abc.abstractmethod
+    def warm_up(self, connections: int):
+        """open `connections` connections so that later queries reuse them."""
+
+    @abc.abstractmethod
+    def create_database(self, schema: str):
+        """create database `schema` if it doesn't exist."""
+
+    @abc.abstractmethod
+    def drop_database(self, schema: str, cascade: bool=True):
+        """drop database `schema`, with all its tables if `cascade`."""
+
+    @abc.abstractmethod
+    def create_table(self, table: str, query: str, file: Union[PosixPath, str], memoize: bool=False) -> bool:
+        """create `table` with hive `query` and load `file` into it. return whether the table was created."""
+
+    def create_tables(self, tables: List[dict], memoize: bool=False):
+        """create tables given as dictionaries with keys "table", "query" and "file". See `create_table`."""
+        for spec in tables:
+            self.create_table(spec["table"], spec["query"], spec["file"], memoize=memoize)
+
+    @abc.abstractmethod
+    def create_partitioned_table(self, table: str, query: str, partitions: Partitions, register: str="add",
+                                 memoize: bool=False, concurrency: int=None) -> bool:
+        """create partitioned `table` with hive `query` and load the files of every partition into it."""
+
+    @abc.abstractmethod
+    def create_external_table(self, table: str, query: str, folder: Union[PosixPath, str], mount=None):
+        """create `table` reading the files of `folder` of the fixture folder."""
+
+    @abc.abstractmethod
+    def create_table_from_dataframe(self, table: str, df: pd.DataFrame, format: str="parquet",
+                                    partition_by: List[str]=None, compression: str="snappy"):
+        """create `table` holding the rows of `df`."""
+
+    @abc.abstractmethod
+    def get_table_fingerprint(self, table: str) -> Optional[str]:
+        """return the fingerprint of a memoized table, None if it doesn't exist or was not memoized."""
+
+    @abc.abstractmethod
+    def drop_table(self, table: str):
+        """drop `table` if it exists."""
+
+    @abc.abstractmethod
+    def read_sql(self, query: str, columnar: bool=False) -> pd.DataFrame:
+        """return the result of presto `query` as a dataframe."""
+
+    @abc.abstractmethod
+    def read_arrow(self, query: str):
+        """return the result of presto `query` as a pyarrow Table."""
+
+    @abc.abstractmethod
+    def iter_sql(self, query: str, batch_rows: int=100000, arrow: bool=False) -> Iterator[pd.DataFrame]:
+        """yield the result of presto `query` in batches of `batch_rows` rows."""
+
+    @abc.abstractmethod
+    def run_hive_query(self, query: str):
+        """execute hive `query`."""
+
+    @abc.abstractmethod
+    def fetch_hive_query(self, query: str) -> List[tuple]:
+        """execute hive `query` and return all rows of the result."""
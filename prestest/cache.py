@@ -0,0 +1,358 @@
+"""cache presto query results of `DBManager.read_sql`. A result is keyed by the normalized query and the version of
+every table it reads, so creating, loading, altering or dropping a table makes cached results reading it stale. Results
+are kept in memory with least recently used eviction, and optionally in parquet files which persist across sessions.
+
+Only tables written as 'schema.table' after FROM, JOIN, TABLE, INTO or EXISTS, or in comma separated FROM lists, are
+tracked. Results of queries reading other tables, such as unqualified ones, are not cached.
+"""
+import hashlib
+import itertools
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path, PosixPath
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+CACHE_BUDGET = 256 * 1024 ** 2  # bytes
+
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")  # quotes are escaped as '' in presto and \' in hive
+
+WHITESPACE = re.compile(r"\s+")
+
+IDENTIFIER = r"(?:`[^`]+`|\"[^\"]+\"|[A-Za-z_]\w*)"
+
+TABLE_NAME = rf"{IDENTIFIER}(?:\s*\.\s*{IDENTIFIER}){{0,2}}"
+
+TABLE_REFERENCE = re.compile(rf"\b(?:TABLE|INTO|EXISTS)\s+({IDENTIFIER}(?:\s*\.\s*{IDENTIFIER}){{1,2}})",
+                             re.IGNORECASE)
+
+FROM_CLAUSE = re.compile(r"\b(FROM|JOIN)\b", re.IGNORECASE)
+
+FROM_ITEM = re.compile(rf"\s*(?:(?P<open>\()|(?P<name>{TABLE_NAME})(?P<call>\s*\()?)")
+
+# tokens delimiting the items of a FROM clause
+FROM_LIST_TOKEN = re.compile(r"[(),]|\b(?:WHERE|GROUP|HAVING|ORDER|LIMIT|OFFSET|FETCH|UNION|EXCEPT|INTERSECT|WINDOW)\b",
+                             re.IGNORECASE)
+
+COMMON_TABLE = re.compile(rf"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*({IDENTIFIER})\s*(?:\([^()]*\)\s*)?AS\s*\(",
+                          re.IGNORECASE)
+
+DROP_DATABASE = re.compile(rf"^\s*DROP\s+(?:DATABASE|SCHEMA)\s+(?:IF\s+EXISTS\s+)?({IDENTIFIER})", re.IGNORECASE)
+
+READ_ONLY = re.compile(r"^\s*\(*\s*(?:SELECT|WITH|VALUES|SHOW|DESCRIBE|DESC|EXPLAIN)\b", re.IGNORECASE)
+
+# parquet metadata holding the seconds a cached query took
+SECONDS_METADATA = b"prestest.seconds"
+
+# prefix of versions only meaningful in current process
+LOCAL_VERSION = "~"
+
+
+def normalize_sql(query: str) -> str:
+    """collapse whitespace outside string literals and remove the trailing semicolon of `query`."""
+    parts, end = [], 0
+    for literal in STRING_LITERAL.finditer(query):
+        parts.append(WHITESPACE.sub(" ", query[end:literal.start()]))
+        parts.append(literal.group(0))
+        end = literal.end()
+    parts.append(WHITESPACE.sub(" ", query[end:]))
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def referenced_tables(query: str) -> List[str]:
+    """return lower case names of tables `query` reads or writes, in order of first appearance."""
+    return _table_references(query)[0]
+
+
+def cacheable_tables(query: str) -> Optional[List[str]]:
+    """return lower case names of tables `query` reads or writes, or None if it reads a table which cannot be tracked,
+    such as a table without schema."""
+    tables, resolved = _table_references(query)
+    return tables if resolved else None
+
+
+def _table_references(query: str) -> Tuple[List[str], bool]:
+    """return names of 'schema.table' references of `query`, and whether every FROM and JOIN item was resolved."""
+    query = STRING_LITERAL.sub("''", query)
+    common_tables = {_parts(name)[0] for name in COMMON_TABLE.findall(query)}
+    references = [(match.start(1), match.group(1)) for match in TABLE_REFERENCE.finditer(query)]
+    resolved = True
+    for clause in FROM_CLAUSE.finditer(query):
+        starts = [clause.end()] if clause.group(1).upper() == "JOIN" else _from_list(query, clause.end())
+        for start in starts:
+            item = FROM_ITEM.match(query, start)
+            if item is None:
+                resolved = False
+            elif item.group("name") and not item.group("call"):  # not a subquery or a function such as UNNEST(...)
+                if len(_parts(item.group("name"))) > 1:
+                    references.append((item.start("name"), item.group("name")))
+                elif _parts(item.group("name"))[0] not in common_tables:
+                    resolved = False
+
+    tables = [".".join(_parts(name)[-2:]) for _, name in sorted(references)]
+    return list(OrderedDict.fromkeys(tables)), resolved
+
+
+def _from_list(query: str, position: int) -> List[int]:
+    """return start positions of the comma separated items of the FROM clause starting at `position`"""
+    starts, depth = [position], 0
+    for token in FROM_LIST_TOKEN.finditer(query, position):
+        if token.group(0) == "(":
+            depth += 1
+        elif token.group(0) == ")":
+            depth -= 1
+            if depth < 0:
+                break
+        elif depth == 0 and token.group(0) == ",":
+            starts.append(token.end())
+        elif depth == 0:
+            break
+    return starts
+
+
+def _parts(name: str) -> List[str]:
+    """split a dotted name into lower case unquoted parts"""
+    return [part.strip("`\"").lower() for part in re.findall(IDENTIFIER, name)]
+
+
+def is_read_only(query: str) -> bool:
+    """return whether `query` only reads data, such as a SELECT statement."""
+    return READ_ONLY.match(query) is not None
+
+
+class TableVersions:
+    """the version of every table of every stack. A version is the fingerprint of the content a table was created
+    from, so identical tables have the same version in every session, or a counter prefixed with LOCAL_VERSION when
+    the content is not known. Tables never changed by this process have version None.
+    """
+    def __init__(self):
+        self.versions = {}  # type: Dict[Tuple[str, str], str]
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, scope: str, table: str) -> Optional[str]:
+        """return version of `table` in stack `scope`"""
+        return self.versions.get((scope, table.lower()))
+
+    def bump(self, scope: str, tables: Iterable[str], version: str=None):
+        """change version of `tables` in stack `scope`.
+
+        :param scope: the stack, such as the url of its presto coordinator
+        :param tables: names of tables as 'schema.table'
+        :param version: fingerprint of the new content. A new local version if None.
+        :return: None
+        """
+        with self._lock:
+            for table in tables:
+                self.versions[(scope, table.lower())] = version or f"{LOCAL_VERSION}{next(self._counter)}"
+
+    def bump_schema(self, scope: str, schema: str):
+        """change version of all known tables of `schema` in stack `scope`, for example after it was dropped."""
+        prefix = schema.strip("`\"").lower() + "."
+        self.bump(scope, [table for table in self.tables(scope) if table.startswith(prefix)])
+
+    def tables(self, scope: str) -> List[str]:
+        """return names of all known tables of stack `scope`."""
+        with self._lock:
+            return [table for s, table in self.versions if s == scope]
+
+    def of(self, scope: str, tables: Iterable[str]) -> Tuple[Tuple[Tuple[str, Optional[str]], ...], bool]:
+        """return versions of `tables` in stack `scope`, and whether all of them are fingerprints of known content.
+        Results of queries reading no known table are never persistent, they may read tables that are not tracked.
+        """
+        versions = tuple((table, self.get(scope, table)) for table in sorted(set(tables)))
+        persistent = bool(versions) and all(version is not None and not version.startswith(LOCAL_VERSION)
+                                            for _, version in versions)
+        return versions, persistent
+
+
+class CacheStats:
+    """hits and misses of a ResultCache. `saved` is the seconds the cached queries took when they were run."""
+    def __init__(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def to_dict(self) -> dict:
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "evictions": self.evictions,
+                "saved": self.saved, "hit_rate": self.hit_rate}
+
+    def __repr__(self):
+        return f"CacheStats({self.to_dict()})"
+
+
+class CacheEntry:
+    def __init__(self, df: pd.DataFrame, size: int, seconds: float):
+        self.df = df
+        self.size = size
+        self.seconds = seconds
+
+
+class ResultCache:
+    """query results kept in memory up to `budget` bytes, least recently used evicted first. If `folder` is set,
+    results whose tables all have known content are also written there as parquet files and read back by later
+    sessions. Requires pyarrow for the disk tier. Returned dataframes are copies, so tests may modify them.
+    """
+    def __init__(self, budget: int=None, folder: Union[PosixPath, str]=None):
+        self.budget = budget if budget is not None else CACHE_BUDGET
+        self.folder = Path(folder) if folder is not None else None
+        self.entries = OrderedDict()  # type: OrderedDict[str, CacheEntry]
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """memory used by cached results in bytes"""
+        return sum(entry.size for entry in self.entries.values())
+
+    @staticmethod
+    def key(scope: str, query: str, versions: tuple, columnar: bool=False) -> str:
+        """return the cache key of `query` run on stack `scope` while its tables have `versions`."""
+        digest = hashlib.sha256()
+        for part in (scope, normalize_sql(query), repr(versions), str(columnar)):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """return a copy of the result cached at `key`, looking in memory then on disk. None if it is not cached."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None:
+                with self.lock:
+                    self.stats.disk_hits += 1
+                    self._add(key, entry)
+
+        with self.lock:
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self.stats.saved += entry.seconds
+        return entry.df.copy()
+
+    def put(self, key: str, df: pd.DataFrame, seconds: float=0.0, persist: bool=False):
+        """cache a copy of result `df` at `key`.
+
+        :param key: a key returned by `key`
+        :param df: the result
+        :param seconds: time the query took
+        :param persist: also write the result to the disk tier, if any
+        :return: None
+        """
+        df = df.copy()
+        entry = CacheEntry(df, int(df.memory_usage(index=True, deep=True).sum()), seconds)
+        with self.lock:
+            self._add(key, entry)
+        if persist and self.folder is not None:
+            self._save(key, entry)
+
+    def clear(self, disk: bool=False):
+        """forget results kept in memory, and on disk if `disk` is True."""
+        with self.lock:
+            self.entries.clear()
+        if disk and self.folder is not None and self.folder.exists():
+            for file in self.folder.glob("*.parquet"):
+                file.unlink()
+
+    def _add(self, key: str, entry: CacheEntry):
+        if entry.size > self.budget:
+            return
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        size = self.size
+        while size > self.budget:
+            _, evicted = self.entries.popitem(last=False)
+            size -= evicted.size
+            self.stats.evictions += 1
+
+    def _file(self, key: str) -> Path:
+        return self.folder / f"{key}.parquet"
+
+    def _save(self, key: str, entry: CacheEntry):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(entry.df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[SECONDS_METADATA] = str(entry.seconds).encode()
+        table = table.replace_schema_metadata(metadata)
+        temp_file = self._file(key).with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            pq.write_table(table, str(temp_file))
+            os.replace(str(temp_file), str(self._file(key)))
+        except Exception as e:
+            logging.warning(f"failed to write cached result {key}. {e}")
+            if temp_file.exists():
+                temp_file.unlink()
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        if self.folder is None or not self._file(key).exists():
+            return None
+        import pyarrow.parquet as pq
+
+        try:
+            table = pq.read_table(str(self._file(key)))
+        except Exception as e:
+            logging.warning(f"failed to read cached result {key}. {e}")
+            return None
+        seconds = float((table.schema.metadata or {}).get(SECONDS_METADATA, b"0"))
+        df = table.to_pandas()
+        return CacheEntry(df, int(df.memory_usage(index=True, deep=True).sum()), seconds)
+
+
+_CACHE = None  # type: ResultCache
+_VERSIONS = TableVersions()
+_LOCK = threading.Lock()
+
+
+def configure(budget: int=None, folder: Union[PosixPath, str]=None):
+    """change the memory budget in bytes and the disk folder of the result cache of the process. Results cached in
+    memory are kept, up to the new budget.
+
+    :param budget: maximum memory used by cached results
+    :param folder: folder of the parquet tier. Requires pyarrow. Use None to keep results in memory only.
+    :return: None
+    """
+    if folder is not None:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("pyarrow is required to cache results on disk. pip install pyarrow")
+    cache = get_result_cache()
+    with cache.lock:
+        cache.budget = budget if budget is not None else cache.budget
+        cache.folder = Path(folder) if folder is not None else None
+        while cache.size > cache.budget:
+            cache.entries.popitem(last=False)
+            cache.stats.evictions += 1
+
+
+def get_result_cache() -> ResultCache:
+    """return the ResultCache of current process, shared by every DBManager with caching enabled."""
+    global _CACHE
+    with _LOCK:
+        if _CACHE is None:
+            _CACHE = ResultCache()
+        return _CACHE
+
+
+def get_table_versions() -> TableVersions:
+    """return the TableVersions of current process, updated by every DBManager whether it caches results or not."""
+    return _VERSIONS
@@ -0,0 +1,126 @@
+"""render presto catalog properties into files bind-mounted into the presto coordinator. Connector properties, such as
+those allowing presto to modify hive tables, are then set before containers start instead of being edited inside a
+running container. Mounted files are the properties files of the presto image with the configured properties set, so
+settings shipped with the image are kept.
+"""
+import hashlib
+import json
+import re
+from pathlib import Path, PosixPath, PurePosixPath
+from typing import Dict, Optional, Union
+
+from .compose import SERVICES
+
+TABLE_MODIFICATION = {
+    "hive.allow-drop-table": "true",
+    "hive.allow-rename-table": "true",
+    "hive.allow-add-column": "true",
+}
+
+# key of a line of a java properties file, such as `hive.metastore.uri=thrift://hive-metastore:9083`
+PROPERTY_KEY = re.compile(r"^\s*([^#!\s=:][^\s=:]*)")
+
+COMPOSE_VERSION = re.compile(r"^version:\s*['\"]?([\d.]+)", re.MULTILINE)
+
+OVERRIDE_FILE = "docker-compose.catalog.json"
+
+CATALOG_LABEL = "prestest.catalog"
+
+
+class CatalogConfig:
+    """properties set on top of the presto catalogs of the presto image, a dictionary from catalog name to properties.
+    The default configuration sets nothing, and the catalogs of the image are used as is without mounting files.
+    """
+    def __init__(self, catalogs: Dict[str, Dict[str, str]]=None):
+        self.catalogs = {name: dict(properties) for name, properties in (catalogs or {}).items() if properties}
+
+    @property
+    def is_default(self) -> bool:
+        return not self.catalogs
+
+    def set(self, catalog: str, **properties) -> "CatalogConfig":
+        """return a copy with `properties` set in `catalog`. Properties whose value is None are reset to the value of
+        the presto image.
+
+        :example:
+        >>> CatalogConfig().set("hive", **{"hive.allow-drop-table": "true"})
+
+        :param catalog: name of the catalog, such as 'hive'
+        :param properties: property names and values
+        :return: a CatalogConfig
+        """
+        config = CatalogConfig(self.catalogs)
+        target = config.catalogs.setdefault(catalog, {})
+        for key, value in properties.items():
+            if value is None:
+                target.pop(key, None)
+            else:
+                target[key] = str(value)
+        if not target:
+            del config.catalogs[catalog]
+        return config
+
+    def with_table_modification(self, allow: bool=True) -> "CatalogConfig":
+        """return a copy allowing (or not) presto to drop, rename and add columns to hive tables."""
+        return self.set("hive", **{key: (value if allow else None) for key, value in TABLE_MODIFICATION.items()})
+
+    def render(self, catalog: str, original: str="") -> str:
+        """return content of the properties file of `catalog`: lines of `original`, the file of the presto image, with
+        the properties of this configuration replacing the ones set in it.
+
+        :param catalog: name of the catalog
+        :param original: content of the properties file of the image. Empty for catalogs the image doesn't have.
+        :return: content of the properties file
+        """
+        properties = self.catalogs[catalog]
+        lines = [line for line in original.splitlines() if _key(line) not in properties]
+        lines += [f"{key}={value}" for key, value in sorted(properties.items())]
+        return "".join(f"{line}\n" for line in lines)
+
+    def write(self, folder: Union[PosixPath, str], compose_file: Union[PosixPath, str],
+              catalog_folder: Union[PurePosixPath, str], originals: Dict[str, str]=None) -> bool:
+        """write the properties files and a compose override mounting them into the presto coordinator in `folder`.
+        The override labels the coordinator with a digest of the properties, so docker-compose recreates it, and only
+        it, whenever they change. Files whose content didn't change are not written again.
+
+        :param folder: a host folder
+        :param compose_file: the compose file the override is merged into. The override uses the same version.
+        :param catalog_folder: the catalog folder of the presto coordinator, such as
+          '/opt/presto-server-0.181/etc/catalog'. See `Container.image_catalog`.
+        :param originals: content of the properties files of the presto image, by file name such as 'hive.properties'
+        :return: whether any file changed
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        version = COMPOSE_VERSION.search(Path(compose_file).read_text()) if Path(compose_file).exists() else None
+        originals = originals or {}
+
+        files = {f"{catalog}.properties": self.render(catalog, originals.get(f"{catalog}.properties", ""))
+                 for catalog in sorted(self.catalogs)}
+        volumes = [f"{folder / name}:{PurePosixPath(catalog_folder) / name}:ro" for name in files]
+        digest = hashlib.sha256("\0".join(f"{name}\0{content}" for name, content in files.items()).encode())
+        service = {"volumes": volumes, "labels": {CATALOG_LABEL: digest.hexdigest()}}
+        override = {"services": {SERVICES["presto_coordinator"]: service}}
+        if version:
+            override = dict(version=version.group(1), **override)
+        files[OVERRIDE_FILE] = json.dumps(override, indent=2)
+
+        changed = False
+        for name, content in files.items():
+            file = folder / name
+            if not file.exists() or file.read_text() != content:
+                file.write_text(content)
+                changed = True
+        return changed
+
+    def __eq__(self, other):
+        return isinstance(other, CatalogConfig) and self.catalogs == other.catalogs
+
+    def __repr__(self):
+        return f"CatalogConfig({self.catalogs})"
+
+
+def _key(line: str) -> Optional[str]:
+    """return the key of properties file `line`, None for comments and blank lines."""
+    match = PROPERTY_KEY.match(line)
+    return match.group(1) if match else None
@@ -0,0 +1,192 @@
+"""`prestest` command line, installed as a console script. It controls the stack of a docker folder and the daemon
+serving it to fixtures (see `prestest.daemon`):
+
+- up: start the stack, or check that it is up to date
+- down: stop the daemon and the stack
+- status: show whether the daemon and the stack are running
+- warm: start the stack and open pooled connections in the daemon
+- bench: time a query sent through the daemon and through a new connection
+- serve: run the daemon until `prestest down`
+
+.. code-block:: bash
+
+    prestest serve --warm &
+    pytest tests  # fixtures use the warm stack, connections and tables of the daemon
+    prestest down --daemon
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+BENCH_QUERY = "SELECT 1"
+
+BENCH_ROUNDS = 10
+
+
+def parse_args(args: List[str]=None) -> argparse.Namespace:
+    from .fixtures import DOCKER_FOLDER
+
+    parser = argparse.ArgumentParser(prog="prestest", description="control the prestest stack and daemon.")
+    parser.add_argument("--docker-folder", default=DOCKER_FOLDER, type=Path,
+                        help=f"docker hive repository folder. default: {DOCKER_FOLDER}")
+    parser.add_argument("--project", default=None, help="compose project of an independent stack.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log debug messages.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    up = commands.add_parser("up", help="start the stack, or check that it is up to date.")
+    up.add_argument("--reset", action="store_true", help="wipe containers to factory state before starting.")
+    up.add_argument("--restore", default=None, metavar="NAME", help="restore the warehouse from snapshot NAME.")
+    up.add_argument("--allow-table-modification", action="store_true",
+                    help="allow presto to drop tables. Only used with --reset.")
+    up.add_argument("--fixture-folder", default=None, type=Path, help="host folder mounted for external tables.")
+
+    down = commands.add_parser("down", help="stop the daemon and the stack.")
+    down.add_argument("--daemon", action="store_true", help="only stop the daemon and keep the stack running.")
+
+    commands.add_parser("status", help="show whether the daemon and the stack are running.")
+
+    warm = commands.add_parser("warm", help="start the stack and open pooled connections in the daemon.")
+    warm.add_argument("--connections", type=int, default=None, help="connections opened for hive and presto.")
+
+    bench = commands.add_parser("bench", help="time a query sent through the daemon and through a new connection.")
+    bench.add_argument("--query", default=BENCH_QUERY, help=f"presto query to run. default: {BENCH_QUERY}")
+    bench.add_argument("--rounds", type=int, default=BENCH_ROUNDS, help=f"default: {BENCH_ROUNDS}")
+
+    serve = commands.add_parser("serve", help="run the daemon in foreground until `prestest down`.")
+    serve.add_argument("--warm", action="store_true", help="start the stack and open connections before serving.")
+
+    return parser.parse_args(args)
+
+
+def up(args: argparse.Namespace, daemon: "DaemonClient"):
+    fixture_folder = str(args.fixture_folder.resolve()) if args.fixture_folder is not None else None
+    if daemon is not None:
+        started = daemon.call("start", allow_table_modification=args.allow_table_modification, reset=args.reset,
+                              restore=args.restore, fixture_folder=fixture_folder)
+    else:
+        started = cluster_manager(args).start(args.allow_table_modification, args.reset, args.restore, fixture_folder)
+    print("stack started" if started else "stack is up to date")
+
+
+def down(args: argparse.Namespace, daemon: "DaemonClient"):
+    if daemon is not None:
+        daemon.call("stop")
+        print("daemon stopped")
+    if not args.daemon:
+        cluster_manager(args).container.stop()
+        print("stack stopped")
+
+
+def status(args: argparse.Namespace, daemon: "DaemonClient"):
+    if daemon is None:
+        print("daemon: not running")
+    else:
+        print(f"daemon: {json.dumps(daemon.call('status'), indent=2)}")
+    try:
+        healthy = cluster_manager(args).container.is_healthy()
+    except Exception as e:
+        print(f"stack: not running. {e}")
+        return
+    print(f"stack: {'healthy' if healthy else 'not healthy'}")
+
+
+def warm(args: argparse.Namespace, daemon: "DaemonClient"):
+    from .engines import WARM_CONNECTIONS
+
+    connections = args.connections if args.connections is not None else WARM_CONNECTIONS
+    if daemon is None:
+        logging.warning("daemon is not running. connections opened by this command are closed when it exits.")
+        from .db import DBManager
+
+        manager = cluster_manager(args)
+        manager.ensure_started(until_started=True)
+        DBManager.from_container(manager.container).warm_up(connections)
+    else:
+        daemon.call("warm", connections=connections)
+    print(f"stack is ready with {connections} warm connections")
+
+
+def bench(args: argparse.Namespace, daemon: "DaemonClient"):
+    from .db import DBManager
+
+    if daemon is not None:
+        from .daemon import DaemonDBManager
+
+        remote = DaemonDBManager(daemon, cluster_manager(args).container)
+        report("daemon", measure(lambda: remote.read_sql(args.query), args.rounds))
+    else:
+        print("daemon: not running")
+
+    def direct():
+        from .engines import dispose_all
+
+        dispose_all()
+        DBManager.from_container(cluster_manager(args).container).read_sql(args.query)
+
+    report("new connection", measure(direct, args.rounds))
+
+
+def serve(args: argparse.Namespace, daemon: "DaemonClient"):
+    from .daemon import PrestestDaemon
+
+    server = PrestestDaemon(args.docker_folder, project=args.project)
+    if args.warm:
+        server.warm()
+    print(f"serving {server.container.docker_folder} on {server.socket_file}")
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+def measure(func: Callable, rounds: int) -> List[float]:
+    """return seconds of `rounds` calls of `func`."""
+    seconds = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def report(name: str, seconds: List[float]):
+    print(f"{name}: median {statistics.median(seconds) * 1000:.1f}ms, min {min(seconds) * 1000:.1f}ms, "
+          f"max {max(seconds) * 1000:.1f}ms over {len(seconds)} rounds")
+
+
+def cluster_manager(args: argparse.Namespace) -> "ClusterManager":
+    from .cluster import get_cluster_manager
+    return get_cluster_manager(args.docker_folder, args.project)
+
+
+COMMANDS = {"up": up, "down": down, "status": status, "warm": warm, "bench": bench, "serve": serve}
+
+
+def main(args: List[str]=None) -> int:
+    """entry point of the `prestest` console script.
+
+    :param args: command line arguments. `sys.argv` is used if None.
+    :return: exit code
+    """
+    args = parse_args(args)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    from .daemon import DaemonClient
+
+    daemon = DaemonClient.find(args.docker_folder, args.project)
+    if args.command == "serve" and daemon is not None:
+        print(f"a daemon is already serving {args.docker_folder} on {daemon.socket_file}", file=sys.stderr)
+        return 1
+    try:
+        COMMANDS[args.command](args, daemon)
+    except (OSError, RuntimeError) as e:
+        print(f"prestest {args.command} failed. {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
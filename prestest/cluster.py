@@ -0,0 +1,224 @@
+"""keep the hive/presto stack running across tests and test sessions
+"""
+import hashlib
+import json
+import logging
+import re
+import tempfile
+from pathlib import Path, PosixPath
+from typing import Dict, List, Optional, Union
+
+from docker.errors import APIError, NotFound
+
+from .compose import COMPOSE_FILES
+from .container import Container
+from .lock import FileLock
+
+STATE_FOLDER = Path(tempfile.gettempdir()) / "prestest"
+
+IGNORED_FOLDERS = {".git", ".prestest", "__pycache__"}
+
+IMAGE_PATTERN = re.compile(r"^\s*image:\s*['\"]?([^'\"\s]+)", re.MULTILINE)
+
+
+def cluster_key(docker_folder: Union[PosixPath, str], project: str=None) -> str:
+    """return the key of the stack of `docker_folder` and compose `project`, naming its files in STATE_FOLDER."""
+    identity = str(docker_folder)
+    if project is not None:
+        identity += f"\0{project}"
+    return hashlib.sha1(identity.encode()).hexdigest()
+
+
+class ClusterManager:
+    """start the stack in a docker folder at most once and reuse it afterwards. The manager fingerprints the docker
+    folder content and the images referenced by the compose file. If the stack is healthy and the fingerprint matches
+    the one recorded when it was last started, the stack is attached to without calling `docker-compose`. The record is
+    kept in `state_folder` so later test sessions can attach as well. Pass `state_folder=None` to only reuse the stack
+    within the current process. Starting the stack is guarded by a file lock, so when several pytest-xdist workers
+    share one stack, exactly one of them starts it and the others wait and attach.
+    """
+    def __init__(self, container: Container, state_folder: Optional[Union[PosixPath, str]]=STATE_FOLDER):
+        self.container = container
+        self.state_file = None
+        key = cluster_key(container.docker_folder, container.project)
+        if state_folder is not None:
+            self.state_file = Path(state_folder) / f"{key}.json"
+        self.lock = FileLock(Path(state_folder or STATE_FOLDER) / f"{key}.lock")
+
+        self._fingerprint = None
+        self._attached = None
+
+    def fingerprint(self, refresh=False) -> str:
+        """hash of the files in docker folder and the ids of the images used by the stack. The value is computed once
+        per manager unless `refresh` is True.
+
+        :param refresh: recompute the fingerprint even if it was computed before.
+        :return: hex digest of the fingerprint.
+        """
+        if self._fingerprint is None or refresh:
+            digest = hashlib.sha256()
+            for file in self._folder_files():
+                digest.update(str(file.relative_to(self.container.docker_folder)).encode())
+                digest.update(file.read_bytes())
+
+            for image_id in self.image_ids():
+                digest.update(image_id.encode())
+
+            self._fingerprint = digest.hexdigest()
+
+        return self._fingerprint
+
+    def image_ids(self) -> List[str]:
+        """return ids of images referenced by the compose file. Images not pulled yet are represented by their name.
+
+        :return: sorted list of image ids
+        """
+        result = []
+        for image in self._compose_images():
+            try:
+                result.append(self.container.client.images.get(image).id)
+            except NotFound:
+                result.append(image)
+
+        return sorted(result)
+
+    def ensure_started(self, until_started=True) -> bool:
+        """make sure the stack is up to date and running. Nothing is started if the stack is healthy and matches the
+        recorded fingerprint.
+
+        :param until_started: wait until all containers are healthy when the stack needs to be started.
+        :return: whether the stack was (re)started.
+        """
+        with self.lock:
+            return self._ensure_started(until_started)
+
+    def _ensure_started(self, until_started: bool) -> bool:
+        fingerprint = self.fingerprint()
+        current = fingerprint in (self._attached, self._recorded_fingerprint()) and self._runs_current_images()
+        if current and self._is_healthy():
+            logging.debug(f"attaching to running stack in {self.container.docker_folder}")
+            self._attached = fingerprint
+            return False
+
+        logging.info(f"starting stack in {self.container.docker_folder}")
+        self.container.start(until_started=until_started, recreate=not current)
+        self._record(fingerprint)
+        return True
+
+    def start(self, allow_table_modification: bool=False, reset: bool=False, restore: str=None,
+              fixture_folder: Union[PosixPath, str]=None) -> bool:
+        """start the stack the way the `start_container` fixture is configured.
+
+        :param allow_table_modification: enable tables to be dropped from presto client. Only used with `reset`.
+        :param reset: wipe containers to factory state before starting.
+        :param restore: name of a snapshot to restore the warehouse from. This takes precedence over `reset`.
+        :param fixture_folder: a host folder mounted into the stack for external tables, see `Container.mount_fixtures`.
+        :return: whether the stack was (re)started.
+        """
+        if fixture_folder is not None:
+            self.container.mount_fixtures(fixture_folder)
+        if restore is not None:
+            self.restore(restore)
+        elif reset:
+            self.reset(allow_table_modification=allow_table_modification)
+        else:
+            return self.ensure_started(until_started=True)
+        return True
+
+    def reset(self, allow_table_modification=False):
+        """reset the stack to factory state, start it and record the fingerprint of the new stack.
+
+        :param allow_table_modification: reset and allow presto connector to modify hive tables
+        :return: None
+        """
+        with self.lock:
+            self.invalidate()
+            self.container.reset(allow_table_modification=allow_table_modification, autostart=True,
+                                 until_started=True)
+            self._record(self.fingerprint())
+
+    def restore(self, name: str):
+        """restore the stack from snapshot `name`, start it and record the fingerprint of the stack.
+
+        :param name: name of a snapshot taken by `Container.snapshot` or imported by `Container.import_snapshot`
+        :return: None
+        """
+        with self.lock:
+            self.invalidate()
+            self.container.restore(name, until_started=True)
+            self._record(self.fingerprint())
+
+    def invalidate(self):
+        """forget the running stack so that the next `ensure_started` call starts it.
+
+        :return: None
+        """
+        self._attached = None
+        if self.state_file is not None and self.state_file.exists():
+            self.state_file.unlink()
+
+    def _is_healthy(self) -> bool:
+        try:
+            return self.container.is_healthy()
+        except APIError:
+            return False
+
+    def _runs_current_images(self) -> bool:
+        expected = set(self.image_ids())
+        for container in self.container.state.containers().values():
+            if container.image_id not in expected:
+                logging.debug(f"{container.name} is not running the current image")
+                return False
+
+        return True
+
+    def _folder_files(self) -> List[Path]:
+        files = []
+        for file in self.container.docker_folder.rglob("*"):
+            relative = file.relative_to(self.container.docker_folder)
+            if file.is_file() and not IGNORED_FOLDERS.intersection(relative.parts):
+                files.append(file)
+
+        return sorted(files)
+
+    def _compose_images(self) -> List[str]:
+        images = set()
+        for name in COMPOSE_FILES:
+            compose_file = self.container.docker_folder / name
+            if compose_file.exists():
+                images.update(IMAGE_PATTERN.findall(compose_file.read_text()))
+
+        return sorted(images)
+
+    def _recorded_fingerprint(self) -> Optional[str]:
+        if self.state_file is None or not self.state_file.exists():
+            return None
+        try:
+            return json.loads(self.state_file.read_text()).get("fingerprint")
+        except ValueError:
+            return None
+
+    def _record(self, fingerprint: str):
+        self._attached = fingerprint
+        if self.state_file is not None:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            state = {"docker_folder": str(self.container.docker_folder), "fingerprint": fingerprint}
+            self.state_file.write_text(json.dumps(state))
+
+
+_MANAGERS = {}  # type: Dict[tuple, ClusterManager]
+
+
+def get_cluster_manager(docker_folder: Union[PosixPath, str], project: str=None, port_offset: int=0) -> ClusterManager:
+    """return the process wide ClusterManager of `docker_folder`, creating it at first call.
+
+    :param docker_folder: docker hive repository folder location.
+    :param project: compose project of an independent stack. Use the default stack if None.
+    :param port_offset: number added to host ports of the stack of `project`.
+    :return: a ClusterManager
+    """
+    key = (Path(docker_folder).resolve(), project, port_offset)
+    if key not in _MANAGERS:
+        _MANAGERS[key] = ClusterManager(Container(key[0], project=project, port_offset=port_offset))
+
+    return _MANAGERS[key]
@@ -0,0 +1,129 @@
+"""infer hive schema from a dataframe and write it as compressed parquet or orc files
+"""
+from pathlib import Path, PosixPath
+from typing import Dict, List, Tuple, Union
+import datetime
+
+import pandas as pd
+
+FORMATS = {"parquet": "PARQUET", "orc": "ORC"}
+
+DTYPE_KINDS = {
+    "int8": "TINYINT",
+    "int16": "SMALLINT",
+    "int32": "INT",
+    "int64": "BIGINT",
+    "uint8": "SMALLINT",
+    "uint16": "INT",
+    "uint32": "BIGINT",
+    "float32": "FLOAT",
+    "float64": "DOUBLE",
+    "bool": "BOOLEAN",
+    "boolean": "BOOLEAN",
+}
+
+
+def hive_type(series: pd.Series) -> str:
+    """infer hive column type of `series` from its dtype. Object columns holding dates become DATE, other object,
+    string and category columns become STRING.
+
+    :param series: a column of a dataframe
+    :return: hive type name
+    """
+    dtype = series.dtype
+    name = str(dtype).lower()
+    if name in DTYPE_KINDS:
+        return DTYPE_KINDS[name]
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+    if pd.api.types.is_object_dtype(dtype):
+        values = series.dropna()
+        if len(values) and all(isinstance(v, datetime.date) and not isinstance(v, datetime.datetime)
+                               for v in values):
+            return "DATE"
+    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype) or \
+            isinstance(dtype, pd.CategoricalDtype):
+        return "STRING"
+    raise ValueError(f"cannot infer hive type of column {series.name} with dtype {dtype}")
+
+
+def create_table_query(table: str, df: pd.DataFrame, file_format: str="parquet",
+                       partition_by: List[str]=None) -> str:
+    """build hive DDL creating `table` with columns of `df` stored in `file_format`.
+
+    :param table: name of the table. for example, 'sandbox.my_table'
+    :param df: dataframe whose columns define the table
+    :param file_format: 'parquet' or 'orc'
+    :param partition_by: columns of `df` used as partition columns
+    :return: a CREATE TABLE query
+    """
+    partition_by = partition_by or []
+    if file_format not in FORMATS:
+        raise ValueError(f"file_format must be one of {sorted(FORMATS)}. got {file_format}")
+    missing = set(partition_by) - set(df.columns)
+    if missing:
+        raise ValueError(f"partition columns {sorted(missing)} are not in dataframe")
+
+    columns = ",\n    ".join(f"`{c}` {hive_type(df[c])}" for c in df.columns if c not in partition_by)
+    query = f"CREATE TABLE {table} (\n    {columns}\n)"
+    if partition_by:
+        partitions = ", ".join(f"`{c}` {hive_type(df[c])}" for c in partition_by)
+        query += f"\nPARTITIONED BY ({partitions})"
+    return query + f"\nSTORED AS {FORMATS[file_format]}"
+
+
+def write_partitions(df: pd.DataFrame, folder: Union[PosixPath, str], file_format: str="parquet",
+                     partition_by: List[str]=None,
+                     compression: str="snappy") -> List[Tuple[Dict[str, str], Path]]:
+    """write `df` into compressed columnar files in `folder`, one file per partition. Requires pyarrow.
+
+    :param df: dataframe to write
+    :param folder: local folder where files are written
+    :param file_format: 'parquet' or 'orc'
+    :param partition_by: columns of `df` used as partition columns. They are not written into the files.
+    :param compression: compression codec, such as 'snappy', 'zlib' or 'gzip'
+    :return: a list of tuples of partition spec (column to value) and written file
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("pyarrow is required to write parquet or orc files. pip install pyarrow")
+
+    partition_by = partition_by or []
+    groups = df.groupby(partition_by, sort=True, dropna=False) if partition_by else [((), df)]
+    result = []
+    for i, (values, group) in enumerate(groups):
+        values = values if isinstance(values, tuple) else (values,)
+        spec = {column: _partition_value(value) for column, value in zip(partition_by, values)}
+        file = Path(folder) / f"part-{i:05d}.{file_format}"
+        table = pa.Table.from_pandas(group.drop(columns=partition_by), preserve_index=False)
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+            # hive 2 only reads int96 timestamps from parquet
+            pq.write_table(table, str(file), compression=compression, use_deprecated_int96_timestamps=True)
+        else:
+            import pyarrow.orc as orc
+            orc.write_table(table, str(file), compression=compression)
+        result.append((spec, file))
+
+    return result
+
+
+def partition_clause(spec: Dict[str, str]) -> str:
+    """return PARTITION clause of LOAD DATA statement, or an empty string for unpartitioned tables"""
+    if not spec:
+        return ""
+    values = ", ".join(f"`{column}`={string_literal(value)}" for column, value in spec.items())
+    return f" PARTITION ({values})"
+
+
+def string_literal(value) -> str:
+    """return `value` as a quoted hive string literal, escaping backslashes and quotes"""
+    escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+def _partition_value(value) -> str:
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    return str(value)
@@ -0,0 +1,114 @@
+"""name, address and start docker-compose projects of the hive/presto stack. Each project has its own containers and
+published ports, so several stacks can run on one host.
+"""
+import re
+from pathlib import Path, PosixPath
+from typing import Dict, List, Optional, Union
+
+DEFAULT_PROJECT = "docker-hive"
+
+PROJECT_LABEL = "com.docker.compose.project"
+
+SERVICE_LABEL = "com.docker.compose.service"
+
+# component -> docker-compose service
+SERVICES = {
+    "hive-metastore": "hive-metastore",
+    "datanode": "datanode",
+    "namenode": "namenode",
+    "hive-server": "hive-server",
+    "presto_coordinator": "presto-coordinator",
+    "hive-metastore-postgresql": "hive-metastore-postgresql",
+}
+
+PRESTO_PORT = 8080
+
+HIVE_PORT = 10000
+
+COMPOSE_FILES = ("docker-compose.yml", "docker-compose.yaml")
+
+# a published port such as `- "8080:8080"` or `- 10000:10000`
+PUBLISHED_PORT = re.compile(r"^(\s*-\s*[\"']?(?:[\d.]+:)?)(\d+)(:\d+(?:/\w+)?[\"']?\s*)$", re.MULTILINE)
+
+# `image:` of a service block, such as `  presto-coordinator:` followed by `    image: shawnzhu/prestodb:0.181`
+SERVICE_IMAGE = r"^(?P<indent>[ \t]+){service}:[ \t]*\n(?:(?P=indent)[ \t]+.*\n|[ \t]*\n)*?" \
+                r"(?P=indent)[ \t]+image:[ \t]*['\"]?(?P<image>[^'\"\s]+)"
+
+
+def container_names(project: str) -> Dict[str, str]:
+    """return names docker-compose gives to containers of `project`.
+
+    :param project: name of the compose project
+    :return: a dictionary from component to container name
+    """
+    return {component: f"{project}_{service}_1" for component, service in SERVICES.items()}
+
+
+def render_compose(text: str, port_offset: int) -> str:
+    """shift every published host port in compose file `text` by `port_offset`. Container ports are unchanged.
+
+    :param text: content of a compose file
+    :param port_offset: number added to host ports
+    :return: content of the new compose file
+    """
+    return PUBLISHED_PORT.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + port_offset}{m.group(3)}", text)
+
+
+def service_image(text: str, service: str) -> Optional[str]:
+    """return the image of `service` in compose file `text`, None if it is not set.
+
+    :param text: content of a compose file
+    :param service: a docker-compose service, such as 'presto-coordinator'
+    :return: name of the image
+    """
+    match = re.search(SERVICE_IMAGE.format(service=re.escape(service)), text, re.MULTILINE)
+    return match.group("image") if match else None
+
+class ComposeProject:
+    """a docker-compose project of the stack in `docker_folder`. The default project with no port offset uses the
+    compose file of the folder as is, which is the stack prestest always used. Other projects use a copy of the
+    compose file with host ports shifted by `port_offset`, written to `.prestest/compose` in the docker folder.
+    """
+    def __init__(self, docker_folder: Union[PosixPath, str], project: str=DEFAULT_PROJECT, port_offset: int=0):
+        self.docker_folder = Path(docker_folder)
+        self.project = project
+        self.port_offset = port_offset
+        self.names = container_names(project)
+        # extra compose files merged on top of the compose file
+        self.overrides = []  # type: List[Path]
+
+    @property
+    def is_default(self) -> bool:
+        return self.project == DEFAULT_PROJECT and self.port_offset == 0
+
+    @property
+    def presto_url(self) -> str:
+        return f"presto://localhost:{PRESTO_PORT + self.port_offset}"
+
+    @property
+    def presto_http_url(self) -> str:
+        return f"http://localhost:{PRESTO_PORT + self.port_offset}"
+
+    @property
+    def hive_url(self) -> str:
+        return f"hive://localhost:{HIVE_PORT + self.port_offset}"
+
+    def compose_file(self) -> Path:
+        """return the compose file of the project, writing the port shifted copy if needed."""
+        source = next((self.docker_folder / name for name in COMPOSE_FILES if (self.docker_folder / name).exists()),
+                      self.docker_folder / COMPOSE_FILES[0])
+        if self.port_offset == 0:
+            return source
+        target = self.docker_folder / ".prestest" / "compose" / f"{self.project}.yml"
+        text = render_compose(source.read_text(), self.port_offset)
+        if not target.exists() or target.read_text() != text:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(text)
+        return target
+
+    def command(self, arguments: str) -> str:
+        """return the docker-compose command running `arguments`, such as 'up -d', for this project."""
+        if self.is_default and not self.overrides:
+            return f"docker-compose {arguments}"
+        files = " ".join(f"-f '{file}'" for file in [self.compose_file()] + self.overrides)
+        return f"docker-compose -p {self.project} --project-directory '{self.docker_folder}' {files} {arguments}"
@@ -1,76 +1,183 @@
 """implement functions to build, start, stop and clean up containers
 """
+import codecs
+import io
+import queue
 import subprocess
-from pathlib import Path, PosixPath
-from typing import Union
+import threading
+from pathlib import Path, PosixPath, PurePosixPath
+from typing import Dict, Iterator, List, Tuple, Union
 import logging
+import tarfile
+import tempfile
 import time
-import uuid
-
-import pandas as pd
-from sqlalchemy import create_engine
-import docker
-from docker.errors import NotFound
-
-CONTAINER_NAMES = {
-    "hive-metastore": "docker-hive_hive-metastore_1",
-    "datanode": "docker-hive_datanode_1",
-    "namenode": "docker-hive_namenode_1",
-    "hive-server": "docker-hive_hive-server_1",
-    "presto_coordinator": "docker-hive_presto-coordinator_1",
-    "hive-metastore-postgresql": "docker-hive_hive-metastore-postgresql_1"
-}
+import warnings
+
+from .catalog import OVERRIDE_FILE, CatalogConfig
+from .compose import DEFAULT_PROJECT, SERVICES, ComposeProject, container_names, service_image
+from .mounts import OVERRIDE_FILE as MOUNT_OVERRIDE_FILE, FixtureMount
+from .readiness import Readiness, get_readiness
+from .snapshot import SNAPSHOT_PATHS, SnapshotStore
+from .staging import StagedFile, StagedFiles, StagingArea, get_staging_area
+from .state import ClusterState, WaitPolicy, get_cluster_state
+from .timing import span, timed
+
+CONTAINER_NAMES = container_names(DEFAULT_PROJECT)
+
+START_ORDER = ["hive-metastore-postgresql", "namenode", "datanode", "hive-metastore", "hive-server",
+               "presto_coordinator"]
 
 LOCAL_FILE_STORE_NODE = "hive-server"
 
 PRESTO_URL = "presto://localhost:8080"
 
+PRESTO_HTTP_URL = "http://localhost:8080"
+
+HIVE_URL = "hive://localhost:10000"
+
+# presto is installed in $PRESTO_HOME, the working directory or the parent folder of bin/launcher
+PRESTO_LAUNCHER = "bin/launcher"
+
+CATALOG_FOLDER = "etc/catalog"
+
 
 class Container:
-    """contains method to control and examine hive/presto container used for test
+    """contains method to control and examine hive/presto container used for test. By default it controls the stack
+    docker-compose starts from `docker_folder`. With `project`, it controls an independent copy of the stack in compose
+    project `project`, whose containers are discovered by their compose labels and whose host ports are shifted by
+    `port_offset`. See `prestest.compose.ComposeProject`. `catalog` sets presto catalog properties mounted into the
+    presto coordinator, see `configure_catalog`. `fixture_folder` is a host folder mounted into the stack for external
+    tables, see `mount_fixtures`.
     """
-    def __init__(self, docker_folder: Union[PosixPath, str]):
+    def __init__(self, docker_folder: Union[PosixPath, str], wait_policy: WaitPolicy=None,
+                 snapshot_folder: Union[PosixPath, str]=None, project: str=None, port_offset: int=0,
+                 catalog: CatalogConfig=None, fixture_folder: Union[PosixPath, str]=None):
         self.docker_folder = Path(docker_folder).resolve()
-        self.client = docker.from_env()
-        self.api_client = docker.APIClient()
-
-    def start(self, until_started=True):
-        """start docker containers.
-
+        self.project = project
+        self.compose = ComposeProject(self.docker_folder, project or DEFAULT_PROJECT, port_offset)
+        self.catalog = catalog or CatalogConfig()
+        self.fixture_mount = FixtureMount(fixture_folder) if fixture_folder is not None else None
+        self._image_catalog = None
+        self._client = None
+        self._api_client = None
+        self._readiness = None
+        self.wait_policy = wait_policy or WaitPolicy()
+        self.snapshots = SnapshotStore(snapshot_folder or self.docker_folder / ".prestest" / "snapshots")
+
+    @property
+    def client(self) -> "docker.DockerClient":
+        """high level docker client, created at first use so that creating a Container doesn't contact the daemon."""
+        if self._client is None:
+            import docker
+            self._client = docker.from_env()
+        return self._client
+
+    @client.setter
+    def client(self, client: "docker.DockerClient"):
+        self._client = client
+
+    @property
+    def api_client(self) -> "docker.APIClient":
+        """low level docker api client, created at first use."""
+        if self._api_client is None:
+            import docker
+            self._api_client = docker.APIClient()
+        return self._api_client
+
+    @api_client.setter
+    def api_client(self, api_client: "docker.APIClient"):
+        self._api_client = api_client
+
+    @property
+    def readiness(self) -> Readiness:
+        """the Readiness of presto and HiveServer2 of the stack, shared by all Container objects using the same ports."""
+        if self._readiness is None:
+            self._readiness = get_readiness(self.compose.presto_http_url, self.compose.hive_url)
+        return self._readiness
+
+    @readiness.setter
+    def readiness(self, readiness: Readiness):
+        self._readiness = readiness
+
+    @property
+    def state(self) -> ClusterState:
+        """the ClusterState shared by all Container objects using the same docker daemon and compose project."""
+        return get_cluster_state(self.api_client, self.compose.names, project=self.project)
+
+    def container_name(self, component: str) -> str:
+        """return the name of the container running `component`, such as 'hive-server'. Containers of a named project
+        are looked up by their compose labels.
+
+        :param component: a key of CONTAINER_NAMES
+        :return: name of the container
+        """
+        if self.project is None:
+            return self.compose.names[component]
+        return self.state.containers()[component].name
+
+    @timed("container.start")
+    def start(self, until_started=True, wait_policy: WaitPolicy=None, recreate=False):
+        """start docker containers. Existing containers are started through docker api. `docker-compose up` is only
+        used to create missing containers, to mount a changed catalog configuration or fixture folder, or when
+        `recreate` is True. While waiting, docker health is followed by events, then presto and HiveServer2 are probed
+        until they answer queries. See `prestest.readiness`.
+
+        :param until_started: wait until all containers are healthy and presto and hive are ready.
+        :param wait_policy: timeout and backoff while waiting. Use `self.wait_policy` if not provided.
+        :param recreate: let docker-compose create or recreate containers whose configuration changed.
         :return: None
         """
-        command = "docker-compose up -d"
-        process = subprocess.Popen(command, cwd=self.docker_folder, shell=True, stdout=subprocess.PIPE)
-        process.wait()
         if until_started:
-            maximum_wait = 40
-            sleep = 3
-            while maximum_wait >= 0 and not self.is_healthy():
-                time.sleep(sleep)
-                maximum_wait -= sleep
-
-            if maximum_wait < 0 and not self.is_healthy():
+            self.state.watch()
+
+        containers = self.state.containers()
+        overrides_changed = self._apply_overrides()
+        if recreate or overrides_changed or any(c.status == "missing" for c in containers.values()):
+            self.readiness.invalidate()
+            command = self.compose.command("up -d")
+            with span("container.compose_up"):
+                process = subprocess.Popen(command, cwd=self.docker_folder, shell=True, stdout=subprocess.PIPE)
+                process.wait()
+        else:
+            for component in START_ORDER:
+                if containers[component].status != "running":
+                    self.readiness.invalidate()
+                    self.api_client.start(containers[component].id)
+
+        self.state.invalidate()
+        if until_started:
+            with span("container.health_wait"):
+                healthy = self.state.wait_until_healthy(wait_policy or self.wait_policy)
+            if not healthy:
                 raise RuntimeError("docker is not started in time")
+            if not self.readiness.wait():
+                raise RuntimeError(f"presto or hive is not ready in time. {self.readiness.errors}")
 
-
+    @timed("container.stop")
     def stop(self):
         """stop containers
 
         :return:
         """
-        command = f"docker-compose stop"
-        process = subprocess.Popen(command, cwd=self.docker_folder, shell=True, stdout=subprocess.PIPE)
-        process.wait()
+        self.readiness.invalidate()
+        for component in reversed(START_ORDER):
+            container = self.state.containers()[component]
+            if container.status == "running":
+                self.api_client.stop(container.id)
+        self.state.invalidate()
 
     def is_started(self) -> bool:
-        """check if container has properly started.
+        """check if container has properly started. raise NotFound if any container does not exist.
 
         :return:
         """
-        for component, name in CONTAINER_NAMES.items():
-            container = self.client.containers.get(name)
+        from docker.errors import NotFound
+
+        for component, container in self.state.containers().items():
+            if container.status == "missing":
+                raise NotFound(f"No such container: {container.name}")
             if container.status != "running":
-                logging.debug(f"[{component}] {name} is not running")
+                logging.debug(f"[{component}] {container.name} is not running")
                 return False
 
         return True
@@ -85,128 +192,314 @@ class Container:
         if not self.is_started():
             return False
 
-        for component, name in CONTAINER_NAMES.items():
-            # Get health info. if container not up. return empty dict
-
-            state = self.api_client.inspect_container(name)["State"]
-            if "Health" in state:
-                status = state["Health"]["Status"]
-                if status != "healthy":
-                    logging.debug(f"[{component} {name} is not healthy. got {status}")
-                    return False
+        for component, container in self.state.containers().items():
+            if not container.is_healthy:
+                logging.debug(f"[{component}] {container.name} is not healthy. got {container.health}")
+                return False
 
         return True
 
+    @timed("container.presto_ready")
     def is_presto_started(self) -> bool:
-        """examine if presto server has properly started. This will try 5 times before determining that the server
-        cannot be connected. It will sleep 5 seconds between retries.
+        """examine if presto server has properly started and has active nodes. The server is probed with backoff until
+        the timeout of `prestest.readiness.READY_POLICY`. Once presto was found ready, it returns immediately until the
+        stack is stopped or started again.
 
         :return: whether presto server is started.
         """
-        presto_client = create_engine(PRESTO_URL, connect_args={"protocol": "http"})
-
-        attempts = 5
-        sleep = 5
-        while attempts > 0:
-            try:
-                with presto_client.connect() as con:
-                    pd.read_sql("SELECT * FROM system.runtime.nodes LIMIT 1", con=con)
-                    return True
-            except:
-                attempts -= 1
-                time.sleep(sleep)
-
-        return False
+        return self.readiness.wait(["presto"])
 
+    @timed("container.reset")
     def reset(self, allow_table_modification=False, autostart=False, until_started=False):
         """remove created container. This will clear all data and metastore and restore the container to factory state.
 
-        :param allow_table_modification: reset and allow presto connector to modify hive tables
+        :param allow_table_modification: reset and allow presto connector to modify hive tables. The setting is part of
+          the catalog configuration the containers are created with, so it costs no extra restart.
         :param autostart: restart container after reset
         :param until_started: wait until completed restarted. if True, container will be force autostarted.
         :return: None
         """
+        from docker.errors import NotFound
+
         self.stop()
         # start reset container
-        for name, container in CONTAINER_NAMES.items():
+        for component, container in self.state.containers().items():
+            if container.id is None:
+                continue
             try:
-                container = self.client.containers.get(container)
-                logging.debug(f"removing container {container} ({container.id})")
+                logging.debug(f"removing container {container.name} ({container.id})")
                 self.api_client.remove_container(container.id)
             except NotFound:
                 continue
+        self.state.invalidate()
 
         if until_started:
             # force autostart if requested to complete start
             autostart = True
 
-        if allow_table_modification:
-            self.start()
-            self.enable_table_modification()
-            # table access require docker restart
-            self.stop()
-
+        self.catalog = self.catalog.with_table_modification(allow_table_modification)
         if autostart:
             self.start(until_started)
 
+    @timed("container.snapshot")
+    def snapshot(self, name: str):
+        """capture HDFS data and hive metastore database into snapshot `name`. Containers are stopped while the data
+        is captured so that the snapshot is consistent, and started again afterwards if they were running.
+
+        :param name: name of the snapshot. An existing snapshot with the same name is replaced.
+        :return: None
+        """
+        was_running = self.is_started()
+        self.stop()
+        containers = self.state.containers()
+        archives, images = {}, {}
+        for component, paths in SNAPSHOT_PATHS.items():
+            archives[component] = {path: self.api_client.get_archive(containers[component].id, path)[0]
+                                   for path in paths}
+            images[component] = containers[component].image_id
+        self.snapshots.write(name, archives, images)
+
+        if was_running:
+            self.start(until_started=True)
+
+    @timed("container.restore")
+    def restore(self, name: str, until_started=True):
+        """restore HDFS data and hive metastore database from snapshot `name` and start the containers. This is much
+        faster than `reset` followed by recreating tables.
+
+        :param name: name of the snapshot.
+        :param until_started: wait until all containers are healthy.
+        :return: None
+        """
+        manifest = self.snapshots.manifest(name)
+        if any(c.status == "missing" for c in self.state.containers().values()):
+            self.start(until_started=False)
+        self.stop()
+
+        containers = self.state.containers()
+        for entry in manifest["archives"]:
+            container = containers[entry["component"]]
+            if manifest["images"].get(entry["component"]) != container.image_id:
+                logging.warning(f"snapshot {name} was taken from a different image of {entry['component']}")
+            self._clear_folder(container.id, entry["path"])
+            with open(self.snapshots.path(name) / entry["file"], "rb") as f:
+                self.api_client.put_archive(container.id, str(Path(entry["path"]).parent), f)
+
+        self.start(until_started=until_started)
+
+    def export_snapshot(self, name: str, target_folder: Union[PosixPath, str]) -> Path:
+        """pack snapshot `name` into a versioned artifact, for example to be shared with CI runners.
+
+        :param name: name of the snapshot.
+        :param target_folder: folder where the artifact is written.
+        :return: path to the artifact.
+        """
+        return self.snapshots.export(name, target_folder)
+
+    def import_snapshot(self, artifact: Union[PosixPath, str], name: str=None) -> str:
+        """import an artifact created by `export_snapshot` so that it can be restored.
+
+        :param artifact: path to the artifact.
+        :param name: name of the imported snapshot. By default it keeps the name it was exported with.
+        :return: name of the imported snapshot.
+        """
+        return self.snapshots.load(artifact, name)
+
+    def _clear_folder(self, container_id: str, folder: str):
+        """remove the content of `folder` in a stopped container using a throwaway container sharing its volumes."""
+        image = self.api_client.inspect_container(container_id)["Image"]
+        self.client.containers.run(image, entrypoint=["find"], command=[folder, "-mindepth", "1", "-delete"],
+                                   volumes_from=[container_id], user="root", remove=True)
+
+    @timed("container.copy")
     def copy_from_local(self, from_local: Union[PosixPath, str], to_container: Union[PosixPath, str],
-                        container_name: str=CONTAINER_NAMES[LOCAL_FILE_STORE_NODE]):
-        """copy folder or file from host to container
+                        container_name: str=None):
+        """copy folder or file from host to container. Like `docker cp`, if `to_container` is an existing folder, the
+        file or folder is copied into it. Otherwise it is copied as `to_container`.
 
         :param from_local: target folder or file to be copied.
         :param to_container: container path where the folder or file will be copied to.
-        :param container_name: name of the container containing the target file `to_container`
+        :param container_name: name of the container containing the target file `to_container`. Use the hive-server
+          container if not provided.
         :return: None
         """
-        command = f"docker cp {from_local} {container_name}:{to_container}"
-        self.execute_command(command)
-
-    def download_from_container(self, from_container, to_local,
-                                container_name: str=CONTAINER_NAMES[LOCAL_FILE_STORE_NODE]):
-        """download target folder or file to host
+        container_name = container_name or self.container_name(LOCAL_FILE_STORE_NODE)
+        to_container = PurePosixPath(to_container)
+        if self._is_folder(to_container, container_name):
+            self.put_files({Path(from_local).name: from_local}, to_container, container_name)
+        else:
+            self.put_files({to_container.name: from_local}, to_container.parent, container_name)
+
+    @timed("container.download")
+    def download_from_container(self, from_container, to_local, container_name: str=None):
+        """download target folder or file to host. The archive is extracted while it is streamed so large files are not
+        held in memory. Like `docker cp`, if `to_local` is an existing folder, the file or folder is downloaded into it.
 
         :param from_container: target folder or file to be downloaded to host.
         :param to_local: location on host.
-        :param container_name: name of the container containing the target file `from_container`
+        :param container_name: name of the container containing the target file `from_container`. Use the
+          hive-server container if not provided.
         :return: None
         """
-        command = f"docker cp {container_name}:{from_container} {to_local}"
-        self.execute_command(command)
-
-    def delete(self, target, container_name: str=CONTAINER_NAMES[LOCAL_FILE_STORE_NODE]):
+        from docker.errors import NotFound
+
+        container_name = container_name or self.container_name(LOCAL_FILE_STORE_NODE)
+        to_local = Path(to_local)
+        try:
+            chunks, stat = self.api_client.get_archive(container_name, str(from_container))
+        except NotFound as e:
+            raise RuntimeError(f"{from_container} not found in {container_name}. {e}")
+
+        target, root = (to_local, stat["name"]) if to_local.is_dir() else (to_local.parent, to_local.name)
+        with tarfile.open(fileobj=ChunkReader(chunks), mode="r|") as tar:
+            for member in tar:
+                parts = PurePosixPath(member.name).parts
+                if member.name.startswith("/") or ".." in parts:
+                    raise RuntimeError(f"unexpected member {member.name} in archive of {from_container}")
+                member.name = str(PurePosixPath(root, *parts[1:]))
+                tar.extract(member, str(target))
+
+    def delete(self, target, container_name: str=None):
         """call rm -rf command on `target` inside datanode container
 
         :param target: target folder or file
         :param container_name: name of the container containing the target file
         :return: None
         """
-        command = f"docker exec {container_name} rm -rf {target}"
-        self.execute_command(command)
-
-    def execute_command(self, command, exception=RuntimeError):
-        """execute a command as subprocess, raise specific type of exception if any error occurs.
-
-        :param command: a string of terminal command
+        self.execute_command(["rm", "-rf", str(target)], container_name)
+
+    @timed("container.exec")
+    def execute_command(self, command: Union[str, List[str]], container_name: str=None, user: str='',
+                        exception=RuntimeError, timeout: float=None) -> str:
+        """execute a command inside container through docker exec api, raise specific type of exception if any error
+        occurs. Output is read line by line while the command runs.
+
+        Commands used to run in a shell on the host, such as 'docker exec ...' strings. They now run inside
+        `container_name` without a shell: a string is split into arguments, so use ['bash', '-c', '...'] for pipes
+        and redirections, and run host commands with `subprocess` instead.
+
+        :param command: a command string or a list of command arguments.
+        :param container_name: name of the container where the command runs. Use the hive-server container if not
+          provided.
+        :param user: user used to execute the command. e.g. 'root', '1000'. Use container default if empty.
         :param exception: type of exception raised when any error happends.
-        :return: None
+        :param timeout: seconds to wait for the command to finish. wait without limit if None.
+        :return: stdout of the command
         """
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        process.wait()
-        res = process.communicate()
-        stdout, stderr = res[0].decode('ascii'), res[1].decode('ascii')
+        stdout, stderr = [], []
+        for stream, line in self.stream_command(command, container_name, user, exception, timeout):
+            (stdout if stream == "stdout" else stderr).append(line)
+
+        stdout, stderr = "".join(stdout), "".join(stderr)
         if stderr != '' or 'permission denied' in stdout.lower():
             raise exception(f"STDOUT: {stdout}. STDERR: {stderr}")
         return stdout
 
-    def upload_temp_table_file(self, local_file, container_name: str=CONTAINER_NAMES[LOCAL_FILE_STORE_NODE]):
-        """return a context manager to upload the file to a temp file in container. See `TempContainerFile` for details
+    def stream_command(self, command: Union[str, List[str]], container_name: str=None, user: str='',
+                       exception=RuntimeError, timeout: float=None) -> Iterator[Tuple[str, str]]:
+        """execute a command inside container and yield its output line by line as it is produced.
+
+        :param command: a command string or a list of command arguments.
+        :param container_name: name of the container where the command runs. Use the hive-server container if not
+          provided.
+        :param user: user used to execute the command. Use container default if empty.
+        :param exception: type of exception raised when the command times out.
+        :param timeout: seconds to wait for the command to finish. wait without limit if None. Output is then read by
+          a background thread, so a command hanging without output times out as well. docker cannot kill an exec, so
+          the command keeps running in the container after the timeout.
+        :return: an iterator of tuples of ('stdout' or 'stderr', line). lines keep their line break.
+        """
+        container_name = container_name or self.container_name(LOCAL_FILE_STORE_NODE)
+        exec_id = self.api_client.exec_create(container_name, command, stdout=True, stderr=True, user=user)["Id"]
+        chunks = self.api_client.exec_start(exec_id, stream=True, demux=True)
+        if timeout is not None:
+            chunks = _with_deadline(chunks, time.monotonic() + timeout,
+                                    exception(f"{command} did not finish in {timeout} seconds"))
+        buffers = {"stdout": LineBuffer(), "stderr": LineBuffer()}
+        for demuxed in chunks:
+            for stream, chunk in zip(("stdout", "stderr"), demuxed):
+                if chunk:
+                    for line in buffers[stream].feed(chunk):
+                        yield stream, line
+
+        for stream, buffer in buffers.items():
+            for line in buffer.flush():
+                yield stream, line
+
+    @timed("container.hdfs")
+    def hdfs(self, args: List[str], container_name: str=None) -> str:
+        """run `hdfs dfs` with `args` inside container. Hadoop logs warnings to stderr, so unlike `execute_command` the
+        command fails only if it exits with a non zero code.
+
+        :example:
+        >>> container.hdfs(["-mkdir", "-p", "/user/hive/warehouse/sandbox.db/my_table/ds=2020-01-01"])
+
+        :param args: arguments of `hdfs dfs`
+        :param container_name: name of the container where the command runs. Use the hive-server container if not
+          provided.
+        :return: stdout of the command
+        """
+        container_name = container_name or self.container_name(LOCAL_FILE_STORE_NODE)
+        command = ["hdfs", "dfs"] + [str(arg) for arg in args]
+        exec_id = self.api_client.exec_create(container_name, command, stdout=True, stderr=True)["Id"]
+        stdout, stderr = self.api_client.exec_start(exec_id, demux=True)
+        exit_code = self.api_client.exec_inspect(exec_id)["ExitCode"]
+        if exit_code != 0:
+            raise RuntimeError(f"{' '.join(command[:3])} exited with {exit_code}. STDERR: {(stderr or b'').decode()}")
+        return (stdout or b"").decode()
+
+    def _is_folder(self, path: Union[PurePosixPath, str], container_name: str) -> bool:
+        exec_id = self.api_client.exec_create(container_name, ["test", "-d", str(path)])["Id"]
+        self.api_client.exec_start(exec_id)
+        return self.api_client.exec_inspect(exec_id)["ExitCode"] == 0
+
+    def staging(self, container_name: str=None) -> StagingArea:
+        """the StagingArea of `container_name` shared by all Container objects using the same docker daemon. Use the
+        hive-server container if `container_name` is not provided.
+        """
+        return get_staging_area(self, container_name or self.container_name(LOCAL_FILE_STORE_NODE))
+
+    def upload_temp_table_file(self, local_file, container_name: str=None):
+        """return a context manager to stage the file in container. A file whose content is already staged is not
+        uploaded again. The staged file must not be modified. See `StagedFile` for details
 
         :example:
         >>> with self.upload_temp_table_file('local_file', 'target_container') as f:
-        ...     # do something with f where f is the temporary file name in the container.
+        ...     # do something with f where f is the staged file name in the container.
+
+        """
+        return StagedFile(self.staging(container_name), local_file)
+
+    def upload_temp_table_files(self, local_files: List[Union[PosixPath, str]],
+                                container_name: str=None):
+        """return a context manager to stage multiple files in container. Files not staged yet are uploaded in a single
+        archive. See `StagedFiles` for details
+
+        :example:
+        >>> with self.upload_temp_table_files(['local_file_1', 'local_file_2']) as files:
+        ...     # files are the staged file names in the container, in the same order as local files.
 
         """
-        return TempContainerFile(self, local_file, container_name)
+        return StagedFiles(self.staging(container_name), local_files)
+
+    @timed("container.put_files")
+    def put_files(self, files: dict, to_container: Union[PosixPath, str],
+                  container_name: str=None):
+        """pack local files into one tar archive and extract it into folder `to_container` with a single api call. The
+        archive is spooled to disk so large files are not held in memory.
+
+        :param files: a dictionary from path relative to `to_container` to local file.
+        :param to_container: an existing folder in the container.
+        :param container_name: name of the container. Use the hive-server container if not provided.
+        :return: None
+        """
+        container_name = container_name or self.container_name(LOCAL_FILE_STORE_NODE)
+        with tempfile.TemporaryFile() as archive:
+            with tarfile.open(fileobj=archive, mode="w") as tar:
+                for arcname, local_file in files.items():
+                    tar.add(str(local_file), arcname=str(arcname))
+            archive.seek(0)
+            self.api_client.put_archive(container_name, str(to_container), archive)
 
     def append_file(self, container_name, file, text, skip_if_exists=True, user='root', from_new_line=True):
         """append a line to target `file` in target `container_name`. You can choose to skip (by default) if the text
@@ -223,51 +516,207 @@ class Container:
         :return: None
         """
         if skip_if_exists:
-            command_check_if_exists = f"""docker exec -u 1000 -t {container_name} grep "{text.strip()}" {file}"""
-            result = self.execute_command(command_check_if_exists)
+            result = self.execute_command(["grep", text.strip(), str(file)], container_name, user='1000')
             if result != '':
                 return
 
         line_break = "\n" if from_new_line else ""
-        command_append = f"""docker exec -u {user} -t {container_name} bash -c 'echo \"{line_break}{text}\" >> {file}'"""
-        self.execute_command(command_append)
+        self.execute_command(["bash", "-c", f'echo "{line_break}{text}" >> {file}'], container_name, user=user)
 
-    def enable_table_modification(self):
-        """edit hive.properties file in presto connector server so that hive table can be modified in presto.
-        note that this may fail if presto server version changes
+    def enable_table_modification(self, until_started=True):
+        """allow presto connector to modify hive tables. See `configure_catalog`.
 
+        :param until_started: wait until presto is ready again if it was restarted.
         :return: None
         """
-        properties = [
-            "hive.allow-drop-table=true",
-            "hive.allow-rename-table=true",
-            "hive.allow-add-column=true"
-        ]
-        catalog_path = "/opt/presto-server-0.181/etc/catalog/hive.properties"
-        for property in properties:
-            self.append_file(container_name=CONTAINER_NAMES["presto_coordinator"],
-                             file=catalog_path,
-                             text=property,
-                             user='root',
-                             from_new_line=False)
-
-
-class TempContainerFile:
-    """a context manager class used to upload file to temporary file in target container. You need to pass a Container
-    object and target `container_name`. The temporary file will be removed at exit. Note that the temporary file in
-    target container will have the same permission as `local_file`.
+        self.configure_catalog(self.catalog.with_table_modification(True), until_started=until_started)
+
+    def configure_catalog(self, catalog: CatalogConfig, until_started=True) -> bool:
+        """use presto catalog properties `catalog`. The properties files are rendered on the host and mounted into the
+        presto coordinator through a compose override. If the stack is running, docker-compose recreates the presto
+        coordinator alone, other containers keep running. Otherwise the configuration is used at the next `start`.
+
+        :param catalog: a CatalogConfig
+        :param until_started: wait until presto is ready again if it was recreated.
+        :return: whether the presto coordinator was recreated.
+        """
+        self.catalog = catalog
+        return self._recreate_if_changed(until_started)
+
+    def image_catalog(self) -> Tuple[PurePosixPath, Dict[str, str]]:
+        """return the catalog folder of the presto coordinator image and the content of its properties files by file
+        name. They are read once, from a throwaway container of the image which is never started, so files mounted by
+        `configure_catalog` don't hide them. The image is the one of the compose file, or of the existing coordinator.
+
+        :return: catalog folder, such as '/opt/presto-server-0.181/etc/catalog', and properties files
+        """
+        from docker.errors import ImageNotFound, NotFound
+
+        if self._image_catalog is not None:
+            return self._image_catalog
+
+        image = service_image(self.compose.compose_file().read_text(), SERVICES["presto_coordinator"]) \
+            if self.compose.compose_file().exists() else None
+        if image is None:
+            image = self.api_client.inspect_container(self.container_name("presto_coordinator"))["Image"]
+        try:
+            created = self.client.containers.create(image)
+        except ImageNotFound:
+            self.client.images.pull(image)
+            created = self.client.containers.create(image)
+
+        try:
+            config = self.api_client.inspect_container(created.id)["Config"]
+            for home in _presto_homes(config):
+                folder = home / CATALOG_FOLDER
+                try:
+                    chunks, _ = self.api_client.get_archive(created.id, str(folder))
+                except NotFound:
+                    continue
+                with tarfile.open(fileobj=ChunkReader(chunks), mode="r|") as tar:
+                    files = {PurePosixPath(member.name).name: tar.extractfile(member).read().decode()
+                             for member in tar if member.isfile() and len(PurePosixPath(member.name).parts) == 2}
+                self._image_catalog = folder, files
+                return self._image_catalog
+            raise RuntimeError(f"presto catalog folder not found in image {image}")
+        finally:
+            self.api_client.remove_container(created.id)
+
+    def mount_fixtures(self, fixture_folder: Union[PosixPath, str, None], until_started=True) -> bool:
+        """bind-mount host folder `fixture_folder` read only into the hive metastore, hive server and presto coordinator
+        through a compose override, so that tables can be created as EXTERNAL tables on it without copying data. See
+        `prestest.mounts` and `DBManager.create_external_table`. If the stack is running, docker-compose recreates
+        these containers, HDFS and the metastore database are kept. Otherwise the folder is mounted at the next
+        `start`.
+
+        :param fixture_folder: a host folder. None removes the mount.
+        :param until_started: wait until presto and hive are ready again if containers were recreated.
+        :return: whether containers were recreated.
+        """
+        self.fixture_mount = FixtureMount(fixture_folder) if fixture_folder is not None else None
+        return self._recreate_if_changed(until_started)
+
+    def _recreate_if_changed(self, until_started: bool) -> bool:
+        if not self.state.is_started() or not self._apply_overrides():
+            return False
+
+        self.start(until_started=until_started, recreate=True)
+        return True
+
+    def _apply_overrides(self) -> bool:
+        """render `self.catalog` and `self.fixture_mount` and set the compose overrides mounting them. The default
+        catalog is not mounted.
+
+        :return: whether the rendered files or the overrides changed.
+        """
+        mounted = list(self.compose.overrides)
+        overrides, changed = [], False
+        if not self.catalog.is_default:
+            folder = self.docker_folder / ".prestest" / "catalog" / self.compose.project
+            catalog_folder, originals = self.image_catalog()
+            changed = self.catalog.write(folder, self.compose.compose_file(), catalog_folder, originals) or changed
+            overrides.append(folder / OVERRIDE_FILE)
+        if self.fixture_mount is not None:
+            folder = self.docker_folder / ".prestest" / "mounts" / self.compose.project
+            changed = self.fixture_mount.write(folder, self.compose.compose_file()) or changed
+            overrides.append(folder / MOUNT_OVERRIDE_FILE)
+
+        self.compose.overrides = overrides
+        return changed or mounted != overrides
+
+
+def _presto_homes(config: dict) -> List[PurePosixPath]:
+    """return folders presto may be installed in according to container `config`, as returned by `inspect_container`.
+    """
+    homes = [PurePosixPath(env.split("=", 1)[1]) for env in config.get("Env") or [] if env.startswith("PRESTO_HOME=")]
+    if config.get("WorkingDir"):
+        homes.append(PurePosixPath(config["WorkingDir"]))
+    for argument in (config.get("Entrypoint") or []) + (config.get("Cmd") or []):
+        if argument.endswith(PRESTO_LAUNCHER):
+            homes.append(PurePosixPath(argument[:-len(PRESTO_LAUNCHER)] or "."))
+    return [home for home in dict.fromkeys(homes) if home.is_absolute()]
+
+
+def _with_deadline(chunks: Iterator, deadline: float, error: Exception) -> Iterator:
+    """yield items of `chunks`, read by a background thread, and raise `error` if the next item is not read before
+    `deadline` of `time.monotonic`.
     """
-    def __init__(self, container: Container, local_file: Union[PosixPath, str],
-                 container_name: str=CONTAINER_NAMES[LOCAL_FILE_STORE_NODE]):
-        self.container = container
-        self.container_name = container_name
-        self.local_file = local_file
-        self.temp_file = None
-
-    def __enter__(self):
-        self.temp_file = Path("/tmp") / str(uuid.uuid4())
-        self.container.copy_from_local(self.local_file, self.temp_file, self.container_name)
-        return self.temp_file
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.container.delete(self.temp_file, self.container_name)
+    items = queue.Queue()
+    done = object()
+
+    def read():
+        try:
+            for chunk in chunks:
+                items.put(chunk)
+        except Exception as e:
+            items.put(e)
+        items.put(done)
+
+    threading.Thread(target=read, name="prestest-exec", daemon=True).start()
+    while True:
+        try:
+            item = items.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            raise error
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+class TempContainerFile(StagedFile):
+    """deprecated, use `Container.upload_temp_table_file`. a context manager staging `local_file` in target container,
+    see `StagedFile`. The file is released at exit and removed when the staging area needs room.
+    """
+    def __init__(self, container: Container, local_file: Union[PosixPath, str], container_name: str=None):
+        warnings.warn("TempContainerFile is deprecated, use Container.upload_temp_table_file", DeprecationWarning,
+                      stacklevel=2)
+        super(TempContainerFile, self).__init__(container.staging(container_name), local_file)
+
+
+class TempContainerFolder(StagedFiles):
+    """deprecated, use `Container.upload_temp_table_files`. a context manager staging `local_files` in target
+    container, see `StagedFiles`. The files are released at exit and removed when the staging area needs room.
+    """
+    def __init__(self, container: Container, local_files: List[Union[PosixPath, str]], container_name: str=None):
+        warnings.warn("TempContainerFolder is deprecated, use Container.upload_temp_table_files", DeprecationWarning,
+                      stacklevel=2)
+        super(TempContainerFolder, self).__init__(container.staging(container_name), local_files)
+
+
+class ChunkReader(io.RawIOBase):
+    """a readable file object over an iterator of byte chunks, such as archives streamed from docker api."""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self.pending))
+        b[:size], self.pending = self.pending[:size], self.pending[size:]
+        return size
+
+
+class LineBuffer:
+    """decode a stream of bytes as utf-8 and split it into lines."""
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.pending = ""
+
+    def feed(self, chunk: bytes) -> List[str]:
+        lines = (self.pending + self.decoder.decode(chunk)).split("\n")
+        self.pending = lines.pop()
+        return [line + "\n" for line in lines]
+
+    def flush(self) -> List[str]:
+        self.pending += self.decoder.decode(b"", final=True)
+        lines, self.pending = ([self.pending] if self.pending else []), ""
+        return lines
@@ -0,0 +1,391 @@
+"""a long lived process keeping the stack, pooled hive/presto connections and loaded fixture tables warm between pytest
+runs. `prestest serve` (see `prestest.cli`) runs a PrestestDaemon listening on a unix socket in the state folder of the
+stack. While it runs, fixtures of the same docker folder send their queries to it through a DaemonClient, so a test
+session skips checking the stack, creating engines and reloading memoized tables.
+
+Every request is a json line {"method": ..., "params": {...}} answered by a json line {"result": ...} or
+{"error": ...}. Dataframes are sent as base64 encoded arrow IPC streams, so the daemon requires pyarrow.
+"""
+import base64
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from pathlib import Path, PosixPath
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from .backend import Backend
+from .cache import TableVersions, get_result_cache, get_table_versions
+from .cluster import STATE_FOLDER, cluster_key, get_cluster_manager
+from .container import Container
+from .db import DBManager
+from .engines import WARM_CONNECTIONS
+from .mounts import FixtureMount
+from .namespace import Namespace, get_namespace
+from .partitions import UPLOAD_CONCURRENCY, Partitions
+from .teardown import get_teardown_queue
+from .timing import timed
+
+CONNECT_TIMEOUT = 1  # seconds to wait for the daemon to accept a connection
+
+REQUEST_TIMEOUT = None  # seconds to wait for a response. Creating tables or starting the stack may take minutes.
+
+METHODS = ("status", "start", "warm", "stop", "create_table", "create_external_table", "create_database", "drop_table",
+           "drop_database", "run_hive_query", "fetch_hive_query", "read_sql")
+
+
+def encode_dataframe(df: pd.DataFrame) -> dict:
+    """encode `df` to be sent in a json response. Columns are sent by position, so duplicated names are kept, and
+    object columns are listed to be restored with None for nulls, as pyarrow converts them to strings with NaN.
+    """
+    import pyarrow as pa
+
+    positional = df.set_axis([str(i) for i in range(len(df.columns))], axis=1)
+    table = pa.Table.from_pandas(positional, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return {"arrow": base64.b64encode(sink.getvalue().to_pybytes()).decode(), "columns": list(df.columns),
+            "objects": [i for i, dtype in enumerate(df.dtypes) if dtype == object]}
+
+
+def decode_dataframe(encoded: dict) -> pd.DataFrame:
+    """decode a dataframe encoded by `encode_dataframe`."""
+    import pyarrow as pa
+
+    table = pa.ipc.open_stream(base64.b64decode(encoded["arrow"])).read_all()
+    df = table.to_pandas()
+    for i in encoded["objects"]:
+        valid = table.column(i).is_valid().to_numpy(zero_copy_only=False)
+        df[str(i)] = df[str(i)].astype(object).where(valid, None)
+    df.columns = encoded["columns"]
+    return df
+
+
+def socket_path(docker_folder: Union[PosixPath, str], project: str=None) -> Path:
+    """return the unix socket of the daemon serving the stack of `docker_folder` and compose `project`."""
+    return STATE_FOLDER / f"{cluster_key(Path(docker_folder).resolve(), project)}.sock"
+
+
+class DaemonError(RuntimeError):
+    """a request failed in the daemon"""
+
+
+class DaemonClient:
+    """send requests to the PrestestDaemon listening on `socket_file`. Every request uses its own connection, so a
+    client can be shared by threads.
+    """
+    def __init__(self, socket_file: Union[PosixPath, str], timeout: Optional[float]=REQUEST_TIMEOUT):
+        self.socket_file = Path(socket_file)
+        self.timeout = timeout
+
+    @classmethod
+    def find(cls, docker_folder: Union[PosixPath, str], project: str=None) -> Optional["DaemonClient"]:
+        """return a client of the daemon serving `docker_folder`, or None if it is not running.
+
+        :param docker_folder: docker hive repository folder location.
+        :param project: compose project of the stack. Use the default stack if None.
+        :return: a DaemonClient or None
+        """
+        client = cls(socket_path(docker_folder, project))
+        return client if client.is_running() else None
+
+    def is_running(self) -> bool:
+        """return whether the daemon accepts requests."""
+        if not self.socket_file.exists():
+            return False
+        try:
+            self.call("status")
+        except (OSError, DaemonError):
+            return False
+        return True
+
+    def call(self, method: str, **params):
+        """run `method` of the daemon with `params` and return its result.
+
+        :param method: one of METHODS
+        :param params: keyword arguments of the method. They must be serializable to json.
+        :return: result of the method
+        """
+        request = json.dumps({"method": method, "params": params}).encode() + b"\n"
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(CONNECT_TIMEOUT)
+            connection.connect(str(self.socket_file))
+            connection.settimeout(self.timeout)
+            connection.sendall(request)
+            with connection.makefile("rb") as reader:
+                line = reader.readline()
+        if not line:
+            raise DaemonError(f"daemon closed the connection while running {method}")
+        response = json.loads(line.decode())
+        if "error" in response:
+            raise DaemonError(response["error"])
+        return response.get("result")
+
+
+class DaemonDBManager(Backend):
+    """a DBManager whose queries run in the daemon behind `client`, on its warm connections. Methods not served by the
+    daemon, such as `create_partitioned_table` or `iter_sql`, run in this process with a DBManager of `container`
+    created at first use. Results of `read_sql` are identical to the ones of a DBManager.
+    """
+    def __init__(self, client: DaemonClient, container: Container, namespace: Namespace=None, cache: bool=False):
+        self.client = client
+        self.container = container
+        self.namespace = namespace or get_namespace()
+        self.cache = cache
+        self.teardown = get_teardown_queue()
+        self._local = None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._local_manager(), name)
+
+    def _local_manager(self) -> DBManager:
+        """return the DBManager running methods not served by the daemon, creating it at first call."""
+        if self._local is None:
+            self._local = DBManager.from_container(self.container, self.namespace)
+        return self._local
+
+    def _call(self, method: str, **params):
+        namespace = {"suffix": self.namespace.suffix, "schemas": sorted(self.namespace.schemas)}
+        return self.client.call(method, namespace=namespace, **params)
+
+    @timed("db.create_table")
+    def create_table(self, table: str, query: str, file: Union[PosixPath, str], memoize: bool=False) -> bool:
+        """see `DBManager.create_table`"""
+        schema = table.split(".")[0]
+        self.namespace.register(schema)
+        self.teardown.settle_table(self.container.compose.presto_http_url, self.namespace.table(table).lower())
+        created = self._call("create_table", table=table, query=query, file=str(Path(file).resolve()), memoize=memoize)
+        self.teardown.record_database(self, schema)
+        if memoize:
+            self.teardown.keep_database(self.container.compose.presto_http_url, self.namespace.schema(schema).lower())
+        return created
+
+    @timed("db.create_external_table")
+    def create_external_table(self, table: str, query: str, folder: Union[PosixPath, str], mount: FixtureMount=None):
+        """see `DBManager.create_external_table`"""
+        self.namespace.register(table.split(".")[0])
+        self.teardown.settle_table(self.container.compose.presto_http_url, self.namespace.table(table).lower())
+        mount = None if mount is None else {"host_folder": str(mount.host_folder), "target": str(mount.target)}
+        self._call("create_external_table", table=table, query=query, folder=str(folder), mount=mount)
+
+    @timed("db.create_database")
+    def create_database(self, schema: str):
+        """see `DBManager.create_database`"""
+        self.namespace.register(schema)
+        self.teardown.settle_database(self.container.compose.presto_http_url, self.namespace.schema(schema).lower())
+        self._call("create_database", schema=schema)
+        self.teardown.record_database(self, schema)
+
+    @timed("db.drop_table")
+    def drop_table(self, table: str):
+        """see `DBManager.drop_table`"""
+        self.teardown.settle_table(self.container.compose.presto_http_url, self.namespace.table(table).lower())
+        self._call("drop_table", table=table)
+
+    @timed("db.drop_database")
+    def drop_database(self, schema: str, cascade: bool=True):
+        """see `DBManager.drop_database`"""
+        self.teardown.settle_database(self.container.compose.presto_http_url, self.namespace.schema(schema).lower())
+        self._call("drop_database", schema=schema, cascade=cascade)
+
+    @timed("db.hive_query")
+    def run_hive_query(self, query: str):
+        """see `DBManager.run_hive_query`"""
+        self._call("run_hive_query", query=query)
+
+    @timed("db.hive_query")
+    def fetch_hive_query(self, query: str) -> List[tuple]:
+        """see `DBManager.fetch_hive_query`"""
+        return [tuple(row) for row in self._call("fetch_hive_query", query=query)]
+
+    @timed("db.read_sql")
+    def read_sql(self, query: str, columnar: bool=False) -> pd.DataFrame:
+        """see `DBManager.read_sql`. Results are cached by the daemon if this manager was created with `cache`."""
+        return decode_dataframe(self._call("read_sql", query=query, columnar=columnar, cache=self.cache))
+
+    def warm_up(self, connections: int=WARM_CONNECTIONS):
+        """see `DBManager.warm_up`"""
+        self.client.call("warm", connections=connections)
+
+    def create_tables(self, tables: List[dict], memoize: bool=False):
+        """see `DBManager.create_tables`. Runs in this process."""
+        return self._local_manager().create_tables(tables, memoize=memoize)
+
+    def create_partitioned_table(self, table: str, query: str, partitions: Partitions, register: str="add",
+                                 memoize: bool=False, concurrency: int=UPLOAD_CONCURRENCY) -> bool:
+        """see `DBManager.create_partitioned_table`. Runs in this process."""
+        return self._local_manager().create_partitioned_table(table, query, partitions, register=register,
+                                                              memoize=memoize, concurrency=concurrency)
+
+    def create_table_from_dataframe(self, table: str, df: pd.DataFrame, format: str="parquet",
+                                    partition_by: List[str]=None, compression: str="snappy"):
+        """see `DBManager.create_table_from_dataframe`. Runs in this process."""
+        self._local_manager().create_table_from_dataframe(table, df, format=format, partition_by=partition_by,
+                                                          compression=compression)
+
+    def get_table_fingerprint(self, table: str) -> Optional[str]:
+        """see `DBManager.get_table_fingerprint`. Runs in this process."""
+        return self._local_manager().get_table_fingerprint(table)
+
+    def read_arrow(self, query: str):
+        """see `DBManager.read_arrow`. Runs in this process."""
+        return self._local_manager().read_arrow(query)
+
+    def iter_sql(self, query: str, batch_rows: int=100000, arrow: bool=False) -> Iterator[pd.DataFrame]:
+        """see `DBManager.iter_sql`. Runs in this process."""
+        return self._local_manager().iter_sql(query, batch_rows=batch_rows, arrow=arrow)
+
+
+class PrestestDaemon:
+    """serve the stack of `docker_folder` to DaemonClients on `socket_file`. The daemon keeps one DBManager for every
+    namespace of its clients, so pytest-xdist workers keep their own schemas. Memoized tables are checked against the
+    fingerprint stored in hive like `DBManager.create_table` does, so tables changed outside the daemon are loaded
+    again. Requires pyarrow.
+    """
+    def __init__(self, docker_folder: Union[PosixPath, str], socket_file: Union[PosixPath, str]=None,
+                 project: str=None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("pyarrow is required to send results from the prestest daemon. pip install pyarrow")
+        self.cluster_manager = get_cluster_manager(docker_folder, project)
+        self.socket_file = Path(socket_file) if socket_file is not None else socket_path(docker_folder, project)
+        self.managers = {}  # type: Dict[Tuple[Optional[str], bool], DBManager]
+        self.started = time.time()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def container(self) -> Container:
+        return self.cluster_manager.container
+
+    @property
+    def scope(self) -> str:
+        return self.container.compose.presto_http_url
+
+    @property
+    def versions(self) -> TableVersions:
+        return get_table_versions()
+
+    def serve_forever(self):
+        """listen on `socket_file` until `stop` is requested. Queued teardown drops are flushed before returning.
+
+        :return: None
+        """
+        if DaemonClient(self.socket_file).is_running():
+            raise RuntimeError(f"a daemon is already listening on {self.socket_file}")
+        self.socket_file.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_file.exists():
+            self.socket_file.unlink()
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    self.wfile.write(json.dumps(daemon.handle(line)).encode() + b"\n")
+
+        self._server = socketserver.ThreadingUnixStreamServer(str(self.socket_file), Handler)
+        self._server.daemon_threads = True
+        os.chmod(str(self.socket_file), 0o600)
+        logging.info(f"prestest daemon of {self.container.docker_folder} listening on {self.socket_file}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if self.socket_file.exists():
+                self.socket_file.unlink()
+            get_teardown_queue().flush()
+
+    def handle(self, line: bytes) -> dict:
+        """run the request in json `line` and return the response."""
+        with self._lock:
+            self.requests += 1
+        try:
+            request = json.loads(line.decode())
+            method = request["method"]
+            if method not in METHODS:
+                raise ValueError(f"unknown method {method}. expected one of {METHODS}")
+            return {"result": getattr(self, method)(**request.get("params", {}))}
+        except Exception as e:
+            logging.exception("prestest daemon request failed")
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    def db_manager(self, namespace: dict=None, cache: bool=False) -> DBManager:
+        """return the DBManager of the client `namespace`, creating it at first use.
+
+        :param namespace: suffix and registered schemas of the client, see `prestest.namespace.Namespace`
+        :param cache: whether `read_sql` results are cached, see `prestest.cache`
+        :return: a DBManager
+        """
+        namespace = namespace or {}
+        key = (namespace.get("suffix"), cache)
+        with self._lock:
+            if key not in self.managers:
+                self.managers[key] = DBManager.from_container(self.container, Namespace(key[0]),
+                                                              cache=get_result_cache() if cache else None)
+            db_manager = self.managers[key]
+        for schema in namespace.get("schemas", []):
+            db_manager.namespace.register(schema)
+        return db_manager
+
+    def status(self) -> dict:
+        """pid, uptime and number of requests of the daemon, and the tables it loaded."""
+        return {"pid": os.getpid(), "docker_folder": str(self.container.docker_folder),
+                "socket": str(self.socket_file), "uptime": time.time() - self.started, "requests": self.requests,
+                "tables": sorted(self.versions.tables(self.scope))}
+
+    def start(self, allow_table_modification: bool=False, reset: bool=False, restore: str=None,
+              fixture_folder: str=None) -> bool:
+        """start the stack, see `ClusterManager.start`. Tables loaded before are forgotten if the stack was (re)started.
+
+        :return: whether the stack was (re)started
+        """
+        started = self.cluster_manager.start(allow_table_modification, reset, restore, fixture_folder)
+        if started:
+            self.versions.bump(self.scope, self.versions.tables(self.scope))
+        return started
+
+    def warm(self, connections: int=WARM_CONNECTIONS):
+        """start the stack if needed and open `connections` pooled connections to hive and presto."""
+        self.cluster_manager.ensure_started(until_started=True)
+        self.db_manager().warm_up(connections)
+
+    def stop(self):
+        """stop serving once the current request is answered."""
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def create_table(self, table: str, query: str, file: str, memoize: bool=False, namespace: dict=None) -> bool:
+        return self.db_manager(namespace).create_table(table, query, file, memoize=memoize)
+
+    def create_external_table(self, table: str, query: str, folder: str, mount: dict=None, namespace: dict=None):
+        mount = None if mount is None else FixtureMount(mount["host_folder"], mount["target"])
+        self.db_manager(namespace).create_external_table(table, query, folder, mount=mount)
+
+    def create_database(self, schema: str, namespace: dict=None):
+        self.db_manager(namespace).create_database(schema)
+
+    def drop_table(self, table: str, namespace: dict=None):
+        self.db_manager(namespace).drop_table(table)
+
+    def drop_database(self, schema: str, cascade: bool=True, namespace: dict=None):
+        self.db_manager(namespace).drop_database(schema, cascade)
+
+    def run_hive_query(self, query: str, namespace: dict=None):
+        self.db_manager(namespace).run_hive_query(query)
+
+    def fetch_hive_query(self, query: str, namespace: dict=None) -> List[list]:
+        rows = self.db_manager(namespace).fetch_hive_query(query)
+        return json.loads(json.dumps(rows, default=str))
+
+    def read_sql(self, query: str, columnar: bool=False, cache: bool=False, namespace: dict=None) -> dict:
+        return encode_dataframe(self.db_manager(namespace, cache).read_sql(query, columnar=columnar))
@@ -1,84 +1,474 @@
 """implement interface to create and clean up tables
 """
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import PosixPath
-from typing import Union
+from typing import Iterator, List, Optional, Union
 import logging
+import tempfile
 import time
 
 import pandas as pd
+from sqlalchemy.exc import DBAPIError
 from thrift.transport.TTransport import TTransportException
-from sqlalchemy import create_engine
 
-from .container import PRESTO_URL, Container
+from .backend import Backend
+from .cache import DROP_DATABASE, ResultCache, cacheable_tables, get_table_versions, is_read_only, referenced_tables
+from .columnar import create_table_query, partition_clause, write_partitions
+from .container import Container
+from .engines import WARM_CONNECTIONS, get_engine, warm_up
+from .mounts import FixtureMount, external_table_query
+from .namespace import Namespace, get_namespace
+from .partitions import (REGISTER_METHODS, UPLOAD_CONCURRENCY, Partitions, add_partition_queries, is_partitioned,
+                         partition_files, partition_path)
+from .presto import StatementClient, fetch_arrow, fetch_dataframe, iter_batches, to_arrow
+from .teardown import get_teardown_queue
+from .timing import span, timed
+from .utils import partitioned_table_fingerprint, table_fingerprint
 
-class DBManager:
-    """implement method to create, remove tables in testing framework.
+FINGERPRINT_PROPERTY = "prestest.fingerprint"
+
+
+class DBManager(Backend):
+    """implement method to create, remove tables in testing framework. Table names are logical names: when running
+    under pytest-xdist, schemas are suffixed with the worker id in every query (see `prestest.namespace.Namespace`) so
+    workers sharing one cluster don't collide. `project` and `port_offset` select an independent stack, see
+    `prestest.container.Container`. With `cache`, results of `read_sql` are cached until a table they read changes,
+    see `prestest.cache`.
     """
-    def __init__(self, docker_folder):
+    def __init__(self, docker_folder, namespace: Namespace=None, project: str=None, port_offset: int=0,
+                 cache: ResultCache=None):
+        self.container = Container(docker_folder, project=project, port_offset=port_offset)
         self.hive_client = self.get_hive_client()
         self.presto_client = self.get_presto_client()
-        self.container = Container(docker_folder)
+        self.namespace = namespace or get_namespace()
+        self.cache = cache
+        self.versions = get_table_versions()
+        self.teardown = get_teardown_queue()
+
+    @classmethod
+    def from_container(cls, container: Container, namespace: Namespace=None, cache: ResultCache=None) -> "DBManager":
+        """create a DBManager of the stack controlled by `container`, sharing its docker clients.
+
+        :param container: a Container, such as the container of a cluster leased from a `prestest.pool.ClusterPool`
+        :param namespace: see `DBManager`
+        :param cache: see `DBManager`
+        :return: a DBManager
+        """
+        db_manager = cls(container.docker_folder, namespace, container.project, container.compose.port_offset, cache)
+        db_manager.container = container
+        return db_manager
 
     def get_hive_client(self):
-        return create_engine("hive://localhost:10000")
+        return get_engine(self.container.compose.hive_url)
 
     def get_presto_client(self):
-        return create_engine(PRESTO_URL, connect_args={"protocol": "http"})
+        return get_engine(self.container.compose.presto_url, connect_args={"protocol": "http"})
+
+    def warm_up(self, connections: int=WARM_CONNECTIONS):
+        """open `connections` pooled connections to hive and presto so that later queries reuse them.
 
-    def create_table(self, table: str, query: str, file: Union[PosixPath, str]):
+        :param connections: number of connections opened for each engine.
+        :return: None
+        """
+        warm_up(self.hive_client, connections)
+        warm_up(self.presto_client, connections)
+
+    @timed("db.create_table")
+    def create_table(self, table: str, query: str, file: Union[PosixPath, str], memoize: bool=False) -> bool:
         """create table based on the query and insert file into the table. this method intends to help set up tables
         used for testing. the database for the table will be created (but not dropped after)
 
         :param table: name of the table. for example, 'sandbox.my_table'
         :param query: a query used to create hive table.
         :param file: a file inserted to the table. This will overwrite the table if it already exists.
-        :return: None
+        :param memoize: skip creating the table if it already exists and was created from the same query and file
+          content. The fingerprint of query and file is stored in table properties.
+        :return: whether the table was created. False if an existing memoized table was reused.
         """
         schema, _ = table.split(".")
-        create_db = f"""CREATE DATABASE IF NOT EXISTS {schema}"""
-        repeat = 3
+        self.create_database(schema)
+        if memoize:
+            self._keep_database(schema)
+        return self._create_table(table, query, file, memoize)
 
-        while repeat > 0:
-            try:
-                self.run_hive_query(create_db)
-                break
-            except TTransportException as e:
-                logging.warning(f"error connecting to database. {e}")
-                time.sleep(3)
-                repeat -= 1
-        else:
-            raise RuntimeError("presto database cannot be connected probably.")
+    def _create_table(self, table: str, query: str, file: Union[PosixPath, str], memoize: bool=False) -> bool:
+        fingerprint = table_fingerprint(query, file)
+        if memoize and self.get_table_fingerprint(table) == fingerprint:
+            logging.debug(f"reusing memoized table {table}")
+            self._set_version(table, fingerprint)
+            return False
 
         self.drop_table(table)
 
         with self.container.upload_temp_table_file(local_file=file) as filename:
-            self.run_hive_query(query)
-            insert_to_table = f"""LOAD DATA LOCAL INPATH '{filename}' OVERWRITE INTO TABLE {table}"""
+            self._load_table(table, query, filename, fingerprint if memoize else None)
+        self._set_version(table, fingerprint)
+        return True
+
+    @timed("db.create_tables")
+    def create_tables(self, tables: List[dict], memoize: bool=False):
+        """create multiple tables at once. All files are uploaded to the container in a single archive and each
+        database is only created once. Temporary files are removed in a single call afterwards. If `memoize` is True,
+        tables already created from the same query and file content are skipped. See `create_table`.
+
+        :example:
+        >>> db_manager.create_tables([
+        ...     {"table": "sandbox.table_1", "query": create_table_1, "file": "table_1.csv"},
+        ...     {"table": "sandbox.table_2", "query": create_table_2, "file": "table_2.csv"},
+        ... ])
+
+        :param tables: a list of dictionaries with keys "table", "query" and "file". See `create_table` for details.
+        :param memoize: reuse existing tables created from the same query and file content.
+        :return: None
+        """
+        schemas = []
+        for spec in tables:
+            schema, _ = spec["table"].split(".")
+            if schema not in schemas:
+                schemas.append(schema)
+
+        for schema in schemas:
+            self.create_database(schema)
+            if memoize:
+                self._keep_database(schema)
+
+        fingerprints = [table_fingerprint(spec["query"], spec["file"]) for spec in tables]
+        if memoize:
+            stale = []
+            for i, spec in enumerate(tables):
+                if self.get_table_fingerprint(spec["table"]) == fingerprints[i]:
+                    self._set_version(spec["table"], fingerprints[i])
+                else:
+                    stale.append(i)
+            tables, fingerprints = [tables[i] for i in stale], [fingerprints[i] for i in stale]
+        if not tables:
+            return
+
+        with self.container.upload_temp_table_files([spec["file"] for spec in tables]) as filenames:
+            for spec, filename, fingerprint in zip(tables, filenames, fingerprints):
+                self.drop_table(spec["table"])
+                self._load_table(spec["table"], spec["query"], filename, fingerprint if memoize else None)
+                self._set_version(spec["table"], fingerprint)
+
+    @timed("db.create_table_from_dataframe")
+    def create_table_from_dataframe(self, table: str, df: pd.DataFrame, format: str="parquet",
+                                    partition_by: List[str]=None, compression: str="snappy"):
+        """create table from a dataframe. The hive schema is inferred from dtypes, the data is written locally into
+        compressed parquet or orc files (one per partition), uploaded in a single archive and loaded into the table.
+        This is much smaller to transfer and faster to scan than delimited text. Requires pyarrow.
+
+        :param table: name of the table. for example, 'sandbox.my_table'
+        :param df: data of the table.
+        :param format: file format of the table, 'parquet' or 'orc'.
+        :param partition_by: columns of `df` used as partition columns.
+        :param compression: compression codec of the files, such as 'snappy' or 'zlib'.
+        :return: None
+        """
+        query = create_table_query(table, df, format, partition_by)
+        schema, _ = table.split(".")
+        self.create_database(schema)
+        self.drop_table(table)
+
+        with tempfile.TemporaryDirectory() as folder:
+            partitions = write_partitions(df, folder, format, partition_by, compression)
+            with self.container.upload_temp_table_files([file for _, file in partitions]) as filenames:
+                self.run_hive_query(query)
+                for (spec, _), filename in zip(partitions, filenames):
+                    with span("db.load_data", table=table):
+                        self.run_hive_query(f"""LOAD DATA LOCAL INPATH '{filename}' INTO TABLE {table}"""
+                                            f"""{partition_clause(spec)}""")
+
+    @timed("db.create_partitioned_table")
+    def create_partitioned_table(self, table: str, query: str, partitions: Partitions, register: str="add",
+                                 memoize: bool=False, concurrency: int=UPLOAD_CONCURRENCY) -> bool:
+        """create a partitioned table and load the files of every partition into it. All files are staged in the
+        container in a single archive, then partitions are put into HDFS under the table location concurrently and
+        registered in bulk instead of one LOAD DATA statement per partition. Files with identical content in one
+        partition are loaded once.
+
+        :example:
+        >>> db_manager.create_partitioned_table("sandbox.events", create_events, "fixtures/events")
+        >>> db_manager.create_partitioned_table("sandbox.events", create_events, {"ds=2020-01-01": "day_1.csv"})
+
+        :param table: name of the table. for example, 'sandbox.my_table'
+        :param query: a query used to create hive table. It must be partitioned by the columns of the partitions.
+        :param partitions: a folder in hive layout, or a mapping from partition spec to files. See
+          `prestest.partitions.partition_files`.
+        :param register: 'add' registers partitions with batched ALTER TABLE ADD PARTITION statements. 'msck' runs
+          MSCK REPAIR TABLE once, which discovers the partition folders.
+        :param memoize: skip creating the table if it already exists and was created from the same query, partitions
+          and file content. See `create_table`.
+        :param concurrency: maximum number of partitions put into HDFS at the same time.
+        :return: whether the table was created. False if an existing memoized table was reused.
+        """
+        if register not in REGISTER_METHODS:
+            raise ValueError(f"register must be one of {REGISTER_METHODS}. got {register}")
+        files = partition_files(partitions)
+        schema, _ = table.split(".")
+        self.create_database(schema)
+        if memoize:
+            self._keep_database(schema)
+
+        fingerprint = partitioned_table_fingerprint(query, files)
+        if memoize and self.get_table_fingerprint(table) == fingerprint:
+            logging.debug(f"reusing memoized table {table}")
+            self._set_version(table, fingerprint)
+            return False
+
+        self.drop_table(table)
+        self.run_hive_query(query)
+        location = self.get_table_location(table)
+        folders = [f"{location}/{partition_path(spec)}" for spec, _ in files]
+        with self.container.upload_temp_table_files([file for _, group in files for file in group]) as filenames:
+            staged, start = [], 0
+            for _, group in files:
+                staged.append(list(dict.fromkeys(str(f) for f in filenames[start:start + len(group)])))
+                start += len(group)
+
+            with span("db.put_partitions", table=table, partitions=len(files)):
+                self.container.hdfs(["-mkdir", "-p"] + folders)
+                with ThreadPoolExecutor(max_workers=max(min(concurrency, len(files)), 1),
+                                        thread_name_prefix="prestest-partitions") as executor:
+                    puts = [executor.submit(self.container.hdfs, ["-put", "-f"] + group + [folder])
+                            for group, folder in zip(staged, folders)]
+                    for put in puts:
+                        put.result()
+
+        with span("db.register_partitions", table=table, partitions=len(files)):
+            if register == "msck":
+                self.run_hive_query(f"""MSCK REPAIR TABLE {table}""")
+            else:
+                locations = [(spec, folder) for (spec, _), folder in zip(files, folders)]
+                for add_partitions in add_partition_queries(table, locations):
+                    self.run_hive_query(add_partitions)
+        if memoize:
+            self.run_hive_query(f"""ALTER TABLE {table} SET TBLPROPERTIES ('{FINGERPRINT_PROPERTY}'='{fingerprint}')""")
+        self._set_version(table, fingerprint)
+        return True
+
+    @timed("db.create_external_table")
+    def create_external_table(self, table: str, query: str, folder: Union[PosixPath, str], mount: FixtureMount=None):
+        """create an EXTERNAL table reading the files of `folder` where they are, in the host fixture folder mounted
+        into the stack (see `Container.mount_fixtures`). No data is copied, so large fixtures cost a DDL round trip.
+        Partitioned tables find their partitions with MSCK REPAIR TABLE, `folder` must be in hive layout. Dropping the
+        table only removes its metadata, files on the host are never modified.
+
+        :example:
+        >>> db_manager.container.mount_fixtures("tests/fixtures")
+        >>> db_manager.create_external_table("sandbox.events", create_events, "events")
+
+        :param table: name of the table. for example, 'sandbox.my_table'
+        :param query: a query used to create hive table, without LOCATION clause. It is turned into CREATE EXTERNAL
+          TABLE.
+        :param folder: a folder in the fixture folder, absolute or relative to it. Files starting with '.' or '_' are
+          ignored by hive.
+        :param mount: the fixture folder mount. Use the mount of `self.container` if not provided.
+        :return: None
+        """
+        mount = mount or self.container.fixture_mount
+        if mount is None:
+            raise RuntimeError("no fixture folder is mounted. see Container.mount_fixtures")
+        location = mount.location(folder)
+        schema, _ = table.split(".")
+        self.create_database(schema)
+        self.drop_table(table)
+        self.run_hive_query(external_table_query(query, location))
+        if is_partitioned(query):
+            with span("db.register_partitions", table=table):
+                self.run_hive_query(f"""MSCK REPAIR TABLE {table}""")
+
+    @timed("db.create_database")
+    def create_database(self, schema: str):
+        """create database `schema` if it doesn't exist. If hive server cannot be connected, wait until it is ready (see
+        `prestest.readiness`) and try again once. Per-worker databases are dropped at the end of the pytest session,
+        see `prestest.teardown`.
+
+        :param schema: name of the database.
+        :return: None
+        """
+        self.namespace.register(schema)
+        self.teardown.settle_database(self.container.compose.presto_http_url, self.namespace.schema(schema).lower())
+        create_db = f"""CREATE DATABASE IF NOT EXISTS {schema}"""
+        try:
+            self.run_hive_query(create_db)
+        except TTransportException as e:
+            logging.warning(f"error connecting to database. {e}")
+            readiness = self.container.readiness
+            readiness.invalidate(["hive"])
+            if not readiness.wait(["hive"]):
+                raise RuntimeError(f"hive server cannot be connected. {readiness.errors.get('hive')}")
+            self.run_hive_query(create_db)
+        self.teardown.record_database(self, schema)
+
+    def get_table_fingerprint(self, table: str) -> Optional[str]:
+        """return the fingerprint stored in properties of `table` by a memoized `create_table` call.
+
+        :param table: name of the table.
+        :return: the fingerprint, or None if the table doesn't exist or was not memoized.
+        """
+        try:
+            rows = self.fetch_hive_query(f"""SHOW TBLPROPERTIES {table}('{FINGERPRINT_PROPERTY}')""")
+        except DBAPIError:
+            return None
+        value = rows[0][-1] if rows else None
+        # hive returns a message instead of failing if the property is not set
+        return value if value and " " not in value else None
+
+    def get_table_location(self, table: str) -> str:
+        """return the location of `table`, such as 'hdfs://namenode:8020/user/hive/warehouse/sandbox.db/my_table'.
+
+        :param table: name of the table.
+        :return: the location
+        """
+        for row in self.fetch_hive_query(f"""DESCRIBE FORMATTED {table}"""):
+            if row and str(row[0]).strip() == "Location:":
+                return str(row[1]).strip().rstrip("/")
+        raise RuntimeError(f"location of {table} is not found")
+
+    def _load_table(self, table: str, query: str, filename: Union[PosixPath, str], fingerprint: str=None):
+        self.run_hive_query(query)
+        insert_to_table = f"""LOAD DATA LOCAL INPATH '{filename}' OVERWRITE INTO TABLE {table}"""
+        with span("db.load_data", table=table):
             self.run_hive_query(insert_to_table)
+        if fingerprint is not None:
+            self.run_hive_query(f"""ALTER TABLE {table} SET TBLPROPERTIES ('{FINGERPRINT_PROPERTY}'='{fingerprint}')""")
 
+    @timed("db.drop_table")
     def drop_table(self, table:str):
         """drop target table in container hive.
 
         :param table: name of the table.
         :return: None
         """
+        self.teardown.settle_table(self.container.compose.presto_http_url, self.namespace.table(table).lower())
         drop_table = f"""DROP TABLE IF EXISTS {table}"""
         self.run_hive_query(drop_table)
 
-    def read_sql(self, query: str) -> pd.DataFrame:
-        """download presto query result into a pandas dataframe.
+    @timed("db.drop_database")
+    def drop_database(self, schema: str, cascade: bool=True):
+        """drop database `schema` in container hive. To drop it without waiting, see `prestest.teardown`.
+
+        :param schema: name of the database.
+        :param cascade: also drop all tables of the database.
+        :return: None
+        """
+        self.run_hive_query(f"""DROP DATABASE IF EXISTS {schema}{" CASCADE" if cascade else ""}""")
+
+    def get_statement_client(self) -> StatementClient:
+        return StatementClient(self.container.compose.presto_http_url)
+
+    @timed("db.read_sql")
+    def read_sql(self, query: str, columnar: bool=False) -> pd.DataFrame:
+        """download presto query result into a pandas dataframe. If `self.cache` is set, the result of a read only
+        query is returned from the cache while the tables it reads are unchanged. Queries reading tables without
+        schema are never cached, see `prestest.cache`.
 
         :param query: a presto query.
+        :param columnar: decode result pages directly into typed columns instead of going through row tuples. This is
+          much faster and uses less memory for large results. Integer and boolean columns with nulls use pandas
+          nullable types.
         :return: a dataframe containing the returned contents of the query.
         """
+        query = self.namespace.rewrite(query)
+        if not is_read_only(query):
+            try:
+                return self._read_sql(query, columnar)
+            finally:
+                self._changed(query)
+        tables = cacheable_tables(query)
+        if self.cache is None or tables is None:
+            return self._read_sql(query, columnar)
+
+        scope = self.container.compose.presto_http_url
+        versions, persistent = self.versions.of(scope, tables)
+        key = self.cache.key(scope, query, versions, columnar)
+        df = self.cache.get(key)
+        if df is None:
+            start = time.perf_counter()
+            df = self._read_sql(query, columnar)
+            self.cache.put(key, df, time.perf_counter() - start, persist=persistent)
+        return df
+
+    def _read_sql(self, query: str, columnar: bool) -> pd.DataFrame:
+        if columnar:
+            return fetch_dataframe(self.get_statement_client(), query)
+
         with self.presto_client.connect() as con:
             df = pd.read_sql(query, con=con)
         return df
 
+    @timed("db.read_arrow")
+    def read_arrow(self, query: str):
+        """download presto query result into a pyarrow Table using the columnar path of `read_sql`. Requires pyarrow.
+
+        :param query: a presto query.
+        :return: a pyarrow.Table containing the returned contents of the query.
+        """
+        return fetch_arrow(self.get_statement_client(), self.namespace.rewrite(query))
+
+    def iter_sql(self, query: str, batch_rows: int=100000, arrow: bool=False) -> Iterator[pd.DataFrame]:
+        """stream presto query result in batches so that large results can be consumed with bounded memory. If the
+        consumer stops early (for example, breaks out of the loop), the query is cancelled on the server.
+
+        :example:
+        >>> total = 0
+        >>> for batch in db_manager.iter_sql("SELECT col1 FROM sandbox.big_table", batch_rows=50000):
+        ...     total += batch["col1"].sum()
+
+        :param query: a presto query.
+        :param batch_rows: number of rows in each batch. The last batch may be smaller.
+        :param arrow: yield pyarrow Tables instead of DataFrames. Requires pyarrow.
+        :return: an iterator of dataframes (or pyarrow Tables) containing consecutive rows of the result.
+        """
+        batches = iter_batches(self.get_statement_client(), self.namespace.rewrite(query), batch_rows)
+        try:
+            for names, columns in batches:
+                if arrow:
+                    yield to_arrow(columns)
+                else:
+                    yield pd.DataFrame({name: columns[name] for name in names}, columns=names)
+        finally:
+            batches.close()
+
+    @timed("db.hive_query")
     def run_hive_query(self, query: str):
         """execute a hive query
 
         :param query: hive query string
         :return: None
         """
-        self.hive_client.execute(query)
+        query = self.namespace.rewrite(query)
+        try:
+            with self.hive_client.connect() as connection:
+                connection.exec_driver_sql(query)
+                connection.commit()
+        finally:
+            self._changed(query)
+
+    @timed("db.hive_query")
+    def fetch_hive_query(self, query: str) -> List[tuple]:
+        """execute a hive query and return all rows of the result.
+
+        :param query: hive query string
+        :return: list of rows
+        """
+        with self.hive_client.connect() as connection:
+            return [tuple(row) for row in connection.exec_driver_sql(self.namespace.rewrite(query)).fetchall()]
+
+    def _changed(self, query: str):
+        """bump versions of tables `query` may have changed, unless it is read only."""
+        if is_read_only(query):
+            return
+        scope = self.container.compose.presto_http_url
+        database = DROP_DATABASE.match(query)
+        if database:
+            self.versions.bump_schema(scope, database.group(1))
+        self.versions.bump(scope, referenced_tables(query))
+
+    def _keep_database(self, schema: str):
+        """keep database `schema` at the end of the session, memoized tables are reused by later sessions."""
+        self.teardown.keep_database(self.container.compose.presto_http_url, self.namespace.schema(schema).lower())
+
+    def _set_version(self, table: str, fingerprint: str):
+        """record that `table` holds the content of `fingerprint`, see `prestest.cache.TableVersions`."""
+        self.versions.bump(self.container.compose.presto_http_url, [self.namespace.table(table)], fingerprint)
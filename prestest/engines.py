@@ -0,0 +1,85 @@
+"""process wide registry of pooled sqlalchemy engines shared by Container, DBManager and fixtures
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+POOL_OPTIONS = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+
+WARM_CONNECTIONS = 2
+
+_ENGINES = {}  # type: Dict[tuple, Engine]
+_LOCK = threading.Lock()
+
+
+def configure(**pool_options):
+    """change pool options used by engines created afterwards. Existing engines are disposed so they are created again
+    with the new options at next `get_engine` call.
+
+    :param pool_options: keyword arguments passed to `sqlalchemy.create_engine`, such as `pool_size`,
+      `max_overflow`, `pool_pre_ping` and `pool_recycle`.
+    :return: None
+    """
+    POOL_OPTIONS.update(pool_options)
+    dispose_all()
+
+
+def get_engine(url: str, connect_args: Optional[dict]=None) -> Engine:
+    """return the engine of `url`, creating it at first call. Connections are pooled and checked with a ping before
+    use, so HiveServer2 and presto sessions are kept open and reused across tests and threads.
+
+    :param url: sqlalchemy url, for example 'hive://localhost:10000'
+    :param connect_args: connect_args passed to sqlalchemy.create_engine
+    :return: a sqlalchemy Engine
+    """
+    key = (url, tuple(sorted((connect_args or {}).items())))
+    with _LOCK:
+        if key not in _ENGINES:
+            _ENGINES[key] = create_engine(url, connect_args=connect_args or {}, **POOL_OPTIONS)
+        return _ENGINES[key]
+
+
+def warm_up(engine: Engine, connections: int=WARM_CONNECTIONS) -> int:
+    """open `connections` connections concurrently and return them to the pool so that later queries skip session
+    establishment. Connection errors are logged and ignored.
+
+    :param engine: a sqlalchemy Engine returned by `get_engine`
+    :param connections: number of connections to open
+    :return: number of connections opened successfully
+    """
+    def connect():
+        return engine.connect()
+
+    opened = []
+    with ThreadPoolExecutor(max_workers=max(connections, 1)) as executor:
+        futures = [executor.submit(connect) for _ in range(connections)]
+        for future in futures:
+            try:
+                opened.append(future.result())
+            except Exception as e:
+                logging.warning(f"failed to warm up connection to {engine.url}. {e}")
+
+    for connection in opened:
+        connection.close()
+
+    return len(opened)
+
+
+def dispose_all():
+    """close all pooled connections and forget all engines.
+
+    :return: None
+    """
+    with _LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
@@ -1,68 +1,254 @@
+"""prestest fixtures. They are registered by the pytest plugin in `prestest.plugin`. Modules depending on docker,
+sqlalchemy or pandas are imported when a fixture is first used, so registering fixtures is cheap.
+"""
+import uuid
+
 import pytest
 from pathlib import Path
+from typing import Optional
 
-from .container import Container, CONTAINER_NAMES, LOCAL_FILE_STORE_NODE
-from .db import DBManager
+from .container import Container, CONTAINER_NAMES, HIVE_URL, LOCAL_FILE_STORE_NODE, PRESTO_URL
 from .utils import get_prestest_params
 
 DOCKER_FOLDER = Path(".").resolve().parent / "docker-hive"
 
+BACKENDS = ("docker", "lite")
+
+TEMPORARY_DATABASE_PREFIX = "prestest_tmp"
+
 
 class PrestestException(Exception):
     def __init__(self, msg):
         super(PrestestException, self).__init__(msg)
 
 
+def get_backend(request) -> str:
+    """return backend used by the test: "backend" argument in pytest.mark.prestest, or --prestest-backend option of
+    `prestest.plugin`. Default to "docker".
+    """
+    backend = get_prestest_params(request, "backend", None) or \
+        request.config.getoption("prestest_backend", default=None) or "docker"
+    if backend not in BACKENDS:
+        raise PrestestException(f"backend must be one of {BACKENDS}. got {backend}")
+    return backend
+
+
+def get_teardown(request) -> Optional["TeardownQueue"]:
+    """return the queue dropping temporary tables and databases in background, or None if they are dropped at once:
+    with the lite backend or --prestest-sync-teardown option of `prestest.plugin`.
+    """
+    if get_backend(request) == "lite" or request.config.getoption("prestest_sync_teardown", default=False):
+        return None
+    from .teardown import get_teardown_queue
+    return get_teardown_queue()
+
+
+def get_daemon(request) -> Optional["DaemonClient"]:
+    """return a client of the daemon serving the docker folder of the test (see `prestest.daemon`), or None if it is not
+    running, or with the lite backend, --prestest-pool or --prestest-no-daemon option of `prestest.plugin`.
+    """
+    if get_backend(request) == "lite" or request.config.getoption("prestest_no_daemon", default=False) or \
+            request.config.getoption("prestest_pool", default=None):
+        return None
+    from .daemon import DaemonClient
+    return DaemonClient.find(get_prestest_params(request, "container_folder", DOCKER_FOLDER))
+
+
+def is_cache_enabled(config) -> bool:
+    """return whether --prestest-cache or --prestest-cache-dir option of `prestest.plugin` is set."""
+    return bool(config.getoption("prestest_cache", default=False) or
+                config.getoption("prestest_cache_dir", default=None))
+
+
+@pytest.fixture(scope="session")
+def cluster_pool(request) -> "ClusterPool":
+    """a ClusterPool of independent stacks when pytest runs with --prestest-pool=N, None otherwise. All stacks are
+    started before the first test using them. With --prestest-pool-snapshot, every returned stack is restored from the
+    snapshot before it is leased again.
+    """
+    size = request.config.getoption("prestest_pool", default=None)
+    if not size:
+        yield None
+        return
+    from .pool import ClusterPool
+
+    pool = ClusterPool(DOCKER_FOLDER, size, snapshot=request.config.getoption("prestest_pool_snapshot", default=None))
+    pool.start()
+    yield pool
+    pool.close()
+
+
 @pytest.fixture()
-def container(request) -> Container:
-    """a Container fixture. You may pass "container_folder" argument in pytest.mark.prestest. By default, it uses
+def cluster_lease(cluster_pool) -> "ClusterLease":
+    """a stack of `cluster_pool` held for the test and returned to the pool at teardown."""
+    if cluster_pool is None:
+        raise PrestestException("cluster_lease requires a pool. run pytest with --prestest-pool=N")
+    with cluster_pool.lease() as lease:
+        yield lease
+
+
+@pytest.fixture()
+def cluster_manager(request) -> "ClusterManager":
+    """the ClusterManager shared by all tests using the same docker folder. You may pass "container_folder" argument in
+    pytest.mark.prestest. When pytest runs with --prestest-pool=N, it is the manager of the stack leased for the test.
     """
+    from .cluster import get_cluster_manager
+
+    if request.getfixturevalue("cluster_pool") is not None:
+        return request.getfixturevalue("cluster_lease").manager
     container_folder = get_prestest_params(request, "container_folder", DOCKER_FOLDER)
-    return Container(docker_folder=container_folder)
+    return get_cluster_manager(container_folder)
+
+
+@pytest.fixture()
+def container(cluster_manager) -> Container:
+    """a Container fixture. You may pass "container_folder" argument in pytest.mark.prestest. By default, it uses
+    """
+    return cluster_manager.container
 
 
 @pytest.fixture()
-def start_container(request, container):
-    """Start hive container with presto connector. You may pass the following args in pytest.mark.prestest:
+def start_container(request):
+    """Start hive container with presto connector. The stack is only started if it is not healthy or the docker folder
+    changed since it was started. Nothing is started with the lite backend. You may pass the following args in
+    pytest.mark.prestest:
 
     - allow_table_modification: enable table to be dropped from presto client
     - reset: completely wipe containers before starting. This will reset the containers to factory state.
+    - restore: name of a snapshot to restore the warehouse from before starting. This takes precedence over reset.
+    - fixture_folder: a host folder mounted into the stack for external tables, see `Container.mount_fixtures`.
+
+    If `prestest serve` is running, the daemon starts the stack instead.
     """
+    if get_backend(request) == "lite":
+        return
     allow_table_modification = get_prestest_params(request, "allow_table_modification", False)
     reset = get_prestest_params(request, "reset", False)
-    if reset:
-        container.reset(allow_table_modification=allow_table_modification, autostart=True, until_started=True)
-    else:
-        container.start(until_started=True)
+    restore = get_prestest_params(request, "restore", None)
+    fixture_folder = get_prestest_params(request, "fixture_folder", None)
+    daemon = get_daemon(request)
+    if daemon is not None:
+        fixture_folder = None if fixture_folder is None else str(Path(fixture_folder).resolve())
+        daemon.call("start", allow_table_modification=allow_table_modification, reset=reset, restore=restore,
+                    fixture_folder=fixture_folder)
+        return
+    request.getfixturevalue("cluster_manager").start(allow_table_modification, reset, restore, fixture_folder)
+
+
+@pytest.fixture(scope="session")
+def warm_engines():
+    """open pooled hive and presto connections once per session. Connections are shared by every DBManager, so tests
+    reuse warm sessions instead of establishing new ones. Pool options can be changed by `prestest.engines.configure`.
+    """
+    from .engines import WARM_CONNECTIONS, get_engine, warm_up
+
+    for url, connect_args in ((HIVE_URL, None), (PRESTO_URL, {"protocol": "http"})):
+        warm_up(get_engine(url, connect_args), WARM_CONNECTIONS)
 
 
 @pytest.fixture()
-def db_manager(request):
+def db_manager(request) -> "Backend":
     """return a DBManager object using specified container. You may pass the location of hive docker in
-    pytest.mark.prestest in "container_folder" argument.
+    pytest.mark.prestest in "container_folder" argument. With "backend" argument (or --prestest-backend option) set to
+    "lite", return a LiteDBManager running queries in memory without containers. It uses the container of
+    `cluster_manager`, so a fixture folder mounted by `start_container` is used for external tables. When pytest runs
+    with --prestest-pool=N, it uses the stack leased for the test. With "cache" argument (or --prestest-cache option),
+    `read_sql` results are cached until the tables they read change, see `prestest.cache`. If `prestest serve` is
+    running, return a DaemonDBManager running queries in the daemon, see `prestest.daemon`. Tests should only use
+    methods of `prestest.backend.Backend`, which every backend implements.
     """
-    container_folder = get_prestest_params(request, "container_folder", DOCKER_FOLDER)
-    return DBManager(docker_folder=container_folder)
+    if get_backend(request) == "lite":
+        from .lite import LiteDBManager
+        return LiteDBManager()
+    cache = get_prestest_params(request, "cache", None)
+    if cache is None:
+        cache = is_cache_enabled(request.config)
+    daemon = get_daemon(request)
+    if daemon is not None:
+        from .daemon import DaemonDBManager
+        return DaemonDBManager(daemon, request.getfixturevalue("cluster_manager").container, cache=cache)
+    from .cache import get_result_cache
+    from .db import DBManager
+
+    if request.getfixturevalue("cluster_pool") is None:
+        request.getfixturevalue("warm_engines")
+    return DBManager.from_container(request.getfixturevalue("cluster_manager").container,
+                                    cache=get_result_cache() if cache else None)
+
+
+@pytest.fixture()
+def async_container(container) -> "AsyncContainer":
+    """an AsyncContainer wrapping the `container` fixture. Use it in coroutine tests, such as tests run by
+    pytest-asyncio. It is a plain fixture: creating the wrapper does not block, and it works without an async plugin.
+    """
+    from .aio import AsyncContainer
+    return AsyncContainer(container)
+
+
+@pytest.fixture()
+def async_db_manager(request, db_manager) -> "AsyncDBManager":
+    """an AsyncDBManager wrapping the `db_manager` fixture. You may pass "concurrency" argument in pytest.mark.prestest
+    to limit the number of tables created or queries run at the same time.
+    """
+    from .aio import AsyncDBManager
+
+    concurrency = get_prestest_params(request, "concurrency", None)
+    return AsyncDBManager(db_manager) if concurrency is None else AsyncDBManager(db_manager, concurrency)
 
 
 @pytest.fixture()
-def create_temporary_table(request, db_manager, container) -> str:
+def create_temporary_table(request, db_manager) -> str:
     """create temporary table in container that gets cleaned up after test. You may pass the following param in
     pytest.mark.prestest:
 
     - table_name: string. name of the table, for example: sandbox.test_table
     - query: string. hive query used to create the table. You may have a string placeholder: table_name in it.
     - file: string or PosixPath. path to local file used to insert to the temporary file
+    - location: string or PosixPath. instead of `file`, a folder in the fixture folder mounted by `start_container`.
+      The table is created as an EXTERNAL table reading the folder without copying it. See
+      `DBManager.create_external_table`.
+    - memoize: boolean. reuse the table if it was created from the same query and file, and keep it after test. Only
+      use it for tables the test doesn't modify.
+
+    The table is dropped in background after test, see `prestest.teardown`.
 
     :return: created table name
     """
     table_name = get_prestest_params(request, "table_name", None)
     query = get_prestest_params(request, "query", None)
     file = get_prestest_params(request, "file", None)
-    if table_name is None or query is None or file is None:
+    location = get_prestest_params(request, "location", None)
+    memoize = get_prestest_params(request, "memoize", False)
+    if table_name is None or query is None or (file is None and location is None):
         raise PrestestException("table_name or query or file is missing from closest mark")
 
     query = query.format(table_name = table_name)
-    db_manager.create_table(table=table_name, query=query, file=Path(file))
+    if location is not None:
+        db_manager.create_external_table(table=table_name, query=query, folder=location)
+    else:
+        db_manager.create_table(table=table_name, query=query, file=Path(file), memoize=memoize)
     yield table_name
-    db_manager.drop_table(table_name)
+    if memoize:
+        return
+    teardown = get_teardown(request)
+    if teardown is None:
+        db_manager.drop_table(table_name)
+    else:
+        teardown.drop_table(db_manager, table_name)
+
+
+@pytest.fixture()
+def temporary_database(request, db_manager) -> str:
+    """create a database with a unique name used by the test only. It is dropped with all its tables in background
+    after test, see `prestest.teardown`.
+
+    :return: name of the database
+    """
+    schema = f"{TEMPORARY_DATABASE_PREFIX}_{uuid.uuid4().hex[:12]}"
+    db_manager.create_database(schema)
+    yield schema
+    teardown = get_teardown(request)
+    if teardown is None:
+        db_manager.drop_database(schema)
+    else:
+        teardown.drop_database(db_manager, schema)
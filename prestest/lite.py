@@ -0,0 +1,372 @@
+"""an in-process backend with the interface of DBManager. Tables live in an in-memory sqlite database, hive DDL is
+translated to sqlite tables and presto queries are transpiled with sqlglot (`pip install prestest[lite]`). It needs no
+containers, so tests checking SQL logic run in milliseconds. Hive or presto specific behaviour is not emulated.
+"""
+import csv
+import logging
+import re
+import sqlite3
+import threading
+from pathlib import Path, PosixPath
+from typing import Dict, Iterator, List, Optional, Union
+
+import pandas as pd
+
+from .backend import Backend
+from .columnar import create_table_query
+from .partitions import PARTITIONED_BY, Partitions, is_partitioned, partition_files
+from .utils import partitioned_table_fingerprint, table_fingerprint
+
+CREATE_TABLE = re.compile(r"^\s*CREATE\s+(?:EXTERNAL\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?([`\w]+\.[`\w]+)\s*\(",
+                          re.IGNORECASE)
+
+CREATE_DATABASE = re.compile(r"^\s*CREATE\s+(?:DATABASE|SCHEMA)\s+(?:IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?\s*$",
+                             re.IGNORECASE)
+
+DROP_DATABASE = re.compile(r"^\s*DROP\s+(?:DATABASE|SCHEMA)\s+(?:IF\s+EXISTS\s+)?`?(\w+)`?(?:\s+CASCADE)?\s*$",
+                           re.IGNORECASE)
+
+FIELDS_TERMINATED_BY = re.compile(r"\bFIELDS\s+TERMINATED\s+BY\s+'((?:\\.|[^'])*)'", re.IGNORECASE)
+
+HIVE_TYPES = {
+    "TINYINT": "INTEGER",
+    "SMALLINT": "INTEGER",
+    "INT": "INTEGER",
+    "INTEGER": "INTEGER",
+    "BIGINT": "INTEGER",
+    "BOOLEAN": "BOOLEAN",
+    "FLOAT": "REAL",
+    "DOUBLE": "REAL",
+    "DECIMAL": "REAL",
+}
+
+HIVE_NULL = "\\N"
+
+HIVE_DELIMITER = "\x01"
+
+
+class LiteTable:
+    """columns of a table parsed from hive DDL. `columns` is a list of (name, sqlite type), partition columns last."""
+    def __init__(self, table: str, columns: List[tuple], delimiter: str=HIVE_DELIMITER):
+        self.table = table
+        self.columns = columns
+        self.delimiter = delimiter
+
+    def ddl(self) -> str:
+        columns = ", ".join(f'"{name}" {column_type}' for name, column_type in self.columns)
+        return f"CREATE TABLE {quote(self.table)} ({columns})"
+
+    def convert(self, values: List[str]) -> tuple:
+        """convert fields of one line of a delimited file. Missing fields and \\N are NULL like in hive."""
+        values = list(values[:len(self.columns)]) + [None] * (len(self.columns) - len(values))
+        return tuple(_convert(value, column_type) for value, (_, column_type) in zip(values, self.columns))
+
+
+def parse_create_table(query: str) -> Optional[LiteTable]:
+    """parse hive CREATE TABLE statement. return None if `query` doesn't create a table.
+
+    :param query: a hive query
+    :return: a LiteTable
+    """
+    match = CREATE_TABLE.match(query)
+    if match is None:
+        return None
+    table = match.group(1).replace("`", "")
+    body, rest = _enclosed(query, match.end())
+    columns = _parse_columns(body)
+
+    partitioned = PARTITIONED_BY.search(rest)
+    if partitioned:
+        partitions, _ = _enclosed(rest, partitioned.end())
+        columns += _parse_columns(partitions)
+
+    delimiter = FIELDS_TERMINATED_BY.search(rest)
+    delimiter = delimiter.group(1).encode().decode("unicode_escape") if delimiter else HIVE_DELIMITER
+    return LiteTable(table, columns, delimiter)
+
+
+def transpile(query: str, read: str="presto") -> str:
+    """translate `query` from presto or hive dialect to sqlite with sqlglot.
+
+    :param query: a query
+    :param read: dialect of `query`, 'presto' or 'hive'
+    :return: translated query
+    """
+    try:
+        import sqlglot
+    except ImportError:
+        raise ImportError("sqlglot is required to run presto and hive queries on sqlite. pip install prestest[lite]")
+    statements = sqlglot.transpile(query, read=read, write="sqlite")
+    if len(statements) != 1:
+        raise ValueError(f"expect one statement. got {len(statements)}: {query}")
+    return statements[0]
+
+
+def quote(table: str) -> str:
+    return ".".join(f'"{part}"' for part in table.split("."))
+
+
+class LiteDBManager(Backend):
+    """a backend on an in-memory sqlite database. Each schema is an attached in-memory database, so tables keep their
+    'schema.table' names. See `prestest.backend.Backend` and DBManager for the methods.
+    """
+    def __init__(self, docker_folder=None, namespace=None):
+        self.container = None
+        self.connection = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.schemas = set()
+        self.tables = {}  # logical table name -> LiteTable
+        self.fingerprints = {}
+
+    def warm_up(self, connections: int=0):
+        pass
+
+    def execute(self, query: str, parameters=()) -> sqlite3.Cursor:
+        with self.lock:
+            return self.connection.execute(query, parameters)
+
+    def create_database(self, schema: str):
+        with self.lock:
+            if schema.lower() not in self.schemas:
+                self.execute("ATTACH DATABASE ':memory:' AS " + f'"{schema}"')
+                self.schemas.add(schema.lower())
+
+    def drop_database(self, schema: str, cascade: bool=True):
+        with self.lock:
+            if schema.lower() in self.schemas:
+                self.execute(f'DETACH DATABASE "{schema}"')
+                self.schemas.discard(schema.lower())
+                for table in [t for t in self.tables if t.split(".")[0].lower() == schema.lower()]:
+                    self.tables.pop(table)
+                    self.fingerprints.pop(table, None)
+
+    def create_table(self, table: str, query: str, file: Union[PosixPath, str], memoize: bool=False) -> bool:
+        schema, _ = table.split(".")
+        self.create_database(schema)
+        return self._create_table(table, query, file, memoize)
+
+    def _create_table(self, table: str, query: str, file: Union[PosixPath, str], memoize: bool=False) -> bool:
+        fingerprint = table_fingerprint(query, file) if memoize else None
+        if memoize and self.fingerprints.get(table) == fingerprint:
+            return False
+
+        self.drop_table(table)
+        lite_table = self._create(query)
+        self._insert(lite_table, [name for name, _ in lite_table.columns], self._read(lite_table, [file]))
+        if fingerprint is not None:
+            self.fingerprints[table] = fingerprint
+        return True
+
+    def create_partitioned_table(self, table: str, query: str, partitions: Partitions, register: str="add",
+                                 memoize: bool=False, concurrency: int=None) -> bool:
+        """partition values are appended to the rows of their files. `register` and `concurrency` are ignored."""
+        files = partition_files(partitions)
+        schema, _ = table.split(".")
+        self.create_database(schema)
+        fingerprint = partitioned_table_fingerprint(query, files) if memoize else None
+        if memoize and self.fingerprints.get(table) == fingerprint:
+            return False
+
+        self.drop_table(table)
+        lite_table = self._create(query)
+        rows = [row for spec, group in files for row in self._read(lite_table, group, spec)]
+        self._insert(lite_table, [name for name, _ in lite_table.columns], rows)
+        if fingerprint is not None:
+            self.fingerprints[table] = fingerprint
+        return True
+
+    def create_external_table(self, table: str, query: str, folder: Union[PosixPath, str], mount=None):
+        """files of `folder` are read into the table. Nothing is mounted, relative folders are resolved against `mount`
+        if provided, the current directory otherwise.
+        """
+        folder = mount.host_folder / folder if mount is not None else Path(folder)
+        if is_partitioned(query):
+            self.create_partitioned_table(table, query, folder)
+            return
+        schema, _ = table.split(".")
+        self.create_database(schema)
+        self.drop_table(table)
+        lite_table = self._create(query)
+        files = sorted(f for f in folder.iterdir() if f.is_file() and not f.name.startswith((".", "_")))
+        self._insert(lite_table, [name for name, _ in lite_table.columns], self._read(lite_table, files))
+
+    def create_table_from_dataframe(self, table: str, df: pd.DataFrame, format: str="parquet",
+                                    partition_by: List[str]=None, compression: str="snappy"):
+        schema, _ = table.split(".")
+        self.create_database(schema)
+        self.drop_table(table)
+        lite_table = self._create(create_table_query(table, df, format, partition_by))
+        names = [name for name, _ in lite_table.columns]
+        rows = [tuple(_python_value(value) for value in row) for row in df[names].itertuples(index=False)]
+        self._insert(lite_table, names, rows)
+
+    def get_table_fingerprint(self, table: str) -> Optional[str]:
+        return self.fingerprints.get(table)
+
+    def drop_table(self, table: str):
+        schema, _ = table.split(".")
+        if schema.lower() in self.schemas:
+            self.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+        self.tables.pop(table, None)
+        self.fingerprints.pop(table, None)
+
+    def read_sql(self, query: str, columnar: bool=False) -> pd.DataFrame:
+        """see `DBManager.read_sql`. `columnar` is accepted for compatibility and ignored, sqlite results are always
+        read through pandas.
+        """
+        with self.lock:
+            return pd.read_sql(transpile(query), con=self.connection)
+
+    def read_arrow(self, query: str):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("pyarrow is required to fetch results as arrow tables. pip install pyarrow")
+        return pa.Table.from_pandas(self.read_sql(query), preserve_index=False)
+
+    def iter_sql(self, query: str, batch_rows: int=100000, arrow: bool=False) -> Iterator[pd.DataFrame]:
+        if batch_rows <= 0:
+            raise ValueError(f"batch_rows must be positive. got {batch_rows}")
+        query = transpile(query)
+        with self.lock:
+            cursor = self.connection.execute(query)
+            names = [column[0] for column in cursor.description]
+        try:
+            while True:
+                # the lock is only held while a batch is fetched, so other queries run between batches
+                with self.lock:
+                    rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                batch = pd.DataFrame.from_records(rows, columns=names)
+                yield self._arrow(batch) if arrow else batch
+        finally:
+            with self.lock:
+                cursor.close()
+
+    def run_hive_query(self, query: str):
+        self.fetch_hive_query(query)
+
+    def fetch_hive_query(self, query: str) -> List[tuple]:
+        """execute a hive query. CREATE TABLE, CREATE DATABASE and DROP DATABASE are translated here, other
+        statements are transpiled from hive dialect.
+        """
+        database = CREATE_DATABASE.match(query)
+        if database:
+            self.create_database(database.group(1))
+            return []
+        database = DROP_DATABASE.match(query)
+        if database:
+            self.drop_database(database.group(1))
+            return []
+        if parse_create_table(query) is not None:
+            self._create(query)
+            return []
+        return [tuple(row) for row in self.execute(transpile(query, read="hive")).fetchall()]
+
+    def _create(self, query: str) -> LiteTable:
+        lite_table = parse_create_table(query)
+        schema, _ = lite_table.table.split(".")
+        self.create_database(schema)
+        self.execute(lite_table.ddl())
+        self.tables[lite_table.table] = lite_table
+        logging.debug(f"created lite table {lite_table.table}")
+        return lite_table
+
+    @staticmethod
+    def _read(lite_table: LiteTable, files: List[Union[PosixPath, str]], spec: Dict[str, str]=None) -> List[tuple]:
+        """read rows of delimited `files`. Values of partition `spec` are appended to every row."""
+        spec = spec or {}
+        data_columns = len(lite_table.columns) - len(spec)
+        rows = []
+        for file in files:
+            with open(file, newline="") as f:
+                for line in csv.reader(f, delimiter=lite_table.delimiter, quoting=csv.QUOTE_NONE):
+                    if spec:
+                        line = line[:data_columns] + [None] * (data_columns - len(line)) + list(spec.values())
+                    rows.append(lite_table.convert(line))
+        return rows
+
+    def _insert(self, lite_table: LiteTable, names: List[str], rows: List[tuple]):
+        columns = ", ".join(f'"{name}"' for name in names)
+        placeholders = ", ".join("?" for _ in names)
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany(f"INSERT INTO {quote(lite_table.table)} ({columns}) "
+                                            f"VALUES ({placeholders})", rows)
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    @staticmethod
+    def _arrow(df: pd.DataFrame):
+        import pyarrow as pa
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _enclosed(text: str, start: int) -> tuple:
+    """return text between the opening parenthesis before `start` and its closing parenthesis, and the rest"""
+    depth = 1
+    for i in range(start, len(text)):
+        if text[i] == "(":
+            depth += 1
+        elif text[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return text[start:i], text[i + 1:]
+    raise ValueError(f"unbalanced parenthesis in {text}")
+
+
+def _parse_columns(body: str) -> List[tuple]:
+    columns, depth, quoted, current = [], 0, None, ""
+    for char in body + ",":
+        if quoted:
+            quoted = None if char == quoted else quoted
+        elif char in "'\"":
+            quoted = char
+        elif char in "(<":
+            depth += 1
+        elif char in ")>":
+            depth -= 1
+        if char == "," and depth == 0 and not quoted:
+            if current.strip():
+                name, hive_type = current.split()[:2]
+                base_type = re.split(r"[(<]", hive_type)[0].upper()
+                columns.append((name.strip("`"), HIVE_TYPES.get(base_type, "TEXT")))
+            current = ""
+        else:
+            current += char
+    return columns
+
+
+def _convert(value: Optional[str], column_type: str):
+    if value is None or value == HIVE_NULL:
+        return None
+    if column_type == "TEXT":
+        return value
+    value = value.strip()
+    try:
+        if column_type == "INTEGER":
+            return int(value)
+        if column_type == "REAL":
+            return float(value)
+        if column_type == "BOOLEAN":
+            return {"true": 1, "false": 0}[value.lower()]
+    except (KeyError, ValueError):
+        # hive reads malformed values as NULL
+        return None
+    return value
+
+
+def _python_value(value):
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat(sep=" ")
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
@@ -0,0 +1,69 @@
+"""an inter-process lock based on a lock file, used to coordinate pytest-xdist workers sharing one cluster
+"""
+import fcntl
+import os
+import time
+from pathlib import Path, PosixPath
+from typing import Union
+
+
+class FileLock:
+    """an exclusive lock held on `path`. Processes (and threads using different FileLock objects) acquiring the same
+    path wait for each other. The lock is released when the holder exits, even if it crashes.
+
+    :example:
+    >>> with FileLock("/tmp/prestest/cluster.lock"):
+    ...     # only one process runs this block at a time
+    """
+    def __init__(self, path: Union[PosixPath, str], timeout: float=None, poll_interval: float=0.1):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def acquire(self):
+        """wait until the lock is acquired. raise TimeoutError if it cannot be acquired in `timeout` seconds.
+
+        :return: None
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if deadline is None else fcntl.LOCK_NB))
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    os.close(fd)
+                    raise TimeoutError(f"cannot acquire lock {self.path} in {self.timeout} seconds")
+                time.sleep(self.poll_interval)
+        self._fd = fd
+
+    def try_acquire(self) -> bool:
+        """acquire the lock if it is free, without waiting.
+
+        :return: whether the lock was acquired
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
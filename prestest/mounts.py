@@ -0,0 +1,97 @@
+"""bind-mount a host fixture folder into the stack. Tables are then created as EXTERNAL tables located on the mount, so
+fixture data is read where it is instead of being copied into hive-server and again into the warehouse. Dropping such
+a table only removes its metadata.
+"""
+import json
+import re
+from pathlib import Path, PosixPath, PurePosixPath
+from typing import Union
+
+from .catalog import COMPOSE_VERSION
+from .compose import SERVICES
+
+FIXTURE_MOUNT = PurePosixPath("/prestest/fixtures")
+
+# the metastore checks table locations, hive server and presto read the files
+MOUNT_SERVICES = ("hive-metastore", "hive-server", "presto_coordinator")
+
+OVERRIDE_FILE = "docker-compose.mounts.json"
+
+CREATE_TABLE = re.compile(r"^\s*CREATE\s+(?:EXTERNAL\s+)?TABLE\b", re.IGNORECASE)
+
+LOCATION = re.compile(r"\bLOCATION\s+'", re.IGNORECASE)
+
+TBLPROPERTIES = re.compile(r"\bTBLPROPERTIES\s*\(", re.IGNORECASE)
+
+
+class FixtureMount:
+    """host folder `host_folder` mounted read only at `target` in the containers of MOUNT_SERVICES. Files must be
+    readable by the users of hive and presto in the containers.
+    """
+    def __init__(self, host_folder: Union[PosixPath, str], target: Union[PurePosixPath, str]=FIXTURE_MOUNT):
+        self.host_folder = Path(host_folder).resolve()
+        self.target = PurePosixPath(target)
+
+    def location(self, folder: Union[PosixPath, str]) -> str:
+        """return the location of host `folder` in the containers, such as 'file:///prestest/fixtures/events'.
+
+        :param folder: a folder in the mounted folder, absolute or relative to it.
+        :return: a file uri
+        """
+        path = (self.host_folder / folder).resolve()
+        try:
+            relative = path.relative_to(self.host_folder)
+        except ValueError:
+            raise ValueError(f"{folder} is not in the mounted folder {self.host_folder}")
+        if not path.is_dir():
+            raise ValueError(f"table location {path} must be an existing folder")
+        return f"file://{self.target.joinpath(*relative.parts)}"
+
+    def write(self, folder: Union[PosixPath, str], compose_file: Union[PosixPath, str]) -> bool:
+        """write a compose override mounting the host folder into the containers in `folder`. The file is not written
+        again if its content didn't change.
+
+        :param folder: a host folder
+        :param compose_file: the compose file the override is merged into. The override uses the same version.
+        :return: whether the file changed
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        version = COMPOSE_VERSION.search(Path(compose_file).read_text()) if Path(compose_file).exists() else None
+
+        volume = f"{self.host_folder}:{self.target}:ro"
+        override = {"services": {SERVICES[component]: {"volumes": [volume]} for component in MOUNT_SERVICES}}
+        if version:
+            override = dict(version=version.group(1), **override)
+
+        file = folder / OVERRIDE_FILE
+        content = json.dumps(override, indent=2)
+        if file.exists() and file.read_text() == content:
+            return False
+        file.write_text(content)
+        return True
+
+    def __eq__(self, other):
+        return isinstance(other, FixtureMount) and (self.host_folder, self.target) == (other.host_folder, other.target)
+
+    def __repr__(self):
+        return f"FixtureMount({self.host_folder}, {self.target})"
+
+
+def external_table_query(query: str, location: str) -> str:
+    """turn hive CREATE TABLE statement `query` into one creating an EXTERNAL table at `location`.
+
+    :param query: a query used to create hive table, without LOCATION clause.
+    :param location: location of the table, see `FixtureMount.location`
+    :return: a CREATE EXTERNAL TABLE query
+    """
+    if not CREATE_TABLE.match(query):
+        raise ValueError(f"expect a CREATE TABLE statement. got {query}")
+    if LOCATION.search(query):
+        raise ValueError(f"query must not have LOCATION clause. got {query}")
+
+    query = CREATE_TABLE.sub("CREATE EXTERNAL TABLE", query.strip().rstrip(";"), count=1)
+    properties = TBLPROPERTIES.search(query)
+    if properties:
+        return f"{query[:properties.start()]}LOCATION '{location}'\n{query[properties.start():]}"
+    return f"{query}\nLOCATION '{location}'"
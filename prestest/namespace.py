@@ -0,0 +1,91 @@
+"""map schema names used by tests to per-worker schema names so that pytest-xdist workers don't collide
+"""
+import os
+import re
+import threading
+from typing import Optional, Set
+
+from .cache import STRING_LITERAL
+
+CREATE_DATABASE = re.compile(r"\bCREATE\s+(?:DATABASE|SCHEMA)\s+(?:IF\s+NOT\s+EXISTS\s+)?([A-Za-z_]\w*)",
+                             re.IGNORECASE)
+
+DATABASE_STATEMENT = re.compile(r"\b(DATABASE|SCHEMA)(\s+IF\s+(?:NOT\s+)?EXISTS)?\s+([A-Za-z_]\w*)\b", re.IGNORECASE)
+
+
+def worker_id() -> Optional[str]:
+    """return the pytest-xdist worker id of current process, such as 'gw0'. None if not running under xdist."""
+    return os.environ.get("PYTEST_XDIST_WORKER")
+
+
+class Namespace:
+    """translate logical schema names to physical schema names by appending `suffix`. Tests keep using logical names
+    such as 'sandbox.my_table', and every query sent to hive or presto is rewritten to, for example,
+    'sandbox_gw0.my_table'. Only schemas registered by `register` (or created through a rewritten CREATE DATABASE
+    statement) are translated, so system schemas are left untouched. Without suffix, names are not changed.
+    """
+    def __init__(self, suffix: Optional[str]=None):
+        self.suffix = suffix
+        self.schemas = set()  # type: Set[str]
+        self._lock = threading.Lock()
+
+    def register(self, schema: str):
+        with self._lock:
+            self.schemas.add(schema.lower())
+
+    def schema(self, schema: str) -> str:
+        """return physical name of `schema`."""
+        return f"{schema}_{self.suffix}" if self.suffix else schema
+
+    def table(self, table: str) -> str:
+        """return physical name of `table` given as 'schema.table'."""
+        schema, name = table.split(".")
+        return f"{self.schema(schema)}.{name}"
+
+    def rewrite(self, query: str) -> str:
+        """replace registered logical schema names in `query` with physical names. Schemas created in the query are
+        registered first. String literals are left untouched.
+
+        :param query: a hive or presto query
+        :return: rewritten query
+        """
+        if not self.suffix:
+            return query
+
+        parts, end = [], 0
+        for literal in STRING_LITERAL.finditer(query):
+            parts.extend([query[end:literal.start()], literal.group(0)])
+            end = literal.end()
+        parts.append(query[end:])
+        code = parts[::2]
+
+        for schema in (schema for part in code for schema in CREATE_DATABASE.findall(part)):
+            self.register(schema)
+
+        with self._lock:
+            schemas = sorted(self.schemas, key=len, reverse=True)
+        if not schemas:
+            return query
+
+        names = re.compile(rf"(?<![\w`\"])({'|'.join(re.escape(schema) for schema in schemas)})(?=\.[\w`\"])",
+                           re.IGNORECASE)
+
+        def physical_database(match):
+            if match.group(3).lower() not in self.schemas:
+                return match.group(0)
+            return match.group(0)[:match.start(3) - match.start(0)] + self.schema(match.group(3))
+
+        parts[::2] = [DATABASE_STATEMENT.sub(physical_database, names.sub(lambda m: self.schema(m.group(1)), part))
+                      for part in code]
+        return "".join(parts)
+
+
+_NAMESPACE = None
+
+
+def get_namespace() -> Namespace:
+    """return the Namespace of current process. Under pytest-xdist, the suffix is the worker id."""
+    global _NAMESPACE
+    if _NAMESPACE is None:
+        _NAMESPACE = Namespace(worker_id())
+    return _NAMESPACE
@@ -0,0 +1,116 @@
+"""describe the files of partitioned tables and register their partitions in bulk. Partitioned fixtures are given as a
+directory tree in hive layout (`ds=2020-01-01/country=us/file.csv`) or as a mapping from partition spec to files.
+"""
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path, PosixPath
+from typing import Dict, List, Mapping, Tuple, Union
+from urllib.parse import unquote
+
+from .columnar import partition_clause, string_literal
+
+# partitions added by one ALTER TABLE statement. larger batches may exceed limits of the metastore
+PARTITION_BATCH = 500
+
+UPLOAD_CONCURRENCY = 8
+
+REGISTER_METHODS = ("add", "msck")
+
+PARTITIONED_BY = re.compile(r"\bPARTITIONED\s+BY\s*\(", re.IGNORECASE)
+
+# characters escaped by hive in partition folder names, see org.apache.hadoop.hive.common.FileUtils
+ESCAPED_CHARS = re.compile(r"[\x00-\x1f\"#%'*/:=?\\\x7f{\[\]^]")
+
+Partitions = Union[PosixPath, str, Mapping[Union[str, tuple], Union[PosixPath, str, List[Union[PosixPath, str]]]]]
+
+
+def escape_path_name(value: str) -> str:
+    """escape `value` the way hive does in the folder name of a partition"""
+    return ESCAPED_CHARS.sub(lambda match: f"%{ord(match.group(0)):02X}", value)
+
+
+def parse_partition_path(path: str) -> Dict[str, str]:
+    """parse a relative partition folder such as 'ds=2020-01-01/country=us' into its spec.
+
+    :param path: partition folder in hive layout
+    :return: an ordered dictionary from partition column to value
+    """
+    spec = OrderedDict()
+    for part in Path(path).parts:
+        column, separator, value = part.partition("=")
+        if not separator or not column:
+            raise ValueError(f"expect partition folders named 'column=value'. got '{part}' in {path}")
+        spec[unquote(column)] = unquote(value)
+    return spec
+
+
+def partition_path(spec: Dict[str, str]) -> str:
+    """return the folder of partition `spec` relative to the table location, such as 'ds=2020-01-01/country=us'"""
+    return "/".join(f"{escape_path_name(column)}={escape_path_name(str(value))}" for column, value in spec.items())
+
+
+def is_partitioned(query: str) -> bool:
+    """return whether hive CREATE TABLE statement `query` creates a partitioned table"""
+    return PARTITIONED_BY.search(query) is not None
+
+
+def partition_files(partitions: Partitions) -> List[Tuple[Dict[str, str], List[Path]]]:
+    """list the partitions of a fixture and their files, sorted by partition folder.
+
+    :example:
+    >>> partition_files("fixtures/events")  # fixtures/events/ds=2020-01-01/part-0.csv, ...
+    >>> partition_files({"ds=2020-01-01": "day_1.csv", (("ds", "2020-01-02"),): ["day_2a.csv", "day_2b.csv"]})
+
+    :param partitions: a folder whose sub folders are named 'column=value', one level per partition column. Files
+      whose name starts with '.' or '_' are ignored like in hive. Or a mapping from partition spec to a file or a list
+      of files. A spec is a relative partition folder, or a tuple of (column, value) pairs in the order of the
+      partition columns.
+    :return: a list of tuples of partition spec and files
+    """
+    if isinstance(partitions, Mapping):
+        specs = OrderedDict()
+        for spec, files in partitions.items():
+            spec = parse_partition_path(spec) if isinstance(spec, str) else OrderedDict(
+                (str(column), str(value)) for column, value in dict(spec).items())
+            files = [files] if isinstance(files, (str, PosixPath)) else files
+            specs.setdefault(partition_path(spec), (spec, []))[1].extend(Path(file) for file in files)
+    else:
+        root = Path(partitions)
+        if not root.is_dir():
+            raise ValueError(f"{root} is not a folder")
+        specs = OrderedDict()
+        for folder, folders, files in os.walk(str(root)):
+            folders[:] = sorted(f for f in folders if not f.startswith((".", "_")))
+            files = sorted(f for f in files if not f.startswith((".", "_")))
+            if not files:
+                continue
+            relative = Path(folder).relative_to(root)
+            if relative == Path("."):
+                raise ValueError(f"files in {root} must be in partition folders. got {files}")
+            spec = parse_partition_path(str(relative))
+            specs[partition_path(spec)] = (spec, [Path(folder) / f for f in files])
+
+    if not specs:
+        raise ValueError(f"no partition file found in {partitions}")
+    columns = {tuple(spec) for spec, _ in specs.values()}
+    if len(columns) > 1:
+        raise ValueError(f"partitions must have the same columns in the same order. got {sorted(columns)}")
+    return [specs[path] for path in sorted(specs)]
+
+
+def add_partition_queries(table: str, partitions: List[Tuple[Dict[str, str], str]],
+                          batch: int=PARTITION_BATCH) -> List[str]:
+    """build ALTER TABLE statements adding `partitions` to `table`, `batch` partitions per statement.
+
+    :param table: name of the table. for example, 'sandbox.my_table'
+    :param partitions: a list of tuples of partition spec and location
+    :param batch: maximum number of partitions added by one statement
+    :return: a list of queries
+    """
+    queries = []
+    for start in range(0, len(partitions), batch):
+        clauses = "".join(f"{partition_clause(spec)} LOCATION {string_literal(location)}"
+                          for spec, location in partitions[start:start + batch])
+        queries.append(f"ALTER TABLE {table} ADD IF NOT EXISTS{clauses}")
+    return queries
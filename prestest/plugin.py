@@ -0,0 +1,121 @@
+"""pytest plugin providing prestest fixtures, command line options and a report of where prestest spends time. It is
+registered through the `pytest11` entry point when prestest is installed. Run pytest with `--prestest-durations=N` to
+print the N slowest phases and tests, or with `--prestest-trace=FILE` to export all spans. `--prestest-backend=lite`
+runs `db_manager` fixtures in memory. `--prestest-pool=N` gives every test its own stack out of N stacks.
+`--prestest-cache` caches presto results read by `db_manager` fixtures and reports hits at the end of the session.
+Temporary tables and databases are dropped in background and failed drops are reported at the end of the session.
+When `prestest serve` is running for the docker folder, fixtures use its warm stack, connections and tables unless
+`--prestest-no-daemon` is set.
+"""
+import pytest
+
+from .fixtures import (async_container, async_db_manager, cluster_lease, cluster_manager,  # noqa: F401
+                       cluster_pool, container, create_temporary_table, db_manager, start_container,
+                       temporary_database, warm_engines)
+from .fixtures import is_cache_enabled
+from .timing import get_recorder
+
+TRACE_FORMATS = ["chrome", "json"]
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("prestest")
+    group.addoption("--prestest-durations", action="store", type=int, default=None, metavar="N",
+                    help="show N slowest prestest phases and tests (N=0 for all).")
+    group.addoption("--prestest-trace", action="store", default=None, metavar="FILE",
+                    help="write timing spans of prestest operations to FILE.")
+    group.addoption("--prestest-trace-format", action="store", default="chrome", choices=TRACE_FORMATS,
+                    help="format of --prestest-trace file: chrome trace events (default) or a json list of spans.")
+    group.addoption("--prestest-backend", action="store", default=None, choices=["docker", "lite"],
+                    help="backend of db_manager fixture: hive and presto containers (default) or in-memory sqlite.")
+    group.addoption("--prestest-pool", action="store", type=int, default=None, metavar="N",
+                    help="start N independent stacks and lease one to each test using containers.")
+    group.addoption("--prestest-pool-snapshot", action="store", default=None, metavar="NAME",
+                    help="restore stacks returned to the pool from snapshot NAME before leasing them again.")
+    group.addoption("--prestest-cache", action="store_true", default=False,
+                    help="cache results of read_sql in db_manager fixtures until the tables they read change.")
+    group.addoption("--prestest-cache-dir", action="store", default=None, metavar="DIR",
+                    help="also keep cached results in parquet files in DIR, reused by later sessions. "
+                         "implies --prestest-cache.")
+    group.addoption("--prestest-sync-teardown", action="store_true", default=False,
+                    help="drop temporary tables and databases at the end of each test instead of in background.")
+    group.addoption("--prestest-no-daemon", action="store_true", default=False,
+                    help="don't send queries to a running `prestest serve` daemon.")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "prestest(**kwargs): configure prestest fixtures of the test, such as "
+                                       "container_folder, reset, table_name or backend. See prestest fixtures.")
+    if config.getoption("prestest_durations") is not None or config.getoption("prestest_trace") is not None:
+        get_recorder().clear()
+        get_recorder().enable()
+    if config.getoption("prestest_cache_dir") is not None:
+        from .cache import configure
+        configure(folder=config.getoption("prestest_cache_dir"))
+
+
+def pytest_unconfigure(config):
+    get_recorder().disable()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    recorder = get_recorder()
+    recorder.test = item.nodeid
+    try:
+        yield
+    finally:
+        recorder.test = None
+
+
+def pytest_sessionfinish(session):
+    from .teardown import get_teardown_queue
+    queue = get_teardown_queue()
+    queue.drop_recorded_databases()
+    queue.flush()
+
+    trace = session.config.getoption("prestest_trace")
+    if trace is None:
+        return
+    recorder = get_recorder()
+    if session.config.getoption("prestest_trace_format") == "json":
+        recorder.export_json(trace)
+    else:
+        recorder.export_chrome_trace(trace)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    from .teardown import get_teardown_queue
+    errors = get_teardown_queue().errors
+    if errors:
+        terminalreporter.write_sep("=", "prestest teardown failures")
+        for error in errors:
+            terminalreporter.write_line(str(error))
+
+    if is_cache_enabled(config):
+        from .cache import get_result_cache
+        stats = get_result_cache().stats
+        terminalreporter.write_sep("=", "prestest result cache")
+        terminalreporter.write_line(f"{stats.hits} hits ({stats.disk_hits} from disk), {stats.misses} misses, "
+                                    f"{stats.evictions} evictions, {stats.saved:.2f}s of queries saved")
+
+    durations = config.getoption("prestest_durations")
+    if durations is None:
+        return
+    recorder = get_recorder()
+    limit = durations or None
+
+    terminalreporter.write_sep("=", "slowest prestest phases")
+    phases = recorder.summary(limit)
+    if not phases:
+        terminalreporter.write_line("no prestest operations were recorded.")
+        return
+    for phase in phases:
+        terminalreporter.write_line(f"{phase['total']:10.2f}s total {phase['count']:6d} calls "
+                                    f"{phase['max']:8.2f}s max  {phase['name']}")
+
+    tests = sorted(recorder.by_test().items(), key=lambda item: item[1], reverse=True)[:limit]
+    if tests:
+        terminalreporter.write_sep("-", "prestest time per test")
+        for test, total in tests:
+            terminalreporter.write_line(f"{total:10.2f}s  {test}")
@@ -0,0 +1,198 @@
+"""a pool of independent hive/presto stacks started from one docker folder. Tests, or pytest-xdist workers, lease a
+stack for exclusive use and return it when they finish, so they neither share tables nor wait for each other.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path, PosixPath
+from typing import List, Set, Union
+
+from .cluster import STATE_FOLDER, ClusterManager
+from .container import Container
+from .lock import FileLock
+
+POOL_PREFIX = "prestest"
+
+PORT_STRIDE = 100
+
+LEASE_POLL_INTERVAL = 0.5
+
+
+class ClusterLease:
+    """a stack of a ClusterPool held by the caller until it is released. Use it as a context manager to release it at
+    exit.
+    """
+    def __init__(self, pool: "ClusterPool", index: int, lock: FileLock):
+        self.pool = pool
+        self.index = index
+        self.lock = lock
+        self.manager = pool.managers[index]
+        self.released = False
+
+    @property
+    def container(self) -> Container:
+        return self.manager.container
+
+    def db_manager(self, namespace=None) -> "DBManager":
+        """return a DBManager of the leased stack.
+
+        :param namespace: see `prestest.db.DBManager`
+        :return: a DBManager
+        """
+        from .db import DBManager
+        return DBManager.from_container(self.container, namespace)
+
+    def release(self):
+        """return the stack to the pool. See `ClusterPool.release`
+
+        :return: None
+        """
+        self.pool.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def __repr__(self):
+        return f"ClusterLease({self.container.project})"
+
+
+class ClusterPool:
+    """`size` stacks of `docker_folder`, each in its own compose project `<prefix>-<i>` with host ports shifted by
+    `port_stride * (i + 1)`, so that they run side by side with the default stack. Leases are file locks in
+    `state_folder`, so pools created by different processes with the same arguments hand out each stack to one holder
+    at a time.
+
+    A returned stack is recycled in a background thread before it can be leased again: restored from snapshot
+    `snapshot` if given, otherwise reset to factory state if `reset` is True, otherwise returned as is.
+
+    :example:
+    >>> pool = ClusterPool(docker_folder, size=4, snapshot="fixtures")
+    >>> pool.start()
+    >>> with pool.lease() as lease:
+    ...     lease.db_manager().read_sql("SELECT * FROM sandbox.my_table")
+    """
+    def __init__(self, docker_folder: Union[PosixPath, str], size: int, prefix: str=POOL_PREFIX,
+                 port_stride: int=PORT_STRIDE, snapshot: str=None, reset: bool=False,
+                 state_folder: Union[PosixPath, str]=STATE_FOLDER):
+        if size <= 0:
+            raise ValueError(f"size must be positive. got {size}")
+        self.docker_folder = Path(docker_folder).resolve()
+        self.size = size
+        self.snapshot = snapshot
+        self.reset = reset
+        self.state_folder = Path(state_folder)
+        self.managers = [ClusterManager(Container(self.docker_folder, project=f"{prefix}-{i}",
+                                                  port_offset=port_stride * (i + 1)), state_folder)
+                         for i in range(size)]
+        key = hashlib.sha1(f"{self.docker_folder}\0{prefix}".encode()).hexdigest()
+        self._lease_files = [self.state_folder / f"{key}-{i}.lease" for i in range(size)]
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="prestest-pool")
+        self._recycling = set()  # type: Set[Future]
+        self._lock = threading.Lock()
+
+    @property
+    def containers(self) -> List[Container]:
+        return [manager.container for manager in self.managers]
+
+    def start(self, until_started=True) -> List[bool]:
+        """start every stack of the pool at the same time. Stacks already running are attached to.
+
+        :param until_started: wait until all containers of every stack are healthy.
+        :return: whether each stack was (re)started
+        """
+        futures = [self._executor.submit(manager.ensure_started, until_started) for manager in self.managers]
+        return [future.result() for future in futures]
+
+    def lease(self, timeout: float=None, poll_interval: float=LEASE_POLL_INTERVAL) -> ClusterLease:
+        """hold a free stack, waiting until one is returned if all are leased or being recycled. The stack is started
+        if it is not running.
+
+        :param timeout: seconds to wait for a free stack. raise TimeoutError if none is free in time. wait without
+          limit if None.
+        :param poll_interval: seconds between attempts.
+        :return: a ClusterLease
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # start from a different stack in every process so that concurrent workers rarely try the same lock
+        first = os.getpid() % self.size
+        while True:
+            for index in [(first + i) % self.size for i in range(self.size)]:
+                lock = FileLock(self._lease_files[index])
+                if lock.try_acquire():
+                    lease = ClusterLease(self, index, lock)
+                    try:
+                        lease.manager.ensure_started(until_started=True)
+                    except Exception:
+                        lock.release()
+                        raise
+                    logging.debug(f"leased {lease}")
+                    return lease
+
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"no stack of {self.docker_folder} was free in {timeout} seconds")
+            time.sleep(poll_interval)
+
+    def release(self, lease: ClusterLease):
+        """return a leased stack. It is recycled in the background and can be leased again once recycled. Releasing a
+        lease twice has no effect.
+
+        :param lease: a ClusterLease returned by `lease`
+        :return: None
+        """
+        with self._lock:
+            if lease.released:
+                return
+            lease.released = True
+
+        if self.snapshot is None and not self.reset:
+            lease.lock.release()
+            return
+
+        future = self._executor.submit(self._recycle, lease)
+        with self._lock:
+            self._recycling.add(future)
+        future.add_done_callback(self._forget)
+
+    def wait(self, timeout: float=None):
+        """wait until every returned stack is recycled.
+
+        :param timeout: seconds to wait. wait without limit if None.
+        :return: None
+        """
+        with self._lock:
+            pending = list(self._recycling)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for future in pending:
+            future.exception(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+    def close(self):
+        """wait for recycling stacks and stop the background threads. Stacks are left running so later sessions can
+        attach to them.
+
+        :return: None
+        """
+        self.wait()
+        self._executor.shutdown(wait=True)
+
+    def _recycle(self, lease: ClusterLease):
+        try:
+            if self.snapshot is not None:
+                lease.manager.restore(self.snapshot)
+            else:
+                lease.manager.reset()
+        except Exception as e:
+            # the next holder starts the stack again
+            logging.warning(f"failed to recycle {lease}. {e}")
+            lease.manager.invalidate()
+        finally:
+            lease.lock.release()
+
+    def _forget(self, future: Future):
+        with self._lock:
+            self._recycling.discard(future)
@@ -0,0 +1,246 @@
+"""fetch presto query results through the statement protocol and decode them into typed columns
+"""
+import getpass
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+INTEGER_TYPES = {"tinyint", "smallint", "integer", "bigint"}
+
+FLOAT_TYPES = {"real", "double"}
+
+TEMPORAL_TYPES = {"date": "datetime64[D]", "timestamp": "datetime64[ms]"}
+
+
+class PrestoError(Exception):
+    def __init__(self, msg, error: dict=None):
+        super(PrestoError, self).__init__(msg)
+        self.error = error or {}
+
+
+class Page:
+    """one response of the statement protocol holding `columns` (list of dict with name and type) and `rows`."""
+    def __init__(self, columns: List[dict], rows: List[list]):
+        self.columns = columns
+        self.rows = rows
+
+
+class StatementClient:
+    """a minimal client of the presto statement protocol. A query is posted to /v1/statement and result pages are
+    fetched by following `nextUri`. While a page is decoded, the next one is fetched in a background thread; at most
+    `prefetch` pages are buffered so memory stays bounded.
+    """
+    def __init__(self, url: str, user: str=None, catalog: str="hive", schema: str="default", prefetch: int=1,
+                 request_timeout: float=60, session: requests.Session=None):
+        self.url = url.rstrip("/")
+        self.headers = {"X-Presto-User": user or getpass.getuser(), "X-Presto-Catalog": catalog,
+                        "X-Presto-Schema": schema}
+        self.prefetch = prefetch
+        self.request_timeout = request_timeout
+        self.session = session or requests.Session()
+
+    def pages(self, query: str) -> Iterator[Page]:
+        """execute `query` and yield result pages. If the generator is closed before the query finishes, the query is
+        cancelled on the server.
+
+        :param query: a presto query
+        :return: an iterator of Page
+        """
+        buffer = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        fetcher = threading.Thread(target=self._fetch, args=(query, buffer, stop), daemon=True,
+                                   name="prestest-presto-fetch")
+        fetcher.start()
+        try:
+            while True:
+                item = buffer.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # unblock the fetcher if it waits for room in the buffer
+            while fetcher.is_alive():
+                try:
+                    buffer.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def _fetch(self, query: str, buffer: queue.Queue, stop: threading.Event):
+        next_uri, columns_sent = None, False
+        try:
+            response = self._request("POST", f"{self.url}/v1/statement", data=query.encode("utf-8"))
+            while True:
+                next_uri = response.get("nextUri")
+                if "error" in response:
+                    error = response["error"]
+                    raise PrestoError(f"{error.get('errorName')}: {error.get('message')}", error)
+                # the first page with columns is always sent so that empty results keep their columns
+                if response.get("data") or (response.get("columns") and not columns_sent):
+                    columns_sent = True
+                    page = Page(response["columns"], response.get("data", []))
+                    while not stop.is_set():
+                        try:
+                            buffer.put(page, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                if next_uri is None or stop.is_set():
+                    break
+                response = self._request("GET", next_uri)
+
+            if stop.is_set() and next_uri is not None:
+                self.cancel(next_uri)
+            buffer.put(None)
+        except Exception as e:
+            buffer.put(e)
+
+    def cancel(self, next_uri: str):
+        """cancel a running query given its next uri."""
+        try:
+            self.session.delete(next_uri, headers=self.headers, timeout=self.request_timeout)
+            logging.debug(f"cancelled presto query {next_uri}")
+        except requests.RequestException as e:
+            logging.warning(f"failed to cancel presto query {next_uri}. {e}")
+
+    def _request(self, method: str, url: str, data: bytes=None) -> dict:
+        delay = 0.05
+        while True:
+            response = self.session.request(method, url, data=data, headers=self.headers,
+                                            timeout=self.request_timeout)
+            # presto asks clients to retry when it is busy
+            if response.status_code != 503:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+
+        if response.status_code != 200:
+            raise PrestoError(f"unexpected status code {response.status_code}: {response.text}")
+        return response.json()
+
+
+def decode_column(values: List, presto_type: str):
+    """convert values of one column of a page into a typed array. Integers and booleans with nulls become pandas
+    nullable arrays, floats use NaN and strings stay objects.
+
+    :param values: decoded json values of the column
+    :param presto_type: presto type name, such as 'bigint' or 'varchar(10)'
+    :return: a numpy array or pandas extension array
+    """
+    base_type = presto_type.split("(")[0].lower()
+    if base_type in INTEGER_TYPES or base_type == "boolean":
+        dtype = np.int64 if base_type != "boolean" else np.bool_
+        mask = np.fromiter((v is None for v in values), dtype=np.bool_, count=len(values))
+        data = np.fromiter((v if v is not None else 0 for v in values), dtype=dtype, count=len(values))
+        if not mask.any():
+            return data
+        return pd.arrays.IntegerArray(data, mask) if base_type != "boolean" else pd.arrays.BooleanArray(data, mask)
+    if base_type in FLOAT_TYPES:
+        return np.fromiter((v if v is not None else np.nan for v in values), dtype=np.float64, count=len(values))
+    if base_type in TEMPORAL_TYPES:
+        return np.array(values, dtype=TEMPORAL_TYPES[base_type])
+
+    data = np.empty(len(values), dtype=object)
+    try:
+        data[:] = values
+    except ValueError:
+        # nested values such as arrays cannot be broadcast
+        for i, value in enumerate(values):
+            data[i] = value
+    return data
+
+
+def decode_page(page: Page) -> Dict[str, "np.ndarray"]:
+    """transpose rows of `page` and decode each column. see `decode_column`"""
+    columns = list(zip(*page.rows)) if page.rows else [() for _ in page.columns]
+    return {column["name"]: decode_column(list(values), column["type"])
+            for column, values in zip(page.columns, columns)}
+
+
+def concat_columns(chunks: List[Dict[str, "np.ndarray"]], columns: List[str]) -> Dict[str, "np.ndarray"]:
+    result = {}
+    for name in columns:
+        arrays = [chunk[name] for chunk in chunks]
+        if len(arrays) == 1:
+            result[name] = arrays[0]
+        elif any(isinstance(a, pd.api.extensions.ExtensionArray) for a in arrays):
+            result[name] = pd.concat([pd.Series(a) for a in arrays], ignore_index=True).array
+        else:
+            result[name] = np.concatenate(arrays)
+    return result
+
+
+def to_arrow(columns: Dict[str, "np.ndarray"]):
+    """build a pyarrow Table from decoded columns. Requires pyarrow."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("pyarrow is required to fetch presto results as arrow tables. pip install pyarrow")
+
+    return pa.table({name: pa.array(values, from_pandas=True) for name, values in columns.items()})
+
+
+def fetch_columns(client: StatementClient, query: str) -> Tuple[List[str], Dict[str, "np.ndarray"]]:
+    """execute `query` and return column names and decoded columns of the whole result."""
+    names, chunks = None, []
+    for page in client.pages(query):
+        names = names or [c["name"] for c in page.columns]
+        chunks.append(decode_page(page))
+
+    if names is None:
+        return [], {}
+    return names, concat_columns(chunks, names)
+
+
+def iter_batches(client: StatementClient, query: str,
+                 batch_rows: int) -> Iterator[Tuple[List[str], Dict[str, "np.ndarray"]]]:
+    """execute `query` and yield decoded columns in batches of `batch_rows` rows (the last batch may be smaller). At
+    most one batch plus the pages needed to fill it are held in memory. Closing the iterator early cancels the query.
+
+    :param client: a StatementClient
+    :param query: a presto query
+    :param batch_rows: number of rows in each batch
+    :return: an iterator of tuples of column names and decoded columns
+    """
+    if batch_rows <= 0:
+        raise ValueError(f"batch_rows must be positive. got {batch_rows}")
+
+    pages = client.pages(query)
+    names, pending, pending_rows = None, [], 0
+    try:
+        for page in pages:
+            names = names or [c["name"] for c in page.columns]
+            if not page.rows:
+                continue
+            pending.append(decode_page(page))
+            pending_rows += len(page.rows)
+            while pending_rows >= batch_rows:
+                merged = concat_columns(pending, names)
+                pending_rows -= batch_rows
+                pending = [{name: merged[name][batch_rows:].copy() for name in names}] if pending_rows else []
+                yield names, {name: merged[name][:batch_rows] for name in names}
+
+        if pending_rows:
+            yield names, concat_columns(pending, names)
+    finally:
+        pages.close()
+
+
+def fetch_dataframe(client: StatementClient, query: str) -> pd.DataFrame:
+    """execute `query` and return the result as a DataFrame built directly from typed columns."""
+    names, columns = fetch_columns(client, query)
+    return pd.DataFrame({name: columns[name] for name in names}, columns=names)
+
+
+def fetch_arrow(client: StatementClient, query: str):
+    """execute `query` and return the result as a pyarrow Table."""
+    _, columns = fetch_columns(client, query)
+    return to_arrow(columns)
@@ -0,0 +1,161 @@
+"""wait until presto and HiveServer2 answer queries. Containers reported healthy by docker may still be loading
+catalogs or waiting for the metastore, so `Container.start` also waits for every service probe to pass. Probes run in
+parallel with exponential backoff plus jitter, and a passed probe is remembered until the stack is started, stopped or
+reset again.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable
+
+from .state import WaitPolicy
+from .timing import span
+
+READY_POLICY = WaitPolicy(timeout=120, initial_delay=0.25, max_delay=4, backoff=2, jitter=0.5)
+
+PROBE_TIMEOUT = 5
+
+MIN_WORKERS = 1
+
+ACTIVE_WORKERS = "SELECT count(*) FROM system.runtime.nodes WHERE state = 'active'"
+
+
+class NotReady(Exception):
+    def __init__(self, msg):
+        super(NotReady, self).__init__(msg)
+
+
+def probe_presto(url: str, min_workers: int=MIN_WORKERS, timeout: float=PROBE_TIMEOUT):
+    """raise NotReady unless the presto coordinator at `url` finished starting and has at least `min_workers` active
+    nodes. Connection errors are raised as they are.
+
+    :param url: http url of the coordinator, for example 'http://localhost:8080'
+    :param min_workers: minimum number of active nodes. The coordinator counts as a node.
+    :param timeout: seconds to wait for each http request
+    :return: None
+    """
+    import requests
+    from .presto import StatementClient
+
+    response = requests.get(f"{url.rstrip('/')}/v1/info", timeout=timeout)
+    if response.status_code != 200 or response.json().get("starting", False):
+        raise NotReady(f"presto at {url} is starting")
+
+    client = StatementClient(url, request_timeout=timeout)
+    rows = [row for page in client.pages(ACTIVE_WORKERS) for row in page.rows]
+    workers = rows[0][0] if rows else 0
+    if workers < min_workers:
+        raise NotReady(f"{workers} of {min_workers} presto nodes are active")
+
+
+def probe_hive(url: str):
+    """raise an exception unless HiveServer2 at `url` answers a query reading the metastore.
+
+    :param url: sqlalchemy url of HiveServer2, for example 'hive://localhost:10000'
+    :return: None
+    """
+    from .engines import get_engine
+
+    with get_engine(url).connect() as connection:
+        connection.exec_driver_sql("SHOW DATABASES").fetchall()
+
+
+class Readiness:
+    """readiness of the services of one stack. `probes` maps a service name to a function raising an exception while
+    the service is not ready. See `get_readiness` for the probes of presto and HiveServer2.
+    """
+    def __init__(self, probes: Dict[str, Callable[[], None]], policy: WaitPolicy=READY_POLICY):
+        self.probes = dict(probes)
+        self.policy = policy
+        self.ready = set()
+        self.errors = {}  # type: Dict[str, Exception]
+        self._lock = threading.Lock()
+
+    def is_ready(self, services: Iterable[str]=None) -> bool:
+        """return whether `services` (all services if None) passed their probe since the last `invalidate`. No probe is
+        run.
+        """
+        return set(self.probes if services is None else services) <= self.ready
+
+    def check(self, service: str) -> bool:
+        """run the probe of `service` once.
+
+        :param service: name of the service, such as 'presto'
+        :return: whether the probe passed
+        """
+        try:
+            self.probes[service]()
+        except Exception as e:
+            with self._lock:
+                self.errors[service] = e
+            return False
+
+        with self._lock:
+            self.ready.add(service)
+            self.errors.pop(service, None)
+        return True
+
+    def wait(self, services: Iterable[str]=None, policy: WaitPolicy=None) -> bool:
+        """wait until `services` are ready, probing all of them at the same time. Services already found ready return
+        immediately.
+
+        :param services: names of services. all services if None.
+        :param policy: timeout and backoff between attempts of each probe. Use `self.policy` if not provided.
+        :return: whether all services became ready before timeout.
+        """
+        pending = [s for s in (self.probes if services is None else services) if s not in self.ready]
+        if not pending:
+            return True
+
+        policy = policy or self.policy
+        deadline = time.monotonic() + policy.timeout
+        with span("readiness.wait", services=",".join(pending)):
+            with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="prestest-readiness") as executor:
+                results = list(executor.map(lambda s: self._wait(s, policy, deadline), pending))
+
+        for service, ready in zip(pending, results):
+            if not ready:
+                logging.warning(f"{service} is not ready. {self.errors.get(service)}")
+        return all(results)
+
+    def invalidate(self, services: Iterable[str]=None):
+        """forget that `services` (all services if None) were ready, for example because the stack was restarted.
+
+        :return: None
+        """
+        with self._lock:
+            self.ready -= set(self.probes if services is None else services)
+
+    def _wait(self, service: str, policy: WaitPolicy, deadline: float) -> bool:
+        delays = policy.delays()
+        while not self.check(service):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(next(delays), remaining))
+        return True
+
+
+_READINESS = {}  # type: Dict[tuple, Readiness]
+_LOCK = threading.Lock()
+
+
+def get_readiness(presto_http_url: str, hive_url: str, min_workers: int=MIN_WORKERS) -> Readiness:
+    """return the Readiness of the stack serving presto at `presto_http_url` and HiveServer2 at `hive_url`, shared by
+    the process. Its services are 'presto' and 'hive'.
+
+    :param presto_http_url: http url of the presto coordinator
+    :param hive_url: sqlalchemy url of HiveServer2
+    :param min_workers: minimum number of active presto nodes
+    :return: a Readiness
+    """
+    key = (presto_http_url, hive_url, min_workers)
+    with _LOCK:
+        if key not in _READINESS:
+            _READINESS[key] = Readiness({
+                "presto": lambda: probe_presto(presto_http_url, min_workers),
+                "hive": lambda: probe_hive(hive_url),
+            })
+        return _READINESS[key]
+
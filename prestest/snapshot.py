@@ -0,0 +1,152 @@
+"""store warehouse snapshots (HDFS data and metastore database) taken from the containers
+"""
+import json
+import logging
+import shutil
+import tarfile
+import tempfile
+import time
+from pathlib import Path, PosixPath, PurePosixPath
+from typing import Dict, List, Union
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+SNAPSHOT_PATHS = {
+    "namenode": ["/hadoop/dfs/name"],
+    "datanode": ["/hadoop/dfs/data"],
+    "hive-metastore-postgresql": ["/var/lib/postgresql/data"],
+}
+
+MANIFEST = "manifest.json"
+
+ARTIFACT_SUFFIX = f".prestest-snapshot-v{SNAPSHOT_FORMAT_VERSION}.tar.gz"
+
+
+class SnapshotError(Exception):
+    def __init__(self, msg):
+        super(SnapshotError, self).__init__(msg)
+
+
+class SnapshotStore:
+    """a folder of named snapshots. Each snapshot is a folder holding one tarball per captured container path and a
+    manifest describing them.
+    """
+    def __init__(self, folder: Union[PosixPath, str]):
+        self.folder = Path(folder)
+
+    def path(self, name: str) -> Path:
+        return self.folder / name
+
+    def exists(self, name: str) -> bool:
+        return (self.path(name) / MANIFEST).exists()
+
+    def names(self) -> List[str]:
+        """return names of all snapshots in the store."""
+        if not self.folder.exists():
+            return []
+        return sorted(p.parent.name for p in self.folder.glob(f"*/{MANIFEST}"))
+
+    def manifest(self, name: str) -> dict:
+        """return the manifest of snapshot `name`. raise SnapshotError if it doesn't exist or has unsupported format.
+
+        :param name: name of the snapshot
+        :return: manifest as a dictionary
+        """
+        if not self.exists(name):
+            raise SnapshotError(f"snapshot {name} does not exist in {self.folder}")
+        manifest = json.loads((self.path(name) / MANIFEST).read_text())
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise SnapshotError(f"snapshot {name} has format version {manifest.get('format_version')}. "
+                                f"expect {SNAPSHOT_FORMAT_VERSION}")
+        return manifest
+
+    def write(self, name: str, archives: Dict[str, Dict[str, "Iterable[bytes]"]], images: Dict[str, str]):
+        """write a snapshot from tar streams. The snapshot replaces the existing one with the same name only after all
+        streams are written.
+
+        :param name: name of the snapshot
+        :param archives: a dictionary from component to a dictionary from container path to tar chunks
+        :param images: a dictionary from component to image id the snapshot is taken from
+        :return: None
+        """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=f".{name}-", dir=self.folder))
+        try:
+            entries = []
+            for component, paths in archives.items():
+                for container_path, chunks in paths.items():
+                    file = f"{component}{container_path.replace('/', '_')}.tar"
+                    with open(staging / file, "wb") as f:
+                        for chunk in chunks:
+                            f.write(chunk)
+                    entries.append({"component": component, "path": container_path, "file": file})
+
+            manifest = {"format_version": SNAPSHOT_FORMAT_VERSION, "name": name, "created_at": time.time(),
+                        "images": images, "archives": entries}
+            (staging / MANIFEST).write_text(json.dumps(manifest, indent=2))
+            self.delete(name)
+            staging.rename(self.path(name))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def delete(self, name: str):
+        shutil.rmtree(self.path(name), ignore_errors=True)
+
+    def export(self, name: str, target_folder: Union[PosixPath, str]) -> Path:
+        """pack snapshot `name` into a versioned artifact that can be imported with `load`.
+
+        :param name: name of the snapshot
+        :param target_folder: folder the artifact is written to
+        :return: path to the artifact
+        """
+        self.manifest(name)
+        artifact = Path(target_folder) / f"{name}{ARTIFACT_SUFFIX}"
+        with tarfile.open(artifact, "w:gz") as tar:
+            tar.add(str(self.path(name)), arcname=name)
+        return artifact
+
+    def load(self, artifact: Union[PosixPath, str], name: str=None) -> str:
+        """import an artifact created by `export`.
+
+        :param artifact: path to the artifact
+        :param name: name of the imported snapshot. Use the name it was exported with if not provided.
+        :return: name of the imported snapshot
+        """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=".import-", dir=self.folder))
+        try:
+            with tarfile.open(artifact, "r:gz") as tar:
+                members = [m for m in tar.getmembers() if m.isfile() or m.isdir()]
+                roots = {Path(m.name).parts[0] for m in members}
+                if len(roots) != 1 or not all(_is_inside(staging, m.name) for m in members):
+                    raise SnapshotError(f"{artifact} is not a prestest snapshot")
+                if hasattr(tarfile, "data_filter"):
+                    tar.extractall(staging, members=members, filter="data")
+                else:
+                    tar.extractall(staging, members=members)
+
+            exported_name = roots.pop()
+            name = name or exported_name
+            imported = SnapshotStore(staging)
+            manifest = imported.manifest(exported_name)
+            manifest["name"] = name
+            (imported.path(exported_name) / MANIFEST).write_text(json.dumps(manifest, indent=2))
+            self.delete(name)
+            imported.path(exported_name).rename(self.path(name))
+            logging.debug(f"imported snapshot {name} from {artifact}")
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        return name
+
+
+def _is_inside(folder: Path, name: str) -> bool:
+    """return whether archive member `name` is extracted inside `folder`"""
+    path = PurePosixPath(name)
+    if path.is_absolute() or ".." in path.parts:
+        return False
+    try:
+        (folder / path).resolve().relative_to(folder.resolve())
+    except ValueError:
+        return False
+    return True
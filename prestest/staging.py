@@ -0,0 +1,209 @@
+"""content addressed staging area for files uploaded to containers. Each distinct file is uploaded once per session
+and reused by every table loaded from it.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path, PosixPath, PurePosixPath
+from typing import Dict, List, Set, Union
+
+from .utils import file_digest
+
+STAGING_BUDGET = 2 * 1024 ** 3  # bytes
+
+STAGING_ROOT = PurePosixPath("/tmp")
+
+_AREAS = {}  # type: Dict[tuple, StagingArea]
+_LOCK = threading.Lock()
+
+
+class StagingEntry:
+    def __init__(self, path: PurePosixPath, size: int, container_id: str=None):
+        self.path = path
+        self.size = size
+        self.container_id = container_id
+        self.references = 0
+
+
+class StagingArea:
+    """files staged in a folder of one container, named after the sha256 of their content. Staged files are reference
+    counted while in use. Unused files are kept for later uploads of the same content, and removed in least recently
+    used order once staged files exceed `budget` bytes.
+
+    Staged files are forgotten when the container is recreated, which docker reports as a new container id.
+    """
+    def __init__(self, container: "Container", container_name: str, budget: int=None):
+        self.container = container
+        self.container_name = container_name
+        self.budget = budget if budget is not None else STAGING_BUDGET
+        # one folder per process so that concurrent sessions never evict files of each other
+        self.folder = STAGING_ROOT / f"prestest-staging-{os.getpid()}"
+        self.files = OrderedDict()  # type: OrderedDict[str, StagingEntry]
+        self.lock = threading.Lock()
+        self.uploading = set()  # type: Set[str]
+        self._uploaded = threading.Condition(self.lock)
+        self.uploads = 0
+
+    @property
+    def size(self) -> int:
+        """total size of staged files in bytes"""
+        return sum(f.size for f in self.files.values())
+
+    def acquire(self, local_files: List[Union[PosixPath, str]]) -> List[PurePosixPath]:
+        """stage `local_files` and return their paths in the container, in the same order. Files whose content is
+        already staged are not uploaded again; the rest are uploaded in one archive. Uploads run outside the lock, so
+        callers staging other files upload concurrently, and callers staging the same file wait for its upload. Every
+        returned path must be given back with `release`.
+
+        :param local_files: local files to stage
+        :return: list of paths in the container
+        """
+        keys = [file_digest(file) + "".join(Path(file).suffixes[-1:]) for file in local_files]
+        with self.lock:
+            # files uploaded by other callers are staged once their upload is done
+            self._uploaded.wait_for(lambda: self.uploading.isdisjoint(keys))
+            container_id = self._container_id()
+            stale = [key for key, staged in self.files.items() if staged.container_id != container_id]
+            for key in stale:
+                logging.debug(f"forget staged file {key} of recreated container {self.container_name}")
+                del self.files[key]
+
+            missing = {key: file for key, file in zip(keys, local_files) if key not in self.files}
+            self.uploading.update(missing)
+            # reference staged files now so that they are not evicted during the upload
+            self._reference([key for key in keys if key not in missing])
+
+        try:
+            if missing:
+                self.container.put_files({f"{self.folder.name}/{key}": file for key, file in missing.items()},
+                                         self.folder.parent, self.container_name)
+        except Exception:
+            with self.lock:
+                self.uploading.difference_update(missing)
+                for key in keys:
+                    if key not in missing and key in self.files:
+                        self.files[key].references -= 1
+                self._uploaded.notify_all()
+            raise
+
+        with self.lock:
+            if missing:
+                self.uploads += 1
+            for key, file in missing.items():
+                self.files[key] = StagingEntry(self.folder / key, os.path.getsize(file), container_id)
+            self._reference([key for key in keys if key in missing])
+            self.uploading.difference_update(missing)
+            self._uploaded.notify_all()
+
+        return [self.folder / key for key in keys]
+
+    def release(self, paths: List[PurePosixPath]):
+        """give back paths returned by `acquire`, then evict unused files if staged files exceed the budget. A file is
+        most recently used when it is released.
+
+        :param paths: paths in the container
+        :return: None
+        """
+        with self.lock:
+            for path in paths:
+                staged = self.files.get(PurePosixPath(path).name)
+                if staged is not None:
+                    staged.references = max(staged.references - 1, 0)
+                    self.files.move_to_end(staged.path.name)
+            self._evict()
+
+    def clear(self):
+        """remove the staging folder from the container and forget all staged files"""
+        with self.lock:
+            if self.files:
+                self.container.delete(self.folder, self.container_name)
+            self.files.clear()
+
+    def _reference(self, keys: List[str]):
+        for key in keys:
+            self.files[key].references += 1
+            self.files.move_to_end(key)
+
+    def _evict(self):
+        size = self.size
+        evicted = []
+        for key, staged in self.files.items():
+            if size <= self.budget:
+                break
+            if staged.references == 0:
+                evicted.append(key)
+                size -= staged.size
+
+        if evicted:
+            self.container.execute_command(["rm", "-rf"] + [str(self.files[key].path) for key in evicted],
+                                           self.container_name)
+            for key in evicted:
+                del self.files[key]
+
+    def _container_id(self):
+        containers = self.container.state.containers().values()
+        return next((c.id for c in containers if c.name == self.container_name), None)
+
+
+class StagedFiles:
+    """a context manager staging `local_files` in a StagingArea. It returns their paths in the container, in the same
+    order as `local_files`, and releases them at exit.
+    """
+    def __init__(self, area: StagingArea, local_files: List[Union[PosixPath, str]]):
+        self.area = area
+        self.local_files = local_files
+        self.paths = []
+
+    def __enter__(self):
+        self.paths = self.area.acquire(self.local_files)
+        return self.paths
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.area.release(self.paths)
+
+
+class StagedFile(StagedFiles):
+    """same as StagedFiles but stages one file and returns its path in the container."""
+    def __init__(self, area: StagingArea, local_file: Union[PosixPath, str]):
+        super(StagedFile, self).__init__(area, [local_file])
+
+    def __enter__(self):
+        return super(StagedFile, self).__enter__()[0]
+
+
+def configure(budget: int):
+    """change the disk budget of staging areas in bytes, including existing ones.
+
+    :param budget: maximum size of unused staged files kept in each container
+    :return: None
+    """
+    global STAGING_BUDGET
+    STAGING_BUDGET = budget
+    with _LOCK:
+        for area in _AREAS.values():
+            area.budget = budget
+
+
+def get_staging_area(container: "Container", container_name: str) -> StagingArea:
+    """return the StagingArea shared by every Container connected to the same docker daemon.
+
+    :param container: a Container used to upload and remove files
+    :param container_name: name of the container files are staged in
+    :return: a StagingArea
+    """
+    key = (getattr(container.api_client, "base_url", None), container_name)
+    with _LOCK:
+        if key not in _AREAS:
+            _AREAS[key] = StagingArea(container, container_name)
+        return _AREAS[key]
+
+
+@atexit.register
+def _clear_all():
+    for area in list(_AREAS.values()):
+        try:
+            area.clear()
+        except Exception as e:
+            logging.debug(f"failed to clear staging area in {area.container_name}. {e}")
@@ -0,0 +1,256 @@
+"""track status and health of containers with a single list call kept current by docker events
+"""
+import logging
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from .compose import PROJECT_LABEL, SERVICE_LABEL, SERVICES
+
+STATE_TTL = 2.0
+
+HEALTH_PATTERN = re.compile(r"\((healthy|unhealthy|health: starting)\)")
+
+WATCHED_EVENTS = ["create", "start", "restart", "die", "stop", "destroy", "health_status"]
+
+
+class WaitPolicy:
+    """timeout and backoff used while waiting for containers. The n-th wait sleeps
+    `min(initial_delay * backoff ** n, max_delay)` seconds unless a docker event arrives earlier. With `jitter`, each
+    delay is scaled by a random factor between `1 - jitter` and `1 + jitter` so that concurrent waiters spread out.
+    """
+    def __init__(self, timeout: float=40, initial_delay: float=0.5, max_delay: float=3, backoff: float=2,
+                 jitter: float=0):
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+
+    def delays(self) -> Iterator[float]:
+        """generate delays between successive checks.
+
+        :return: an infinite iterator of delays in seconds
+        """
+        delay = self.initial_delay
+        while True:
+            yield min(delay, self.max_delay) * (1 + random.uniform(-self.jitter, self.jitter))
+            delay *= self.backoff
+
+
+class ContainerState:
+    """status of a single container. `status` is 'missing' if the container does not exist. `health` is None if the
+    container has no health check configured.
+    """
+    def __init__(self, component: str, name: str, container_id: str=None, status: str="missing",
+                 health: Optional[str]=None, image_id: str=None):
+        self.component = component
+        self.name = name
+        self.id = container_id
+        self.status = status
+        self.health = health
+        self.image_id = image_id
+
+    @property
+    def is_healthy(self) -> bool:
+        return self.status == "running" and self.health in (None, "healthy")
+
+    def __repr__(self):
+        return f"ContainerState({self.component}, status={self.status}, health={self.health})"
+
+
+class ClusterState:
+    """status and health of all containers of the stack. The state is filled by a single filtered list call and cached
+    for `ttl` seconds. Once `watch` is called, a background thread keeps the state current from the docker events
+    stream and the cache no longer expires. Containers are found by name, or by compose labels if `project` is given,
+    in which case `names` are only used for containers that don't exist yet.
+    """
+    def __init__(self, api_client, names: Dict[str, str], ttl: float=STATE_TTL, project: str=None):
+        self.api_client = api_client
+        self.names = dict(names)
+        self.ttl = ttl
+        self.project = project
+        self._components = {name: component for component, name in self.names.items()}
+        self._services = {service: component for component, service in SERVICES.items()}
+        self._containers = {}  # type: Dict[str, ContainerState]
+        self._refreshed_at = None
+        self._condition = threading.Condition(threading.RLock())
+        self._events = None
+        self._watcher = None
+
+    @property
+    def is_watching(self) -> bool:
+        return self._watcher is not None and self._watcher.is_alive()
+
+    def refresh(self):
+        """reload the state of all containers with one list call.
+
+        :return: None
+        """
+        listed = self.api_client.containers(all=True, filters=self._filters())
+        containers = {component: ContainerState(component, name) for component, name in self.names.items()}
+        for item in listed:
+            for name in item.get("Names", []):
+                name = name.lstrip("/")
+                component = self._component(name, item.get("Labels") or {})
+                if component is None:
+                    continue
+                health = HEALTH_PATTERN.search(item.get("Status", ""))
+                health = health.group(1).replace("health: ", "") if health else None
+                containers[component] = ContainerState(component, name, item["Id"], item["State"], health,
+                                                       item.get("ImageID"))
+
+        with self._condition:
+            self._containers = containers
+            self._refreshed_at = time.time()
+            self._condition.notify_all()
+
+    def invalidate(self):
+        """mark the cached state as stale so that the next read reloads it.
+
+        :return: None
+        """
+        with self._condition:
+            self._refreshed_at = None
+
+    def containers(self) -> Dict[str, ContainerState]:
+        """return the state of every component, reloading it if the cache expired.
+
+        :return: a dictionary from component to its ContainerState
+        """
+        with self._condition:
+            expired = self._refreshed_at is None or time.time() - self._refreshed_at > self.ttl
+            if expired and not (self.is_watching and self._refreshed_at is not None):
+                self.refresh()
+            return dict(self._containers)
+
+    def is_started(self) -> bool:
+        return all(c.status == "running" for c in self.containers().values())
+
+    def is_healthy(self) -> bool:
+        return all(c.is_healthy for c in self.containers().values())
+
+    def watch(self):
+        """start following docker events in a background thread. Calling it again while watching has no effect.
+
+        :return: None
+        """
+        with self._condition:
+            if self.is_watching:
+                return
+            filters = {"type": "container", "event": WATCHED_EVENTS}
+            filters.update(self._filters(events=True))
+            self._events = self.api_client.events(since=int(time.time()), decode=True, filters=filters)
+            self._watcher = threading.Thread(target=self._follow, args=(self._events,), daemon=True,
+                                             name="prestest-cluster-state")
+            self._watcher.start()
+            self.refresh()
+
+    def stop_watching(self):
+        """stop following docker events.
+
+        :return: None
+        """
+        with self._condition:
+            events, watcher = self._events, self._watcher
+            self._events, self._watcher = None, None
+            self._refreshed_at = None
+
+        if events is not None:
+            events.close()
+        if watcher is not None:
+            watcher.join(timeout=5)
+
+    def wait_until_healthy(self, policy: WaitPolicy=None) -> bool:
+        """block until every container is healthy. When events are watched, the call returns as soon as the last
+        health event arrives. Otherwise the state is reloaded following the backoff of `policy`.
+
+        :param policy: timeout and backoff while waiting. Use default WaitPolicy if not provided.
+        :return: whether all containers became healthy before timeout.
+        """
+        policy = policy or WaitPolicy()
+        deadline = time.monotonic() + policy.timeout
+        delays = policy.delays()
+        with self._condition:
+            while not self.is_healthy():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.debug(f"containers are not healthy: {list(self._containers.values())}")
+                    return False
+                notified = self._condition.wait(min(next(delays), remaining))
+                if not notified:
+                    self.refresh()
+
+        return True
+
+    def _follow(self, events):
+        try:
+            for event in events:
+                self._apply(event)
+        except Exception as e:
+            logging.debug(f"stopped following docker events. {e}")
+        finally:
+            with self._condition:
+                self._refreshed_at = None
+                self._condition.notify_all()
+
+    def _filters(self, events=False) -> dict:
+        if self.project is not None:
+            return {"label": [f"{PROJECT_LABEL}={self.project}"]}
+        return {"container" if events else "name": list(self.names.values())}
+
+    def _component(self, name: str, labels: dict) -> Optional[str]:
+        if self.project is None:
+            return self._components.get(name)
+        if labels.get(PROJECT_LABEL) != self.project:
+            return None
+        return self._services.get(labels.get(SERVICE_LABEL))
+
+    def _apply(self, event: dict):
+        attributes = event.get("Actor", {}).get("Attributes", {})
+        # events carry the labels of the container among its attributes
+        component = self._component(attributes.get("name"), attributes)
+        action = event.get("Action", event.get("status", ""))
+        if component is None:
+            return
+
+        with self._condition:
+            happened_at = event.get("timeNano", event.get("time", 0) * 1e9) / 1e9
+            if self._refreshed_at is not None and happened_at < self._refreshed_at - 1:
+                return
+            current = self._containers.get(component, ContainerState(component, attributes["name"]))
+            if action.startswith("health_status"):
+                current.health = action.split(":", 1)[1].strip()
+            elif action in ("start", "restart"):
+                # health check configuration is unknown for new containers. reload to pick it up
+                self.refresh()
+                return
+            elif action in ("die", "stop"):
+                current.status = "exited"
+            elif action == "destroy":
+                current = ContainerState(component, attributes["name"])
+            elif action == "create":
+                current = ContainerState(component, attributes["name"], event.get("id"), "created")
+
+            self._containers[component] = current
+            self._condition.notify_all()
+
+
+_STATES = {}  # type: Dict[tuple, ClusterState]
+
+
+def get_cluster_state(api_client, names: Dict[str, str], project: str=None) -> ClusterState:
+    """return the ClusterState shared by every client of the same docker daemon and set of containers.
+
+    :param api_client: a docker.APIClient
+    :param names: a dictionary from component to container name
+    :param project: compose project whose containers are found by label. Containers are found by name if None.
+    :return: a ClusterState
+    """
+    key = (getattr(api_client, "base_url", None), tuple(sorted(names.items())), project)
+    if key not in _STATES:
+        _STATES[key] = ClusterState(api_client, names, project=project)
+
+    return _STATES[key]
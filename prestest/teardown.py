@@ -0,0 +1,218 @@
+"""drop temporary tables and databases in a background thread, so that tests don't wait for hive to drop tables and
+delete their data. Drops queued while the thread is busy are run together as one batch: duplicates are dropped once and
+tables of a database dropped with CASCADE in the same batch are skipped. The queue is flushed at the end of the pytest
+session (and at exit), and failed drops are reported instead of failing the test which queued them. Per-worker
+databases created during the session, such as 'sandbox_gw0' under pytest-xdist, are dropped at the end of the session
+unless they hold memoized tables.
+"""
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Set, Tuple
+
+TEARDOWN_TIMEOUT = 300  # seconds to wait for queued drops at exit
+
+TABLE = "table"
+
+DATABASE = "database"
+
+
+class TeardownItem:
+    """a table or database queued to be dropped by `db_manager`. `target` is the lower case physical name used to find
+    conflicting operations, see `prestest.namespace.Namespace`.
+    """
+    def __init__(self, db_manager: "DBManager", kind: str, name: str):
+        self.db_manager = db_manager
+        self.kind = kind
+        self.name = name
+        self.scope = db_manager.container.compose.presto_http_url
+        namespace = db_manager.namespace
+        self.target = (namespace.table(name) if kind == TABLE else namespace.schema(name)).lower()
+
+    @property
+    def schema(self) -> str:
+        return self.target.split(".")[0]
+
+    def run(self):
+        if self.kind == TABLE:
+            self.db_manager.run_hive_query(f"""DROP TABLE IF EXISTS {self.name}""")
+        else:
+            self.db_manager.run_hive_query(f"""DROP DATABASE IF EXISTS {self.name} CASCADE""")
+
+    def __repr__(self):
+        return f"TeardownItem({self.kind} {self.name} at {self.scope})"
+
+
+class TeardownError:
+    """a drop which failed in the background"""
+    def __init__(self, item: TeardownItem, error: Exception):
+        self.item = item
+        self.error = error
+
+    def __str__(self):
+        return f"failed to drop {self.item.kind} {self.item.name} at {self.item.scope}. {self.error}"
+
+
+class TeardownQueue:
+    """tables and databases waiting to be dropped by a background thread, started at the first drop. `errors` keeps
+    every failed drop and `dropped` counts successful ones.
+
+    Creating a table or a database must not race with a queued drop of the same name, so DBManager calls `settle_table`
+    before dropping and creating a table and `settle_database` before creating a database.
+    """
+    def __init__(self):
+        self.pending = []  # type: List[TeardownItem]
+        self.running = []  # type: List[TeardownItem]
+        self.errors = []  # type: List[TeardownError]
+        self.dropped = 0
+        self.databases = OrderedDict()  # type: Dict[Tuple[str, str], TeardownItem]
+        self.kept = set()  # type: Set[Tuple[str, str]]
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def drop_table(self, db_manager: "DBManager", table: str):
+        """queue `table` to be dropped by `db_manager`.
+
+        :param db_manager: a DBManager
+        :param table: name of the table. for example, 'sandbox.my_table'
+        :return: None
+        """
+        self._put(TeardownItem(db_manager, TABLE, table))
+
+    def drop_database(self, db_manager: "DBManager", schema: str):
+        """queue database `schema` to be dropped with all its tables by `db_manager`.
+
+        :param db_manager: a DBManager
+        :param schema: name of the database
+        :return: None
+        """
+        self._put(TeardownItem(db_manager, DATABASE, schema))
+
+    def record_database(self, db_manager: "DBManager", schema: str):
+        """remember database `schema` created by `db_manager`, to be dropped by `drop_recorded_databases`. Only
+        databases with a namespace suffix belong to this session, others may be shared with other sessions and are not
+        recorded.
+
+        :param db_manager: a DBManager
+        :param schema: logical name of the database
+        :return: None
+        """
+        if db_manager.namespace.schema(schema) == schema:
+            return
+        item = TeardownItem(db_manager, DATABASE, schema)
+        with self._condition:
+            self.databases.setdefault((item.scope, item.target), item)
+
+    def keep_database(self, scope: str, schema: str):
+        """don't drop database `schema` in `drop_recorded_databases`, for example because it holds memoized tables.
+
+        :param scope: the stack, such as the url of its presto coordinator
+        :param schema: lower case physical name of the database
+        :return: None
+        """
+        with self._condition:
+            self.kept.add((scope, schema))
+
+    def drop_recorded_databases(self):
+        """queue drops of the databases recorded by `record_database`, except kept ones. Called at the end of the
+        pytest session by `prestest.plugin`.
+        """
+        with self._condition:
+            items = [item for key, item in self.databases.items() if key not in self.kept]
+            self.databases.clear()
+        for item in items:
+            self._put(item)
+
+    def settle_table(self, scope: str, table: str):
+        """forget queued drops of `table`, which is about to be dropped anyway, and wait for a running one.
+
+        :param scope: the stack, such as the url of its presto coordinator
+        :param table: lower case physical name of the table
+        :return: None
+        """
+        with self._condition:
+            self.pending = [item for item in self.pending
+                            if (item.scope, item.kind, item.target) != (scope, TABLE, table)]
+            self._condition.wait_for(lambda: not any(item.scope == scope and item.target == table
+                                                     for item in self.running))
+
+    def settle_database(self, scope: str, schema: str):
+        """wait until queued and running drops of database `schema` are done.
+
+        :param scope: the stack, such as the url of its presto coordinator
+        :param schema: lower case physical name of the database
+        :return: None
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not any(
+                (item.scope, item.kind, item.target) == (scope, DATABASE, schema)
+                for item in self.pending + self.running))
+
+    def flush(self, timeout: float=None) -> List[TeardownError]:
+        """wait until every queued drop is done.
+
+        :param timeout: seconds to wait. wait without limit if None.
+        :return: all failed drops so far
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: not self.pending and not self.running, timeout):
+                logging.warning(f"{len(self.pending) + len(self.running)} drops are not done in {timeout} seconds")
+            return list(self.errors)
+
+    def _put(self, item: TeardownItem):
+        with self._condition:
+            self.pending.append(item)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="prestest-teardown", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.pending)
+                self.running, self.pending = self._batch(self.pending), []
+                self._condition.notify_all()
+
+            for item in self.running:
+                try:
+                    item.run()
+                except Exception as e:
+                    logging.warning(f"failed to drop {item.kind} {item.name}. {e}")
+                    with self._condition:
+                        self.errors.append(TeardownError(item, e))
+                else:
+                    with self._condition:
+                        self.dropped += 1
+
+            with self._condition:
+                self.running = []
+                self._condition.notify_all()
+
+    @staticmethod
+    def _batch(items: List[TeardownItem]) -> List[TeardownItem]:
+        """remove duplicated drops and drops of tables in databases dropped by the same batch."""
+        databases = {(item.scope, item.target) for item in items if item.kind == DATABASE}
+        batch, seen = [], set()
+        for item in items:
+            key = (item.scope, item.kind, item.target)
+            if key in seen or (item.kind == TABLE and (item.scope, item.schema) in databases):
+                continue
+            seen.add(key)
+            batch.append(item)
+        return batch
+
+
+_QUEUE = None  # type: TeardownQueue
+_LOCK = threading.Lock()
+
+
+def get_teardown_queue() -> TeardownQueue:
+    """return the TeardownQueue of current process. It is flushed at exit."""
+    global _QUEUE
+    with _LOCK:
+        if _QUEUE is None:
+            _QUEUE = TeardownQueue()
+            atexit.register(_QUEUE.flush, TEARDOWN_TIMEOUT)
+        return _QUEUE
@@ -0,0 +1,174 @@
+"""record how long each phase of container and table operations takes. Spans are only recorded while the recorder is
+enabled, for example by the pytest plugin in `prestest.plugin`.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from pathlib import Path, PosixPath
+from typing import Callable, Dict, List, Union
+
+
+class Span:
+    """one timed phase. `start` and `end` are seconds from `time.perf_counter`, `test` is the node id of the test
+    running when the span started, if any.
+    """
+    def __init__(self, name: str, start: float, end: float, thread: int, test: str=None, attrs: dict=None):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.thread = thread
+        self.test = test
+        self.attrs = attrs or {}
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "start": self.start, "duration": self.duration, "thread": self.thread,
+                "test": self.test, "attrs": self.attrs}
+
+
+class Recorder:
+    """collect spans and pass each finished span to registered hooks."""
+    def __init__(self):
+        self.enabled = False
+        self.spans = []  # type: List[Span]
+        self.hooks = []  # type: List[Callable[[Span], None]]
+        self.test = None
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self.lock:
+            self.spans = []
+
+    def add_hook(self, hook: Callable[[Span], None]):
+        """call `hook` with every finished span. Hooks are called even if the recorder is disabled."""
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[Span], None]):
+        self.hooks.remove(hook)
+
+    def span(self, name: str, **attrs) -> "SpanContext":
+        """return a context manager timing the code it wraps.
+
+        :example:
+        >>> with get_recorder().span("db.load_data", table="sandbox.my_table"):
+        ...     load_table()
+
+        :param name: name of the phase, such as 'container.start'
+        :param attrs: extra information stored with the span
+        :return: a context manager
+        """
+        return SpanContext(self, name, attrs)
+
+    def record(self, span: Span):
+        if self.enabled:
+            with self.lock:
+                self.spans.append(span)
+        for hook in list(self.hooks):
+            hook(span)
+
+    def summary(self, limit: int=None) -> List[dict]:
+        """aggregate spans by name, sorted by total time in decreasing order.
+
+        :param limit: number of phases returned. return all phases if None.
+        :return: list of dictionaries with keys "name", "count", "total" and "max"
+        """
+        phases = {}  # type: Dict[str, dict]
+        for span in self.spans:
+            phase = phases.setdefault(span.name, {"name": span.name, "count": 0, "total": 0.0, "max": 0.0})
+            phase["count"] += 1
+            phase["total"] += span.duration
+            phase["max"] = max(phase["max"], span.duration)
+        return sorted(phases.values(), key=lambda p: p["total"], reverse=True)[:limit]
+
+    def by_test(self) -> Dict[str, float]:
+        """return total time of outermost spans of each test. Nested spans are not counted twice."""
+        totals = {}
+        for span in self._outermost():
+            if span.test is not None:
+                totals[span.test] = totals.get(span.test, 0.0) + span.duration
+        return totals
+
+    def export_json(self, file: Union[PosixPath, str]):
+        """write all spans into `file` as a json list."""
+        Path(file).write_text(json.dumps([span.to_dict() for span in self.spans], indent=2))
+
+    def export_chrome_trace(self, file: Union[PosixPath, str]):
+        """write all spans into `file` in chrome trace event format, which can be opened in chrome://tracing or
+        perfetto.
+        """
+        origin = min((span.start for span in self.spans), default=0)
+        events = [{"name": span.name, "cat": "prestest", "ph": "X", "pid": os.getpid(), "tid": span.thread,
+                   "ts": (span.start - origin) * 1e6, "dur": span.duration * 1e6,
+                   "args": dict(span.attrs, test=span.test)}
+                  for span in self.spans]
+        Path(file).write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+    def _outermost(self) -> List[Span]:
+        result = []
+        ends = {}
+        for span in sorted(self.spans, key=lambda s: (s.start, -s.end)):
+            if span.end <= ends.get(span.thread, float("-inf")):
+                continue
+            ends[span.thread] = span.end
+            result.append(span)
+        return result
+
+
+class SpanContext:
+    def __init__(self, recorder: Recorder, name: str, attrs: dict):
+        self.recorder = recorder
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.recorder.record(Span(self.name, self.start, time.perf_counter(), threading.get_ident(),
+                                  self.recorder.test, self.attrs))
+
+
+_RECORDER = Recorder()
+
+
+def get_recorder() -> Recorder:
+    """return the Recorder shared by the process."""
+    return _RECORDER
+
+
+def span(name: str, **attrs) -> SpanContext:
+    """time a phase with the shared Recorder. See `Recorder.span`"""
+    return _RECORDER.span(name, **attrs)
+
+
+def timed(name: str):
+    """decorator recording a span named `name` for every call of the decorated function. It costs a single attribute
+    check when the shared Recorder is disabled and has no hooks.
+
+    :param name: name of the phase
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not (_RECORDER.enabled or _RECORDER.hooks):
+                return function(*args, **kwargs)
+            with _RECORDER.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
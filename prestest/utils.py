@@ -1,7 +1,12 @@
-from _pytest.fixtures import SubRequest
+import hashlib
+import os
+from pathlib import PosixPath
+from typing import Dict, List, Tuple, Union
 
+_DIGESTS = {}
 
-def get_prestest_params(request: SubRequest, param: str, default):
+
+def get_prestest_params(request: "SubRequest", param: str, default):
     """get value of target `param` in prestest fixtures. This search for the closest 'prestest' mark and extract the
     value from request param. If the mark is not present or target param is not found. return default value.
 
@@ -16,3 +21,56 @@ def get_prestest_params(request: SubRequest, param: str, default):
         return value
     except:
         return default
+
+
+def file_digest(file: Union[PosixPath, str]) -> str:
+    """return sha256 hex digest of the content of `file`. Digests are cached by path, modification time and size, so
+    unchanged files are only read once per process.
+
+    :param file: path to a local file
+    :return: hex digest of file content
+    """
+    stat = os.stat(file)
+    key = (os.path.abspath(file), stat.st_mtime_ns, stat.st_size)
+    if key not in _DIGESTS:
+        digest = hashlib.sha256()
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        _DIGESTS[key] = digest.hexdigest()
+
+    return _DIGESTS[key]
+
+
+def table_fingerprint(query: str, file: Union[PosixPath, str], file_format: str="text") -> str:
+    """hash of the query creating a table, the content of the file loaded into it and the file format.
+
+    :param query: a query used to create hive table.
+    :param file: a file inserted to the table.
+    :param file_format: format of `file`.
+    :return: hex digest of the fingerprint
+    """
+    digest = hashlib.sha256()
+    for part in (" ".join(query.split()), file_digest(file), file_format):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def partitioned_table_fingerprint(query: str,
+                                  partitions: List[Tuple[Dict[str, str], List[Union[PosixPath, str]]]]) -> str:
+    """hash of the query creating a partitioned table and the partition spec and content of every file loaded into it.
+
+    :param query: a query used to create hive table.
+    :param partitions: a list of tuples of partition spec and files, see `prestest.partitions.partition_files`.
+    :return: hex digest of the fingerprint
+    """
+    digest = hashlib.sha256()
+    parts = [" ".join(query.split())]
+    for spec, files in partitions:
+        parts.append("/".join(f"{column}={value}" for column, value in spec.items()))
+        parts.extend(file_digest(file) for file in files)
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
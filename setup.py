@@ -36,6 +36,12 @@ VERSION = get_version()
 
 REQUIRED = parse_requirements()
 
+EXTRAS = {
+    "arrow": ["pyarrow"],
+    "bench": ["pytest-benchmark"],
+    "lite": ["sqlglot"],
+}
+
 try:
     with open(here / 'README.md', encoding='utf-8') as f:
         long_description = '\n' + f.read()
@@ -56,5 +62,7 @@ setup(
     url=URL,
     packages=find_packages(exclude=["tests", "*.tests", "*.tests.*", "tests.*"]),
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
+    entry_points={"pytest11": ["prestest = prestest.plugin"], "console_scripts": ["prestest = prestest.cli:main"]},
     include_package_data=True,
 )
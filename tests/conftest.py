@@ -0,0 +1,43 @@
+"""fixtures shared by tests running against the fake docker, hive and presto stand-ins of tests/fakes.py. Modules
+override `fake_engine`, `fake_cache` or `fake_teardown` to change only that part of `fake_db_manager`.
+"""
+from pathlib import Path
+
+import pytest
+
+from prestest.cache import TableVersions
+from prestest.db import DBManager
+from tests.fakes import FakeEngine, attach_fakes, patch_subprocess
+
+
+@pytest.fixture()
+def fake_engine():
+    """hive engine of `fake_db_manager`, such as a FakeEngine subclass."""
+    return FakeEngine()
+
+
+@pytest.fixture()
+def fake_cache():
+    """ResultCache of `fake_db_manager`, None to not cache results."""
+    return None
+
+
+@pytest.fixture()
+def fake_teardown():
+    """TeardownQueue of `fake_db_manager`, None to use the queue of the process."""
+    return None
+
+
+@pytest.fixture()
+def fake_db_manager(tmpdir, monkeypatch, fake_engine, fake_cache, fake_teardown):
+    """a DBManager of fake docker clients and hive engine `fake_engine`. docker-compose is not run and table versions
+    are not shared with other tests.
+    """
+    patch_subprocess(monkeypatch)
+    db_manager = DBManager(docker_folder=Path(tmpdir), cache=fake_cache)
+    db_manager.hive_client = fake_engine
+    db_manager.versions = TableVersions()
+    if fake_teardown is not None:
+        db_manager.teardown = fake_teardown
+    attach_fakes(db_manager.container)
+    return db_manager
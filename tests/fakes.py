@@ -0,0 +1,481 @@
+"""in-memory stand-ins for the docker clients used by Container. They only implement the calls prestest makes so
+tests can run without a docker daemon.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import io
+import json
+import queue
+import re
+import threading
+import tarfile
+import time
+import uuid
+
+from docker.errors import NotFound
+
+from prestest.compose import PROJECT_LABEL, SERVICE_LABEL, SERVICES
+from prestest.container import CONTAINER_NAMES
+from prestest.readiness import Readiness
+
+
+# config and files of containers created from any image by `FakeDockerClient.containers.create`
+PRESTO_HOME = "/opt/presto-server-0.181"
+
+PRESTO_IMAGE_CONFIG = {"Env": [f"PRESTO_HOME={PRESTO_HOME}"], "WorkingDir": "", "Entrypoint": None,
+                       "Cmd": [f"{PRESTO_HOME}/bin/launcher", "run"]}
+
+PRESTO_IMAGE_FILES = {
+    f"{PRESTO_HOME}/etc/catalog/hive.properties":
+        b"connector.name=hive-hadoop2\nhive.metastore.uri=thrift://hive-metastore:9083\nhive.allow-drop-table=false\n",
+    f"{PRESTO_HOME}/etc/catalog/jmx.properties": b"connector.name=jmx\n",
+}
+
+
+class FakeImage:
+    def __init__(self, image_id):
+        self.id = image_id
+
+
+class FakeContainer:
+    def __init__(self, name, status="running", health="healthy", image_id="sha256:hive", labels=None):
+        self.name = name
+        self.labels = labels or {}
+        self.id = uuid.uuid4().hex
+        self.status = status
+        self.health = health
+        self.image = FakeImage(image_id)
+        self.files = {}  # path -> bytes
+        self.dirs = {"/", "/tmp"}
+        self.config = {}
+
+    def is_dir(self, path):
+        path = path.rstrip("/") or "/"
+        return any(p == path or p.startswith(path + "/") for p in list(self.dirs) + list(self.files))
+
+
+class FakeEventStream:
+    """blocking iterator of events, closed like docker's CancellableStream"""
+    _closed = object()
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self.queue.get()
+        if event is self._closed:
+            raise StopIteration
+        return event
+
+    def close(self):
+        self.queue.put(self._closed)
+
+
+class FakeAPIClient:
+    """a stand-in for `docker.APIClient`. `calls` records the name of every api call made."""
+    def __init__(self, containers=None):
+        if containers is None:
+            containers = [FakeContainer(name) for name in CONTAINER_NAMES.values()]
+        self.base_url = f"fake://{uuid.uuid4().hex}"
+        self.stack = {c.name: c for c in containers}
+        self.calls = []
+        self.streams = []
+        self.execs = {}
+        self.uploaded = {}  # every file written by put_archive, kept after deletion
+        self.exec_handlers = {}
+
+    def set_health(self, health, status="running"):
+        """set health of all containers without emitting events"""
+        for container in self.stack.values():
+            container.status = status
+            container.health = health
+
+    def emit(self, name, action):
+        """apply `action` to container `name` and publish the event to all event streams"""
+        container = self.stack[name]
+        if action.startswith("health_status"):
+            container.health = action.split(":", 1)[1].strip()
+        elif action in ("die", "stop"):
+            container.status = "exited"
+        elif action == "start":
+            container.status = "running"
+        event = {"Type": "container", "Action": action, "status": action, "id": container.id,
+                 "Actor": {"ID": container.id, "Attributes": dict(container.labels, name=name)},
+                 "timeNano": time.time() * 1e9}
+        for stream in self.streams:
+            stream.queue.put(event)
+
+    def containers(self, all=False, filters=None):
+        self.calls.append("containers")
+        names = (filters or {}).get("name", [])
+        labels = dict(label.split("=", 1) for label in (filters or {}).get("label", []))
+        result = []
+        for container in self.stack.values():
+            if names and not any(name in container.name for name in names):
+                continue
+            if any(container.labels.get(key) != value for key, value in labels.items()):
+                continue
+            if not all and container.status != "running":
+                continue
+            status = "Up 1 minute" if container.status == "running" else "Exited (0) 1 minute ago"
+            if container.status == "running" and container.health is not None:
+                status += " (health: starting)" if container.health == "starting" else f" ({container.health})"
+            result.append({"Id": container.id, "Names": [f"/{container.name}"], "ImageID": container.image.id,
+                           "State": container.status, "Status": status, "Labels": dict(container.labels)})
+        return result
+
+    def events(self, since=None, until=None, filters=None, decode=None):
+        self.calls.append("events")
+        stream = FakeEventStream()
+        self.streams.append(stream)
+        return stream
+
+    def _get(self, name):
+        for container in self.stack.values():
+            if name in (container.name, container.id):
+                return container
+        raise NotFound(f"No such container: {name}")
+
+    def inspect_container(self, name):
+        self.calls.append("inspect_container")
+        container = self._get(name)
+        state = {"Status": container.status, "Running": container.status == "running"}
+        if container.health is not None:
+            state["Health"] = {"Status": container.health}
+        return {"Id": container.id, "Name": f"/{container.name}", "Image": container.image.id, "State": state,
+                "Config": container.config}
+
+    def get_archive(self, container, path, chunk_size=2 * 1024 * 1024):
+        self.calls.append("get_archive")
+        container = self._get(container)
+        path = path.rstrip("/")
+        parent = path.rsplit("/", 1)[0]
+        members = {p: data for p, data in container.files.items() if p == path or p.startswith(path + "/")}
+        if not members:
+            raise NotFound(f"Could not find the file {path} in container {container.name}")
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            for file, data in sorted(members.items()):
+                info = tarfile.TarInfo(file[len(parent) + 1:])
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        data = buffer.getvalue()
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        return iter(chunks), {"name": path.rsplit("/", 1)[1], "size": len(data)}
+
+    def put_archive(self, container, path, data):
+        self.calls.append("put_archive")
+        container = self._get(container)
+        if not container.is_dir(path):
+            raise NotFound(f"Could not find the file {path} in container {container.name}")
+        fileobj = io.BytesIO(data) if isinstance(data, bytes) else data
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            for member in tar:
+                target = f"{path.rstrip('/')}/{member.name}"
+                if member.isfile():
+                    container.files[target] = tar.extractfile(member).read()
+                    self.uploaded[target] = container.files[target]
+                elif member.isdir():
+                    container.dirs.add(target)
+        return True
+
+    def start(self, container):
+        self.calls.append("start")
+        self.emit(self._get(container).name, "start")
+
+    def stop(self, container):
+        self.calls.append("stop")
+        self.emit(self._get(container).name, "stop")
+
+    def exec_create(self, container, cmd, stdout=True, stderr=True, user=""):
+        self.calls.append("exec_create")
+        exec_id = uuid.uuid4().hex
+        self.execs[exec_id] = {"container": self._get(container), "cmd": cmd, "user": user, "exit_code": None}
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id, stream=False, demux=False):
+        self.calls.append("exec_start")
+        execution = self.execs[exec_id]
+        exit_code, out, err = self._run(execution["container"], execution["cmd"])
+        execution["exit_code"] = exit_code
+        if not stream:
+            return (out, err) if demux else out + err
+        # split output in small chunks to exercise line buffering
+        return iter([(out[i:i + 3] or None, None) for i in range(0, len(out), 3)] + ([(None, err)] if err else []))
+
+    def exec_inspect(self, exec_id):
+        return {"ExitCode": self.execs[exec_id]["exit_code"], "Running": False}
+
+    def _run(self, container, cmd):
+        """interpret the few commands prestest runs in containers. return (exit code, stdout, stderr)"""
+        if isinstance(cmd, str):
+            cmd = cmd.split()
+        if cmd[0] in self.exec_handlers:
+            return self.exec_handlers[cmd[0]](container, cmd)
+        if cmd[:2] == ["rm", "-rf"]:
+            for target in cmd[2:]:
+                target = target.rstrip("/")
+                for path in [p for p in container.files if p == target or p.startswith(target + "/")]:
+                    del container.files[path]
+                container.dirs = {d for d in container.dirs if not (d == target or d.startswith(target + "/"))}
+            return 0, b"", b""
+        if cmd[:2] == ["test", "-d"]:
+            return (0 if container.is_dir(cmd[2]) else 1), b"", b""
+        if cmd[0] == "grep":
+            if cmd[2] not in container.files:
+                return 2, b"", f"grep: {cmd[2]}: No such file or directory\n".encode()
+            lines = [l for l in container.files[cmd[2]].decode().splitlines(keepends=True) if cmd[1] in l]
+            return (0 if lines else 1), "".join(lines).encode(), b""
+        if cmd[:2] == ["bash", "-c"] and cmd[2].startswith("echo "):
+            text, file = cmd[2][len("echo "):].rsplit(" >> ", 1)
+            container.files[file] = container.files.get(file, b"") + text.strip('"').encode() + b"\n"
+            return 0, b"", b""
+        raise NotImplementedError(f"fake container cannot run {cmd}")
+
+    def remove_container(self, container_id):
+        self.calls.append("remove_container")
+        container = self._get(container_id)
+        del self.stack[container.name]
+
+
+class _FakeContainers:
+    def __init__(self, api):
+        self.api = api
+
+    def get(self, name):
+        self.api.calls.append("containers.get")
+        return self.api._get(name)
+
+    def create(self, image, **kwargs):
+        """create a stopped container of `image` with the presto installation of PRESTO_IMAGE_FILES"""
+        self.api.calls.append("containers.create")
+        container = FakeContainer(f"created_{uuid.uuid4().hex[:8]}", status="created", health=None, image_id=image)
+        container.config = dict(PRESTO_IMAGE_CONFIG)
+        container.files = dict(PRESTO_IMAGE_FILES)
+        self.api.stack[container.name] = container
+        return container
+
+    def run(self, image, command=None, entrypoint=None, volumes_from=None, remove=False, **kwargs):
+        """only supports `find <folder> -mindepth 1 -delete` used to clear folders of stopped containers"""
+        self.api.calls.append("containers.run")
+        assert entrypoint == ["find"] and command[1:] == ["-mindepth", "1", "-delete"]
+        for container_id in volumes_from:
+            container = self.api._get(container_id)
+            for path in [p for p in container.files if p.startswith(command[0].rstrip("/") + "/")]:
+                del container.files[path]
+            container.dirs.add(command[0].rstrip("/"))
+        return b""
+
+
+class _FakeImages:
+    def __init__(self, api, images):
+        self.api = api
+        self.images = images
+
+    def get(self, name):
+        self.api.calls.append("images.get")
+        if name not in self.images:
+            raise NotFound(f"No such image: {name}")
+        return FakeImage(self.images[name])
+
+
+class FakeDockerClient:
+    """a stand-in for `docker.DockerClient` sharing state with a FakeAPIClient"""
+    def __init__(self, api, images=None):
+        self.api = api
+        self.containers = _FakeContainers(api)
+        self.images = _FakeImages(api, images or {})
+
+
+def compose_stack(project, separator="_"):
+    """containers of compose project `project` labelled like docker-compose does. Compose v2 names containers with
+    `separator` '-'.
+    """
+    return [FakeContainer(separator.join([project, service, "1"]),
+                          labels={PROJECT_LABEL: project, SERVICE_LABEL: service})
+            for service in SERVICES.values()]
+
+
+def attach_fakes(container, api=None, images=None):
+    """replace docker clients of `container` with fakes and return the fake api client. Services of the stack are
+    considered ready without probes.
+    """
+    api = api or FakeAPIClient()
+    container.api_client = api
+    container.client = FakeDockerClient(api, images)
+    container.readiness = Readiness({})
+    return api
+
+
+class FakeProcess:
+    def __init__(self, command):
+        self.command = command
+
+    def wait(self):
+        return 0
+
+    def communicate(self):
+        return b"", b""
+
+
+def patch_subprocess(monkeypatch):
+    """replace subprocess.Popen with FakeProcess and return the list of commands run"""
+    import subprocess
+    commands = []
+
+    def popen(command, *args, **kwargs):
+        commands.append(command)
+        return FakeProcess(command)
+
+    monkeypatch.setattr(subprocess, "Popen", popen)
+    return commands
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    """a stand-in for a sqlalchemy connection of a FakeEngine"""
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def exec_driver_sql(self, query):
+        return self.engine.run(query)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    """a stand-in for a sqlalchemy 2 engine recording queries executed on its connections. Table properties set with
+    ALTER TABLE are kept and returned by SHOW TBLPROPERTIES. DESCRIBE FORMATTED returns the default location of a table.
+    Subclasses override `run` to change how queries are answered.
+    """
+    def __init__(self):
+        self.queries = []
+        self.properties = {}
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def run(self, query):
+        query = " ".join(str(query).split())
+        self.queries.append(query)
+        match = re.match(r"ALTER TABLE (\S+) SET TBLPROPERTIES \('(.+)'='(.*)'\)", query)
+        if match:
+            self.properties.setdefault(match.group(1), {})[match.group(2)] = match.group(3)
+        match = re.match(r"DROP TABLE IF EXISTS (\S+)", query)
+        if match:
+            self.properties.pop(match.group(1), None)
+        match = re.match(r"SHOW TBLPROPERTIES (\S+)\('(.+)'\)", query)
+        if match:
+            properties = self.properties.get(match.group(1), {})
+            value = properties.get(match.group(2), f"Table {match.group(1)} does not have property: {match.group(2)}")
+            return FakeResult([(value,)])
+        match = re.match(r"DESCRIBE FORMATTED (\w+)\.(\w+)", query)
+        if match:
+            location = f"hdfs://namenode:8020/user/hive/warehouse/{match.group(1)}.db/{match.group(2)}"
+            return FakeResult([("# col_name ", "data_type", "comment"), ("Location: ", location, None)])
+        return FakeResult([])
+
+
+def sqlite_engine(fake: FakeEngine):
+    """a real sqlalchemy engine on sqlite answering every statement with the rows `fake` returns for it. It runs hive
+    queries through the sqlalchemy connection api while `fake` records them."""
+    from sqlalchemy import create_engine, event
+
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def answer(connection, cursor, statement, parameters, context, executemany):
+        rows = fake.run(statement).fetchall()
+        if not rows:
+            return "SELECT 1 WHERE 0", ()
+        return " UNION ALL ".join("SELECT " + ", ".join("?" * len(row)) for row in rows), \
+            tuple(value for row in rows for value in row)
+
+    return engine
+
+
+class FakePrestoServer:
+    """a local http server speaking the presto statement protocol. Every query returns `rows` of `columns` split in
+    pages of `page_size` rows, except queries containing 'FAIL' which return an error. `cancelled` records the
+    queries deleted by clients and `requests` the number of pages served. `info` is served at /v1/info.
+    """
+    def __init__(self, columns, rows, page_size=2):
+        self.columns = [{"name": name, "type": presto_type} for name, presto_type in columns]
+        self.rows = rows
+        self.page_size = page_size
+        self.queries = []
+        self.cancelled = []
+        self.requests = 0
+        self.info = {"starting": False}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                query = self.rfile.read(int(self.headers["Content-Length"])).decode()
+                server.queries.append(query)
+                if "FAIL" in query:
+                    self._send({"id": "q", "error": {"errorName": "TABLE_NOT_FOUND", "message": "no table"}})
+                    return
+                query_id = len(server.queries)
+                self._send({"id": str(query_id), "nextUri": f"{server.url}/v1/statement/{query_id}/0"})
+
+            def do_GET(self):
+                if self.path == "/v1/info":
+                    self._send(server.info)
+                    return
+                server.requests += 1
+                query_id, page = self.path.split("/")[-2:]
+                start = int(page) * server.page_size
+                body = {"id": query_id, "columns": server.columns, "data": server.rows[start:start + server.page_size]}
+                if start + server.page_size < len(server.rows):
+                    body["nextUri"] = f"{server.url}/v1/statement/{query_id}/{int(page) + 1}"
+                if not body["data"]:
+                    del body["data"]
+                self._send(body)
+
+            def do_DELETE(self):
+                server.cancelled.append(self.path)
+                self.send_response(204)
+                self.end_headers()
+
+        self.httpd = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from prestest.aio import AsyncDBManager
+from prestest.presto import StatementClient
+from tests.fakes import FakeEngine, FakePrestoServer
+
+
+class SlowEngine(FakeEngine):
+    """a FakeEngine taking a while to load tables and recording how many loads run at the same time"""
+    def __init__(self):
+        super(SlowEngine, self).__init__()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def run(self, query):
+        if not str(query).startswith("LOAD DATA"):
+            return super(SlowEngine, self).run(query)
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return super(SlowEngine, self).run(query)
+
+
+@pytest.fixture()
+def fake_engine():
+    return SlowEngine()
+
+
+@pytest.fixture()
+def async_db_manager(fake_db_manager):
+    return AsyncDBManager(fake_db_manager, concurrency=3)
+
+
+def test_create_tables_concurrently_with_limit(async_db_manager, tmpdir):
+    tables = []
+    for i in range(6):
+        file = Path(tmpdir.join(f"table_{i}.csv"))
+        file.write_text(f"{i},abc\n")
+        tables.append({"table": f"db_{i % 2}.table_{i}", "query": f"CREATE TABLE db_{i % 2}.table_{i} (col1 INT)",
+                       "file": file})
+
+    created = asyncio.run(async_db_manager.create_tables(tables))
+
+    engine = async_db_manager.db_manager.hive_client
+    assert created == [True] * 6
+    assert sorted(engine.queries[:2]) == ["CREATE DATABASE IF NOT EXISTS db_0", "CREATE DATABASE IF NOT EXISTS db_1"], \
+        "databases should be created before their tables"
+    assert {q for q in engine.queries if q.startswith("CREATE DATABASE")} == set(engine.queries[:2])
+    assert len([q for q in engine.queries if q.startswith("LOAD DATA")]) == 6
+    assert 1 < engine.max_running <= 3
+
+
+def test_read_sqls_keep_query_order(async_db_manager):
+    rows = [[i, f"value_{i}"] for i in range(3)]
+    with FakePrestoServer([("col1", "bigint"), ("col2", "varchar")], rows) as server:
+        async_db_manager.db_manager.get_statement_client = lambda: StatementClient(server.url)
+        queries = [f"SELECT * FROM sandbox.table_{i}" for i in range(4)]
+        results = asyncio.run(async_db_manager.read_sqls(queries, columnar=True))
+
+    assert len(results) == 4
+    assert all(list(df["col1"]) == [0, 1, 2] for df in results)
+    assert sorted(server.queries) == queries
+
+
+def test_async_container_delegates_to_container(async_db_manager):
+    container = async_db_manager.container
+    assert asyncio.run(container.is_started())
+    asyncio.run(container.stop())
+    assert "stop" in container.container.api_client.calls
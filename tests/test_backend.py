@@ -0,0 +1,24 @@
+import pytest
+
+from prestest.backend import Backend
+from prestest.daemon import DaemonDBManager
+from prestest.db import DBManager
+from prestest.lite import LiteDBManager
+
+
+def test_backends_implement_the_same_interface():
+    interface = {name for name in dir(Backend) if not name.startswith("_")}
+    for backend in (DBManager, LiteDBManager, DaemonDBManager):
+        assert issubclass(backend, Backend)
+        assert not backend.__abstractmethods__, f"{backend.__name__} misses {sorted(backend.__abstractmethods__)}"
+        assert interface <= set(dir(backend))
+    assert isinstance(LiteDBManager(), Backend)
+
+
+def test_backend_missing_a_method_cannot_be_created():
+    class Partial(Backend):
+        def read_sql(self, query, columnar=False):
+            pass
+
+    with pytest.raises(TypeError, match="abstract"):
+        Partial()
@@ -0,0 +1,126 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from prestest.cache import (ResultCache, TableVersions, cacheable_tables, is_read_only, normalize_sql,
+                            referenced_tables)
+from prestest.presto import StatementClient
+from tests.fakes import FakePrestoServer
+
+QUERY = "SELECT col1, count(*) FROM sandbox.test_table GROUP BY col1"
+
+
+@pytest.fixture()
+def fake_cache():
+    return ResultCache()
+
+
+@pytest.fixture()
+def server(fake_db_manager):
+    with FakePrestoServer([("col1", "bigint"), ("_col1", "bigint")], [[1, 2], [3, 4]]) as server:
+        fake_db_manager.get_statement_client = lambda: StatementClient(server.url)
+        yield server
+
+
+def test_normalize_and_parse_query():
+    assert normalize_sql("SELECT  *\n  FROM sandbox.t\nWHERE c = 'a  b' ;") == "SELECT * FROM sandbox.t WHERE c = 'a  b'"
+    assert referenced_tables("SELECT a.x FROM sandbox.t a JOIN `db`.`U` b ON a.id = b.id WHERE c = 'FROM x.y'") == \
+        ["sandbox.t", "db.u"]
+    assert referenced_tables("LOAD DATA LOCAL INPATH '/tmp/a.csv' OVERWRITE INTO TABLE sandbox.t") == ["sandbox.t"]
+    assert referenced_tables("SELECT * FROM sandbox.a x, (SELECT * FROM sandbox.b) y, hive.sandbox.c AS z(c1, c2) "
+                             "JOIN sandbox.d ON f(x.i, 1) = 1, sandbox.e WHERE x.i IN (SELECT i FROM sandbox.f)") == \
+        ["sandbox.a", "sandbox.b", "sandbox.c", "sandbox.d", "sandbox.e", "sandbox.f"]
+    assert cacheable_tables("WITH t AS (SELECT * FROM sandbox.a) SELECT * FROM t, sandbox.b") == \
+        ["sandbox.a", "sandbox.b"]
+    assert cacheable_tables("SELECT * FROM sandbox.a CROSS JOIN UNNEST(a.items) AS i(item)") == ["sandbox.a"]
+    assert cacheable_tables("SELECT count(*) FROM events") is None
+    assert cacheable_tables("SELECT * FROM sandbox.a, events") is None
+    assert is_read_only(" WITH t AS (SELECT 1) SELECT * FROM t")
+    assert not is_read_only("INSERT INTO sandbox.t SELECT * FROM sandbox.u")
+
+
+def test_table_versions_persistent_only_with_known_tables():
+    versions = TableVersions()
+    versions.bump("s", ["sandbox.t"], "fingerprint")
+    assert versions.of("s", ["sandbox.t"]) == ((("sandbox.t", "fingerprint"),), True)
+    assert versions.of("s", []) == ((), False)
+    assert not versions.of("s", ["sandbox.t", "sandbox.u"])[1]
+
+
+def test_result_cache_evict_least_recently_used():
+    df = pd.DataFrame({"col1": range(100)})
+    size = int(df.memory_usage(index=True, deep=True).sum())
+    cache = ResultCache(budget=2 * size)
+    for key in ("a", "b"):
+        cache.put(key, df, seconds=1.5)
+    assert cache.get("a") is not None
+    cache.put("c", df)
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+    cached = cache.get("a")
+    cached["col1"] = 0
+    assert_frame_equal(cache.get("a"), df), "cached results should not be modified through returned copies"
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.evictions) == (3, 1, 1)
+    assert cache.stats.saved == 4.5
+
+
+def test_result_cache_persist_on_disk(tmpdir):
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"col1": [1, 2], "col2": ["abc", "cba"]})
+    ResultCache(folder=Path(tmpdir)).put("a", df, seconds=2.0, persist=True)
+    ResultCache(folder=Path(tmpdir)).put("b", df)
+
+    cache = ResultCache(folder=Path(tmpdir))
+    assert_frame_equal(cache.get("a"), df)
+    assert cache.get("b") is None
+    assert (cache.stats.disk_hits, cache.stats.saved) == (1, 2.0)
+
+
+def test_read_sql_cached_until_table_changes(fake_db_manager, server, tmpdir):
+    first = fake_db_manager.read_sql(QUERY, columnar=True)
+    assert_frame_equal(fake_db_manager.read_sql(f"  {QUERY} ;", columnar=True), first)
+    assert len(server.queries) == 1
+
+    file = Path(tmpdir.join("table.csv"))
+    file.write_text("1,abc\n")
+    fake_db_manager.create_table("sandbox.test_table", "CREATE TABLE sandbox.test_table (col1 INT)", file)
+    fake_db_manager.read_sql(QUERY, columnar=True)
+    fake_db_manager.read_sql(QUERY, columnar=True)
+    assert len(server.queries) == 2
+
+    fake_db_manager.run_hive_query("INSERT INTO sandbox.test_table VALUES (2)")
+    fake_db_manager.read_sql(QUERY, columnar=True)
+    fake_db_manager.drop_table("sandbox.test_table")
+    fake_db_manager.read_sql(QUERY, columnar=True)
+    assert len(server.queries) == 4
+    assert (fake_db_manager.cache.stats.hits, fake_db_manager.cache.stats.misses) == (2, 4)
+
+
+def test_read_sql_persist_only_tables_of_known_content(fake_db_manager, server, tmpdir):
+    pytest.importorskip("pyarrow")
+    fake_db_manager.cache.folder = Path(tmpdir.join("cache"))
+    fake_db_manager.read_sql(QUERY, columnar=True)
+    assert not fake_db_manager.cache.folder.exists(), "tables of unknown content should not be cached on disk"
+
+    file = Path(tmpdir.join("table.csv"))
+    file.write_text("1,abc\n")
+    fake_db_manager.create_table("sandbox.test_table", "CREATE TABLE sandbox.test_table (col1 INT)", file)
+    fake_db_manager.read_sql(QUERY, columnar=True)
+    assert len(list(fake_db_manager.cache.folder.glob("*.parquet"))) == 1
+
+    fake_db_manager.cache = ResultCache(folder=fake_db_manager.cache.folder)
+    fake_db_manager.versions = TableVersions()
+    fake_db_manager.create_table("sandbox.test_table", "CREATE TABLE sandbox.test_table (col1 INT)", file)
+    fake_db_manager.read_sql(QUERY, columnar=True)
+    assert len(server.queries) == 2, "a new session should read the result of identical tables from disk"
+    assert fake_db_manager.cache.stats.disk_hits == 1
+
+
+def test_read_sql_skip_cache_of_unqualified_tables(fake_db_manager, server):
+    for _ in range(2):
+        fake_db_manager.read_sql("SELECT count(*) FROM test_table", columnar=True)
+    assert len(server.queries) == 2, "changes to tables without schema are not tracked"
+    assert fake_db_manager.cache.stats.misses == 0
@@ -0,0 +1,122 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from prestest.catalog import OVERRIDE_FILE, CatalogConfig
+from prestest.container import Container
+from tests.fakes import PRESTO_HOME, attach_fakes, patch_subprocess
+
+CATALOG_FOLDER = f"{PRESTO_HOME}/etc/catalog"
+
+HIVE_PROPERTIES = """# hive catalog of the image
+connector.name=hive-hadoop2
+hive.metastore.uri=thrift://hive-metastore:9083
+hive.allow-drop-table=false
+"""
+
+COMPOSE = """version: "3"
+services:
+  presto-coordinator:
+    image: shawnzhu/prestodb:0.181
+"""
+
+
+@pytest.fixture()
+def docker_folder(tmpdir):
+    folder = Path(tmpdir.join("docker-hive"))
+    folder.mkdir()
+    (folder / "docker-compose.yml").write_text(COMPOSE)
+    return folder
+
+
+@pytest.fixture()
+def popen_calls(monkeypatch):
+    return patch_subprocess(monkeypatch)
+
+
+@pytest.fixture()
+def container(docker_folder, popen_calls):
+    container = Container(docker_folder)
+    attach_fakes(container)
+    yield container
+    container.state.stop_watching()
+
+
+def test_write_render_properties_and_compose_override(docker_folder, tmpdir):
+    folder = Path(tmpdir.join("catalog"))
+    config = CatalogConfig().with_table_modification()
+    assert not config.is_default
+    originals = {"hive.properties": HIVE_PROPERTIES}
+    assert config.write(folder, docker_folder / "docker-compose.yml", CATALOG_FOLDER, originals)
+
+    assert (folder / "hive.properties").read_text() == \
+        "# hive catalog of the image\n" \
+        "connector.name=hive-hadoop2\n" \
+        "hive.metastore.uri=thrift://hive-metastore:9083\n" \
+        "hive.allow-add-column=true\n" \
+        "hive.allow-drop-table=true\n" \
+        "hive.allow-rename-table=true\n"
+    override = json.loads((folder / OVERRIDE_FILE).read_text())
+    assert override["version"] == "3"
+    service = override["services"]["presto-coordinator"]
+    assert service["volumes"] == [f"{folder / 'hive.properties'}:{CATALOG_FOLDER}/hive.properties:ro"]
+
+    assert not config.write(folder, docker_folder / "docker-compose.yml", CATALOG_FOLDER, originals), \
+        "unchanged files should not be written"
+    config.set("hive", **{"hive.max-partitions-per-writers": 500}).write(folder, docker_folder / "docker-compose.yml",
+                                                                        CATALOG_FOLDER, originals)
+    assert json.loads((folder / OVERRIDE_FILE).read_text())["services"]["presto-coordinator"]["labels"] != \
+        service["labels"], "changed properties should change the label so the coordinator is recreated"
+
+    assert config.with_table_modification(False).is_default
+
+
+def test_reset_allow_table_modification_without_restart_cycle(container, popen_calls):
+    container.reset(allow_table_modification=True, autostart=True)
+
+    assert len(popen_calls) == 1
+    assert popen_calls[0].endswith(f"-f '{container.compose.overrides[0]}' up -d")
+    assert "exec_create" not in container.api_client.calls
+    assert container.api_client.calls.count("stop") == 6, "containers should only be stopped before removal"
+
+
+def test_configure_catalog_recreate_running_coordinator_only(container, popen_calls):
+    assert container.configure_catalog(CatalogConfig().with_table_modification())
+    assert popen_calls == [container.compose.command("up -d")]
+    assert "stop" not in container.api_client.calls
+
+    assert not container.configure_catalog(CatalogConfig().with_table_modification()), "nothing changed"
+    assert container.configure_catalog(CatalogConfig())
+    assert popen_calls[-1] == "docker-compose up -d", "default catalog should not be mounted"
+    assert len(popen_calls) == 2
+
+
+def test_configure_catalog_of_stopped_stack_apply_at_start(container, popen_calls):
+    container.stop()
+    assert not container.configure_catalog(CatalogConfig().with_table_modification())
+    assert popen_calls == []
+
+    container.start(until_started=False)
+    assert popen_calls == [container.compose.command("up -d")]
+    assert container.compose.overrides
+
+
+def test_image_catalog_read_once_from_throwaway_container(container):
+    folder, files = container.image_catalog()
+    assert str(folder) == CATALOG_FOLDER
+    assert sorted(files) == ["hive.properties", "jmx.properties"]
+    assert "hive.metastore.uri=thrift://hive-metastore:9083\n" in files["hive.properties"]
+    assert container.api_client.calls.count("containers.create") == 1
+    assert container.api_client.calls.count("remove_container") == 1, "the throwaway container should be removed"
+    assert all(not name.startswith("created_") for name in container.api_client.stack)
+
+    assert container.image_catalog() == (folder, files)
+    assert container.api_client.calls.count("containers.create") == 1
+
+    container.configure_catalog(CatalogConfig().with_table_modification())
+    mounted = (container.compose.overrides[0].parent / "hive.properties").read_text()
+    assert "connector.name=hive-hadoop2\n" in mounted and "hive.allow-drop-table=true\n" in mounted
+    assert "hive.allow-drop-table=false" not in mounted
+    volumes = json.loads(container.compose.overrides[0].read_text())["services"]["presto-coordinator"]["volumes"]
+    assert volumes[0].endswith(f":{CATALOG_FOLDER}/hive.properties:ro")
@@ -0,0 +1,92 @@
+from pathlib import Path
+
+import pytest
+
+from prestest.cluster import ClusterManager
+from prestest.container import Container
+from tests.fakes import attach_fakes, patch_subprocess
+
+COMPOSE = """version: "3"
+services:
+  hive-server:
+    image: bde2020/hive:2.3.2-postgresql-metastore
+  presto-coordinator:
+    image: shawnzhu/prestodb:0.181
+"""
+
+IMAGES = {"bde2020/hive:2.3.2-postgresql-metastore": "sha256:hive", "shawnzhu/prestodb:0.181": "sha256:hive"}
+
+
+@pytest.fixture()
+def docker_folder(tmpdir):
+    folder = Path(tmpdir.join("docker-hive"))
+    folder.mkdir()
+    (folder / "docker-compose.yml").write_text(COMPOSE)
+    (folder / "hadoop-hive.env").write_text("CORE_CONF_fs_defaultFS=hdfs://namenode:8020\n")
+    return folder
+
+
+@pytest.fixture()
+def popen_calls(monkeypatch):
+    return patch_subprocess(monkeypatch)
+
+
+@pytest.fixture()
+def manager(docker_folder, tmpdir):
+    container = Container(docker_folder)
+    attach_fakes(container, images=IMAGES)
+    return ClusterManager(container, state_folder=Path(tmpdir.join("state")))
+
+
+def test_ensure_started_starts_stack_only_once(manager, popen_calls):
+    assert manager.ensure_started()
+    assert popen_calls == ["docker-compose up -d"]
+
+    assert not manager.ensure_started()
+    assert popen_calls == ["docker-compose up -d"], "healthy stack should be attached without subprocess"
+
+
+def test_ensure_started_attach_across_sessions(manager, docker_folder, tmpdir, popen_calls):
+    manager.ensure_started()
+
+    container = Container(docker_folder)
+    attach_fakes(container, images=IMAGES)
+    new_session = ClusterManager(container, state_folder=Path(tmpdir.join("state")))
+    assert not new_session.ensure_started()
+    assert len(popen_calls) == 1
+
+
+def test_ensure_started_restart_when_docker_folder_changes(manager, docker_folder, popen_calls):
+    manager.ensure_started()
+    (docker_folder / "hadoop-hive.env").write_text("CORE_CONF_fs_defaultFS=hdfs://namenode:9000\n")
+    manager.fingerprint(refresh=True)
+
+    assert manager.ensure_started()
+    assert len(popen_calls) == 2
+
+
+def test_ensure_started_restart_when_stack_runs_outdated_image(manager, popen_calls):
+    manager.ensure_started()
+    manager.container.client.images.images["shawnzhu/prestodb:0.181"] = "sha256:new-presto"
+    manager.fingerprint(refresh=True)
+
+    assert manager.ensure_started()
+    assert len(popen_calls) == 2
+
+
+def test_ensure_started_start_unhealthy_stack(manager, popen_calls):
+    manager.ensure_started()
+    manager.container.api_client.stack["docker-hive_hive-server_1"].status = "exited"
+    manager.container.state.invalidate()
+
+    assert manager.ensure_started(until_started=False)
+    assert len(popen_calls) == 1, "existing containers should be started without docker-compose"
+    assert "start" in manager.container.api_client.calls
+
+
+def test_fingerprint_ignores_state_folder(manager, docker_folder):
+    before = manager.fingerprint()
+    (docker_folder / ".prestest").mkdir()
+    (docker_folder / ".prestest" / "state.json").write_text("{}")
+
+    assert manager.fingerprint(refresh=True) == before
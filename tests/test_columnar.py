@@ -0,0 +1,55 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from prestest.columnar import create_table_query, hive_type, partition_clause, write_partitions
+
+
+@pytest.fixture()
+def df():
+    return pd.DataFrame({
+        "id": np.array([1, 2, 3], dtype=np.int64),
+        "small": np.array([1, 2, 3], dtype=np.int16),
+        "score": [0.5, 1.5, None],
+        "name": ["a", "b", None],
+        "flag": [True, False, True],
+        "created": pd.to_datetime(["2020-01-01", "2020-01-02", "2020-01-03"]),
+        "ds": [datetime.date(2020, 1, 1), datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)],
+    })
+
+
+def test_hive_type_infer_from_dtype(df):
+    assert [hive_type(df[c]) for c in df.columns] == \
+        ["BIGINT", "SMALLINT", "DOUBLE", "STRING", "BOOLEAN", "TIMESTAMP", "DATE"]
+    assert hive_type(pd.Series([1, None], dtype="Int32")) == "INT"
+
+
+def test_create_table_query_with_partitions(df):
+    query = create_table_query("sandbox.table", df[["id", "name", "ds"]], "orc", partition_by=["ds"])
+    assert " ".join(query.split()) == \
+        "CREATE TABLE sandbox.table ( `id` BIGINT, `name` STRING ) PARTITIONED BY (`ds` DATE) STORED AS ORC"
+
+
+def test_create_table_query_reject_unknown_format(df):
+    with pytest.raises(ValueError):
+        create_table_query("sandbox.table", df, "csv")
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "orc"])
+def test_write_partitions_write_one_file_per_partition(df, tmpdir, file_format):
+    pytest.importorskip("pyarrow")
+    partitions = write_partitions(df, str(tmpdir), file_format, partition_by=["ds"])
+
+    assert [spec for spec, _ in partitions] == [{"ds": "2020-01-01"}, {"ds": "2020-01-02"}]
+    read = pd.read_parquet if file_format == "parquet" else pd.read_orc
+    first = read(partitions[0][1])
+    assert list(first.columns) == ["id", "small", "score", "name", "flag", "created"]
+    assert first["id"].tolist() == [1, 2]
+
+
+def test_partition_clause():
+    assert partition_clause({}) == ""
+    assert partition_clause({"ds": "2020-01-01", "country": "us"}) == " PARTITION (`ds`='2020-01-01', `country`='us')"
+    assert partition_clause({"name": "o'neil\\"}) == " PARTITION (`name`='o\\'neil\\\\')"
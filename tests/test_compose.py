@@ -0,0 +1,92 @@
+from pathlib import Path
+
+import pytest
+
+from prestest.compose import ComposeProject, render_compose, service_image
+from prestest.container import Container
+from tests.fakes import FakeAPIClient, FakeContainer, attach_fakes, compose_stack, patch_subprocess
+
+COMPOSE = """version: "3"
+services:
+  hive-server:
+    image: bde2020/hive:2.3.2-postgresql-metastore
+    ports:
+      - "10000:10000"
+  presto-coordinator:
+    image: shawnzhu/prestodb:0.181
+    ports:
+      - 8080:8080
+      - "127.0.0.1:8081:8080/tcp"
+"""
+
+
+@pytest.fixture()
+def docker_folder(tmpdir):
+    folder = Path(tmpdir.join("docker-hive"))
+    folder.mkdir()
+    (folder / "docker-compose.yml").write_text(COMPOSE)
+    return folder
+
+
+def test_render_compose_shift_host_ports_only():
+    rendered = render_compose(COMPOSE, 200)
+    assert '- "10200:10000"' in rendered
+    assert "- 8280:8080" in rendered
+    assert '- "127.0.0.1:8281:8080/tcp"' in rendered
+    assert "image: shawnzhu/prestodb:0.181" in rendered
+
+
+def test_service_image():
+    assert service_image(COMPOSE, "presto-coordinator") == "shawnzhu/prestodb:0.181"
+    assert service_image(COMPOSE, "hive-server") == "bde2020/hive:2.3.2-postgresql-metastore"
+    assert service_image(COMPOSE, "namenode") is None
+
+
+def test_default_project_use_compose_file_as_is(docker_folder):
+    project = ComposeProject(docker_folder)
+    assert project.command("up -d") == "docker-compose up -d"
+    assert project.presto_url == "presto://localhost:8080"
+    assert not (docker_folder / ".prestest").exists()
+
+
+def test_named_project_use_rendered_compose_file(docker_folder):
+    project = ComposeProject(docker_folder, "prestest-0", port_offset=100)
+    command = project.command("up -d")
+
+    rendered = docker_folder / ".prestest" / "compose" / "prestest-0.yml"
+    assert command == f"docker-compose -p prestest-0 --project-directory '{docker_folder}' -f '{rendered}' up -d"
+    assert '- "10100:10000"' in rendered.read_text()
+    assert project.hive_url == "hive://localhost:10100"
+    assert project.presto_http_url == "http://localhost:8180"
+    assert project.names["presto_coordinator"] == "prestest-0_presto-coordinator_1"
+
+
+def test_container_of_project_discover_containers_by_label(docker_folder, monkeypatch):
+    commands = patch_subprocess(monkeypatch)
+    other = compose_stack("prestest-1")
+    api = FakeAPIClient(compose_stack("prestest-0", separator="-") + other + [FakeContainer("prestest-0_unrelated")])
+    container = Container(docker_folder, project="prestest-0", port_offset=100)
+    attach_fakes(container, api)
+
+    assert container.container_name("hive-server") == "prestest-0-hive-server-1"
+    assert container.is_healthy()
+
+    other[0].status = "exited"
+    container.state.invalidate()
+    assert container.is_healthy(), "containers of other projects should be ignored"
+
+    container.start()
+    assert commands == [], "existing containers should be reused"
+
+    container.copy_from_local(docker_folder / "docker-compose.yml", "/tmp/compose.yml")
+    assert "/tmp/compose.yml" in api.stack["prestest-0-hive-server-1"].files
+
+
+def test_container_of_project_start_missing_stack_with_project_command(docker_folder, monkeypatch):
+    commands = patch_subprocess(monkeypatch)
+    container = Container(docker_folder, project="prestest-0", port_offset=100)
+    attach_fakes(container, FakeAPIClient([]))
+
+    container.start(until_started=False)
+    assert commands == [container.compose.command("up -d")]
+    assert commands[0].startswith("docker-compose -p prestest-0 ")
@@ -1,12 +1,14 @@
 from pathlib import Path
 import pytest
 import subprocess
+import threading
 import time
 
 from docker.errors import APIError, NotFound
 
-from prestest.container import Container, CONTAINER_NAMES, LOCAL_FILE_STORE_NODE
+from prestest.container import Container, CONTAINER_NAMES, LOCAL_FILE_STORE_NODE, LineBuffer
 from prestest.utils import get_prestest_params
+from tests.fakes import attach_fakes, patch_subprocess
 
 DOCKER_FOLDER = Path(".").resolve().parent / "docker-hive"
 
@@ -181,3 +183,104 @@ def test_enable_table_modification_change_hive_properties_file_correctly(contain
         result = set(l.strip() for l in f.readlines() if l.strip() != '')
     expected = {"hive.allow-drop-table=true", "hive.allow-rename-table=true", "hive.allow-add-column=true"}
     assert result.issuperset(expected)
+
+
+@pytest.fixture()
+def fake_container(tmpdir, monkeypatch):
+    commands = patch_subprocess(monkeypatch)
+    container = Container(docker_folder=Path(tmpdir))
+    attach_fakes(container)
+    yield container
+    assert commands == [], "should not spawn processes"
+    container.state.stop_watching()
+
+
+def test_copy_from_local_and_download_from_container_use_archive_api(fake_container, create_dummy_files, tmpdir):
+    fake_container.copy_from_local(create_dummy_files, "/tmp")
+    fake_container.copy_from_local(create_dummy_files / "file1.txt", "/tmp/renamed.txt")
+    hive_server = fake_container.api_client.stack[CONTAINER_NAMES[LOCAL_FILE_STORE_NODE]]
+    assert hive_server.files == {"/tmp/test_folder/file1.txt": b"1", "/tmp/test_folder/file2.txt": b"2",
+                                 "/tmp/renamed.txt": b"1"}
+
+    download_folder = Path(tmpdir) / "download"
+    fake_container.download_from_container("/tmp/test_folder", download_folder)
+    assert {f.name: f.read_text() for f in download_folder.iterdir()} == {"file1.txt": "1", "file2.txt": "2"}
+
+    fake_container.download_from_container("/tmp/renamed.txt", download_folder)
+    assert (download_folder / "renamed.txt").read_text() == "1"
+
+
+def test_delete_and_download_missing_file_raise_runtime_error(fake_container, tmpdir):
+    test_file = Path(tmpdir.join("test_delete.txt"))
+    test_file.write_text("hello world")
+    fake_container.copy_from_local(test_file, "/tmp/delete.txt")
+    fake_container.delete("/tmp/delete.txt")
+
+    with pytest.raises(RuntimeError):
+        fake_container.download_from_container("/tmp/delete.txt", tmpdir.join("dummy_download.txt"))
+
+
+def test_execute_command_stream_lines_and_raise_on_stderr(fake_container):
+    api = fake_container.api_client
+    api.exec_handlers["seq"] = lambda c, cmd: (0, "".join(f"{i}\n" for i in range(int(cmd[1]))).encode(), b"")
+    api.exec_handlers["fail"] = lambda c, cmd: (1, b"", b"failed")
+
+    lines = list(fake_container.stream_command(["seq", "100000"]))
+    assert len(lines) == 100000
+    assert lines[:2] == [("stdout", "0\n"), ("stdout", "1\n")]
+
+    with pytest.raises(ValueError):
+        fake_container.execute_command(["fail"], exception=ValueError)
+
+
+def test_execute_command_timeout_without_output(fake_container):
+    released = threading.Event()
+
+    def exec_start(exec_id, stream=False, demux=False):
+        released.wait(10)  # like a command hanging without printing anything
+        yield b"done\n", None
+
+    fake_container.api_client.exec_start = exec_start
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        fake_container.execute_command(["hang"], exception=TimeoutError, timeout=0.2)
+    assert time.monotonic() - start < 5, "a command without output should time out"
+    released.set()
+
+
+def test_line_buffer_handle_split_utf8_and_partial_lines():
+    buffer = LineBuffer()
+    data = "caf\u00e9\nlast".encode()
+    assert buffer.feed(data[:4]) == []
+    assert buffer.feed(data[4:]) == ["caf\u00e9\n"]
+    assert buffer.flush() == ["last"]
+
+
+def test_append_file_skip_existing_line_with_exec_api(fake_container):
+    hive_server = fake_container.api_client.stack[CONTAINER_NAMES[LOCAL_FILE_STORE_NODE]]
+    hive_server.files["/tmp/edit.txt"] = b"hello world\n"
+
+    fake_container.append_file(CONTAINER_NAMES[LOCAL_FILE_STORE_NODE], "/tmp/edit.txt", "hello world")
+    fake_container.append_file(CONTAINER_NAMES[LOCAL_FILE_STORE_NODE], "/tmp/edit.txt", "new line",
+                               from_new_line=False)
+
+    assert hive_server.files["/tmp/edit.txt"] == b"hello world\nnew line\n"
+
+
+def test_start_and_stop_existing_containers_through_api(fake_container):
+    fake_container.stop()
+    assert not fake_container.is_started()
+
+    fake_container.start(until_started=True)
+    assert fake_container.is_healthy()
+    assert fake_container.api_client.calls.count("start") == len(CONTAINER_NAMES)
+
+
+@pytest.fixture()
+def create_dummy_files(tmpdir):
+    test_folder = Path(tmpdir.join("test_folder"))
+    test_folder.mkdir()
+    (test_folder / "file1.txt").write_text("1")
+    (test_folder / "file2.txt").write_text("2")
+    return test_folder
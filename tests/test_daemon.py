@@ -0,0 +1,125 @@
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from prestest import daemon as daemon_module
+from prestest.cli import main
+from prestest.cluster import ClusterManager
+from prestest.container import Container
+from prestest.daemon import (DaemonClient, DaemonDBManager, DaemonError, PrestestDaemon, decode_dataframe,
+                             encode_dataframe, socket_path)
+from prestest.db import DBManager
+from prestest.namespace import Namespace
+from prestest.presto import StatementClient
+from tests.fakes import FakePrestoServer, attach_fakes, patch_subprocess
+from tests.test_cluster import COMPOSE, IMAGES
+
+CREATE_QUERY = "CREATE TABLE sandbox.test_table (col1 INT, col2 STRING)"
+
+
+@pytest.fixture()
+def docker_folder(tmpdir):
+    folder = Path(tmpdir.join("docker-hive"))
+    folder.mkdir()
+    (folder / "docker-compose.yml").write_text(COMPOSE)
+    return folder
+
+
+@pytest.fixture()
+def hive(monkeypatch, fake_engine):
+    monkeypatch.setattr(DBManager, "get_hive_client", lambda self: fake_engine)
+    return fake_engine
+
+
+@pytest.fixture()
+def server(monkeypatch, docker_folder, tmpdir, hive):
+    """a PrestestDaemon of fake docker, hive and presto serving in a thread"""
+    patch_subprocess(monkeypatch)
+    state_folder = Path(tempfile.mkdtemp())  # unix socket paths are limited to about 100 characters
+    monkeypatch.setattr(daemon_module, "STATE_FOLDER", state_folder)
+    container = Container(docker_folder)
+    attach_fakes(container, images=IMAGES)
+    server = PrestestDaemon(docker_folder)
+    server.cluster_manager = ClusterManager(container, state_folder=Path(tmpdir.join("state")))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = DaemonClient(server.socket_file)
+    for _ in range(100):
+        if client.is_running():
+            break
+        thread.join(0.05)
+    yield server
+    if thread.is_alive():
+        client.call("stop")
+        thread.join(10)
+    container.state.stop_watching()
+    shutil.rmtree(str(state_folder))
+
+
+def test_daemon_memoize_tables_changed_outside_daemon(server, hive, tmpdir):
+    client = DaemonClient.find(server.container.docker_folder)
+    assert client is not None and client.socket_file == server.socket_file
+    db_manager = DaemonDBManager(client, server.container)
+    file = Path(tmpdir.join("table.csv"))
+    file.write_text("1,abc\n")
+
+    assert db_manager.create_table("sandbox.test_table", CREATE_QUERY, file, memoize=True)
+    assert not db_manager.create_table("sandbox.test_table", CREATE_QUERY, file, memoize=True)
+    assert "sandbox.test_table" in client.call("status")["tables"]
+
+    hive.properties.clear()  # for example, the stack was reset without the daemon
+    assert db_manager.create_table("sandbox.test_table", CREATE_QUERY, file, memoize=True), \
+        "the fingerprint stored in hive should decide whether the table is reused"
+    assert db_manager.fetch_hive_query("DESCRIBE FORMATTED sandbox.test_table")[1][0] == "Location: "
+
+    db_manager.drop_database("sandbox")
+    assert hive.queries[-1] == "DROP DATABASE IF EXISTS sandbox CASCADE"
+
+
+def test_daemon_read_sql_in_client_namespace(server, hive, monkeypatch):
+    client = DaemonClient(server.socket_file)
+    db_manager = DaemonDBManager(client, server.container, namespace=Namespace("gw0"))
+    with FakePrestoServer([("col1", "bigint"), ("col2", "varchar")], [[1, "abc"], [None, "cba"]]) as presto:
+        monkeypatch.setattr(DBManager, "get_statement_client", lambda self: StatementClient(presto.url))
+        db_manager.create_database("sandbox")
+        df = db_manager.read_sql("SELECT * FROM sandbox.test_table", columnar=True)
+
+        assert_frame_equal(df, DBManager.from_container(server.container).read_sql("SELECT * FROM t", columnar=True))
+    assert presto.queries[0] == "SELECT * FROM sandbox_gw0.test_table"
+    assert hive.queries == ["CREATE DATABASE IF NOT EXISTS sandbox_gw0"]
+    assert db_manager.get_table_location("sandbox.t").endswith("sandbox_gw0.db/t"), \
+        "methods not served by the daemon should run locally"
+
+    with pytest.raises(DaemonError, match="unknown method"):
+        client.call("shutdown")
+
+
+def test_cli_status_and_down(server, docker_folder, capsys):
+    assert socket_path(docker_folder) == server.socket_file
+    assert main(["--docker-folder", str(docker_folder), "status"]) == 0
+    assert '"requests":' in capsys.readouterr().out
+
+    assert main(["--docker-folder", str(docker_folder), "down", "--daemon"]) == 0
+    assert "daemon stopped" in capsys.readouterr().out
+    for _ in range(100):
+        if not server.socket_file.exists():
+            break
+        threading.Event().wait(0.05)
+    assert DaemonClient.find(docker_folder) is None
+    assert main(["--docker-folder", str(docker_folder), "status"]) == 0
+    assert "daemon: not running" in capsys.readouterr().out
+
+
+def test_encode_dataframe_round_trip():
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"a": pd.array([1, None], dtype="Int64"), "b": pd.Series(["x", None], dtype=object),
+                       "c": pd.to_datetime(["2020-01-01", None]).as_unit("us"), "d": [1.5, None]})
+    df.columns = ["a", "b", "c", "a"]
+    decoded = decode_dataframe(encode_dataframe(df))
+    assert_frame_equal(decoded, df)
+    assert decoded.iloc[1, 1] is None
@@ -2,9 +2,13 @@ from pathlib import Path
 import pytest
 from pandas.testing import assert_frame_equal
 import pandas as pd
+from sqlalchemy import create_engine
 from sqlalchemy.exc import DatabaseError
 
 from prestest.db import DBManager
+from prestest.namespace import Namespace
+from prestest.presto import StatementClient
+from tests.fakes import FakePrestoServer
 from tests.test_container import container, start_container, DOCKER_FOLDER
 
 resource_folder = Path(".").resolve() / "resources"
@@ -39,3 +43,109 @@ def test_db_manager_create_drop_table_and_read_correctly(start_container, db_man
 
     with pytest.raises(DatabaseError):
         db_manager.read_sql(select_temp_table_query)
+
+
+def test_hive_queries_run_on_sqlalchemy_connections(fake_db_manager):
+    fake_db_manager.hive_client = create_engine("sqlite://")
+    fake_db_manager.run_hive_query("CREATE TABLE test_table (col1 INTEGER)")
+    fake_db_manager.run_hive_query("INSERT INTO test_table VALUES (1)")
+
+    assert fake_db_manager.fetch_hive_query("SELECT col1 FROM test_table") == [(1,)]
+    assert fake_db_manager.get_table_fingerprint("sandbox.test_table") is None, \
+        "a failing lookup should be reported as a missing fingerprint"
+
+
+def test_create_tables_upload_single_archive_and_create_database_once(fake_db_manager, tmpdir):
+    tables = []
+    for i, table in enumerate(["db_1.table_1", "db_1.table_2", "db_2.table_3"]):
+        file = Path(tmpdir.join(f"table_{i}.csv"))
+        file.write_text(f"{i},abc\n")
+        tables.append({"table": table, "query": f"CREATE TABLE {table} (col1 INT, col2 STRING)", "file": file})
+
+    fake_db_manager.create_tables(tables)
+
+    api = fake_db_manager.container.api_client
+    queries = fake_db_manager.hive_client.queries
+    assert api.calls.count("put_archive") == 1
+    assert [q for q in queries if q.startswith("CREATE DATABASE")] == \
+        ["CREATE DATABASE IF NOT EXISTS db_1", "CREATE DATABASE IF NOT EXISTS db_2"]
+    loads = [q for q in queries if q.startswith("LOAD DATA")]
+    assert len(loads) == 3
+    for spec, load in zip(tables, loads):
+        uploaded = load.split("'")[1]
+        assert load.endswith(f"INTO TABLE {spec['table']}")
+        assert api.uploaded[uploaded] == spec["file"].read_bytes()
+
+    staging = fake_db_manager.container.staging()
+    assert all(entry.references == 0 for entry in staging.files.values()), "staged files should be released"
+
+
+def test_db_manager_namespace_schemas_per_worker(fake_db_manager, tmpdir):
+    fake_db_manager.namespace = Namespace("gw3")
+    file = Path(tmpdir.join("table.csv"))
+    file.write_text("1,abc\n")
+
+    fake_db_manager.create_table("sandbox.table", "CREATE TABLE sandbox.table (col1 INT, col2 STRING)", file)
+    fake_db_manager.drop_table("sandbox.table")
+
+    queries = fake_db_manager.hive_client.queries
+    assert queries[0] == "CREATE DATABASE IF NOT EXISTS sandbox_gw3"
+    assert "CREATE TABLE sandbox_gw3.table (col1 INT, col2 STRING)" in queries
+    assert queries[-1] == "DROP TABLE IF EXISTS sandbox_gw3.table"
+
+
+def test_iter_sql_yield_dataframe_batches(fake_db_manager):
+    rows = [[i, f"value_{i}"] for i in range(5)]
+    with FakePrestoServer([("col1", "bigint"), ("col2", "varchar")], rows, page_size=2) as server:
+        fake_db_manager.get_statement_client = lambda: StatementClient(server.url)
+        batches = list(fake_db_manager.iter_sql("SELECT * FROM sandbox.test_table", batch_rows=3))
+
+    assert [len(batch) for batch in batches] == [3, 2]
+    assert_frame_equal(pd.concat(batches, ignore_index=True),
+                       pd.DataFrame({"col1": range(5), "col2": [f"value_{i}" for i in range(5)]}))
+
+
+def test_create_table_from_dataframe_load_parquet_partitions(fake_db_manager):
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"col1": [1, 2, 3], "col2": ["abc", "cba", "xyz"], "ds": ["a", "a", "b"]})
+
+    fake_db_manager.create_table_from_dataframe("sandbox.test_table", df, partition_by=["ds"])
+
+    queries = fake_db_manager.hive_client.queries
+    assert "CREATE TABLE sandbox.test_table ( `col1` BIGINT, `col2` STRING ) PARTITIONED BY (`ds` STRING) " \
+           "STORED AS PARQUET" in queries
+    loads = [q for q in queries if q.startswith("LOAD DATA")]
+    assert [q.split("INTO TABLE ")[1] for q in loads] == \
+        ["sandbox.test_table PARTITION (`ds`='a')", "sandbox.test_table PARTITION (`ds`='b')"]
+    assert fake_db_manager.container.api_client.calls.count("put_archive") == 1
+
+
+def test_create_table_memoize_skip_identical_table(fake_db_manager, tmpdir):
+    file = Path(tmpdir.join("table.csv"))
+    file.write_text("1,abc\n")
+    query = "CREATE TABLE sandbox.table (col1 INT, col2 STRING)"
+
+    assert fake_db_manager.create_table("sandbox.table", query, file, memoize=True)
+    assert not fake_db_manager.create_table("sandbox.table", query, file, memoize=True)
+    queries = fake_db_manager.hive_client.queries
+    assert len([q for q in queries if q.startswith("LOAD DATA")]) == 1
+    assert fake_db_manager.container.api_client.calls.count("put_archive") == 1
+
+    file.write_text("2,xyz\n")
+    assert fake_db_manager.create_table("sandbox.table", query, file, memoize=True)
+    assert len([q for q in queries if q.startswith("LOAD DATA")]) == 2
+
+
+def test_create_tables_memoize_only_load_changed_tables(fake_db_manager, tmpdir):
+    tables = []
+    for i, table in enumerate(["db_1.table_1", "db_1.table_2"]):
+        file = Path(tmpdir.join(f"table_{i}.csv"))
+        file.write_text(f"{i},abc\n")
+        tables.append({"table": table, "query": f"CREATE TABLE {table} (col1 INT, col2 STRING)", "file": file})
+    fake_db_manager.create_tables(tables, memoize=True)
+
+    tables[1]["query"] = "CREATE TABLE db_1.table_2 (col1 BIGINT, col2 STRING)"
+    fake_db_manager.create_tables(tables, memoize=True)
+
+    loads = [q for q in fake_db_manager.hive_client.queries if q.startswith("LOAD DATA")]
+    assert [load.split()[-1] for load in loads] == ["db_1.table_1", "db_1.table_2", "db_1.table_2"]
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import pytest
+
+from prestest import engines
+
+
+@pytest.fixture()
+def url(tmpdir):
+    yield f"sqlite:///{Path(tmpdir.join('engines.db'))}"
+    engines.dispose_all()
+
+
+def test_get_engine_return_shared_engine_per_url_and_connect_args(url):
+    engine = engines.get_engine(url)
+    assert engines.get_engine(url) is engine
+    assert engines.get_engine(url, connect_args={"timeout": 5}) is not engine
+
+
+def test_warm_up_keep_connections_in_pool(url):
+    engine = engines.get_engine(url)
+    assert engines.warm_up(engine, connections=3) == 3
+    assert engine.pool.checkedin() == 3
+
+
+def test_warm_up_ignore_connection_errors(tmpdir):
+    engine = engines.get_engine(f"sqlite:///{Path(tmpdir)}/missing/folder.db")
+    assert engines.warm_up(engine, connections=2) == 0
+    engines.dispose_all()
+
+
+def test_configure_recreate_engines_with_new_pool_options(url):
+    engine = engines.get_engine(url)
+    original = dict(engines.POOL_OPTIONS)
+    try:
+        engines.configure(pool_size=7)
+        new_engine = engines.get_engine(url)
+        assert new_engine is not engine
+        assert new_engine.pool.size() == 7
+    finally:
+        engines.configure(**original)
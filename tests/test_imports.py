@@ -0,0 +1,29 @@
+import re
+import subprocess
+import sys
+
+HEAVY_MODULES = ["docker", "pandas", "numpy", "sqlalchemy", "thrift", "pyhive", "requests", "pyarrow", "sqlglot"]
+
+IMPORT_BUDGET = 0.25  # seconds for importing the plugin once pytest is imported
+
+
+def run_python(code):
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code], stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+def test_plugin_import_does_not_load_heavy_modules():
+    result = run_python(f"import sys, pytest, prestest.plugin; print([m for m in {HEAVY_MODULES} if m in sys.modules])")
+    assert result.stdout.strip() == "[]"
+
+
+def test_plugin_import_within_budget():
+    result = run_python("import pytest; import prestest.plugin")
+    cumulative = re.search(r"\|\s*(\d+) \| prestest\.plugin$", result.stderr, re.MULTILINE)
+    assert int(cumulative.group(1)) / 1e6 < IMPORT_BUDGET
+
+
+def test_container_does_not_contact_docker_until_used():
+    result = run_python("import sys; from prestest.container import Container; c = Container('.'); "
+                        "print(c.snapshots.folder.name, 'docker' in sys.modules)")
+    assert result.stdout.strip() == "snapshots False"
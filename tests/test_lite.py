@@ -0,0 +1,135 @@
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from prestest.lite import LiteDBManager, parse_create_table
+
+pytest_plugins = ["pytester"]
+
+resource_folder = Path(__file__).resolve().parent / "resources"
+
+CREATE_TABLE = """CREATE TABLE {table_name} (
+    col1 INTEGER,
+    col2 STRING
+)
+ROW FORMAT DELIMITED
+FIELDS TERMINATED BY ','
+STORED AS TEXTFILE
+"""
+
+
+def test_parse_create_table():
+    table = parse_create_table("""CREATE EXTERNAL TABLE IF NOT EXISTS `sandbox`.`table_1` (
+        `id` BIGINT COMMENT 'id, unique',
+        amount DECIMAL(10,2),
+        tags ARRAY<STRUCT<name:STRING, value:INT>>
+    )
+    PARTITIONED BY (ds STRING)
+    ROW FORMAT DELIMITED FIELDS TERMINATED BY '\\t'""")
+
+    assert table.table == "sandbox.table_1"
+    assert table.columns == [("id", "INTEGER"), ("amount", "REAL"), ("tags", "TEXT"), ("ds", "TEXT")]
+    assert table.delimiter == "\t"
+    assert table.convert(["1", "\\N"]) == (1, None, None, None)
+
+
+def test_create_table_and_read_sql():
+    db_manager = LiteDBManager()
+    table = "sandbox.test_table"
+    db_manager.create_table(table, CREATE_TABLE.format(table_name=table), resource_folder / "sample_table.csv")
+
+    result = db_manager.read_sql(f"SELECT * FROM {table} ORDER BY col1")
+    assert_frame_equal(result, pd.DataFrame({"col1": [123, 456], "col2": ["abc", "cba"]}))
+
+    db_manager.drop_table(table)
+    with pytest.raises(Exception):
+        db_manager.read_sql(f"SELECT * FROM {table}")
+
+
+def test_presto_dialect_is_transpiled():
+    pytest.importorskip("sqlglot")
+    db_manager = LiteDBManager()
+    table = "sandbox.test_table"
+    db_manager.create_table(table, CREATE_TABLE.format(table_name=table), resource_folder / "sample_table.csv")
+
+    result = db_manager.read_sql(f"SELECT IF(col1 > 200, 'big', 'small') AS size, CAST(col1 AS VARCHAR) AS text "
+                                 f"FROM {table} ORDER BY col1")
+    assert_frame_equal(result, pd.DataFrame({"size": ["small", "big"], "text": ["123", "456"]}))
+
+
+def test_create_table_from_dataframe_and_iter_sql():
+    db_manager = LiteDBManager()
+    df = pd.DataFrame({"col1": [1, 2, 3], "col2": ["abc", "cba", "xyz"], "ds": ["a", "a", "b"]})
+    db_manager.create_table_from_dataframe("sandbox.table", df, partition_by=["ds"])
+
+    batches = list(db_manager.iter_sql('SELECT col1, ds FROM sandbox."table" ORDER BY col1', batch_rows=2))
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert list(pd.concat(batches)["ds"]) == ["a", "a", "b"]
+
+    batches = db_manager.iter_sql('SELECT col1 FROM sandbox."table" ORDER BY col1', batch_rows=1)
+    assert next(batches)["col1"].tolist() == [1]
+    assert can_lock_from_other_thread(db_manager), "the lock should not be held between batches"
+    assert len(db_manager.read_sql('SELECT * FROM sandbox."table"')) == 3
+    assert next(batches)["col1"].tolist() == [2]
+    batches.close()
+
+
+def can_lock_from_other_thread(db_manager) -> bool:
+    acquired = []
+
+    def acquire():
+        acquired.append(db_manager.lock.acquire(blocking=False))
+        if acquired[0]:
+            db_manager.lock.release()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    thread.join()
+    return acquired[0]
+
+
+def test_transpile_requires_sqlglot(monkeypatch):
+    import builtins
+    from prestest.lite import transpile
+
+    real_import = builtins.__import__
+
+    def no_sqlglot(name, *args, **kwargs):
+        if name == "sqlglot":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_sqlglot)
+    with pytest.raises(ImportError, match="prestest\\[lite\\]"):
+        transpile("SELECT 1")
+
+
+def test_hive_database_statements():
+    db_manager = LiteDBManager()
+    db_manager.run_hive_query("CREATE DATABASE IF NOT EXISTS sandbox")
+    db_manager.run_hive_query("CREATE TABLE sandbox.numbers (n INT)")
+    db_manager.run_hive_query("INSERT INTO sandbox.numbers VALUES (1), (2)")
+    assert db_manager.fetch_hive_query("SELECT SUM(n) FROM sandbox.numbers") == [(3,)]
+
+    db_manager.run_hive_query("DROP DATABASE IF EXISTS sandbox CASCADE")
+    assert db_manager.schemas == set()
+
+
+def test_fixtures_use_lite_backend(pytester):
+    pytester.makeconftest('pytest_plugins = ["prestest.plugin"]')
+    pytester.makepyfile(f"""
+        import pytest
+        from prestest.lite import LiteDBManager
+
+        @pytest.mark.prestest(table_name="sandbox.test_table", query={CREATE_TABLE!r},
+                              file="{resource_folder / 'sample_table.csv'}")
+        def test_table(start_container, create_temporary_table, db_manager):
+            assert isinstance(db_manager, LiteDBManager)
+            assert len(db_manager.read_sql("SELECT * FROM sandbox.test_table")) == 2
+    """)
+    # the plugin is loaded by conftest instead of the entry point of an installed package
+    result = pytester.runpytest("-p", "no:prestest", "--prestest-backend=lite", "--strict-markers")
+    result.assert_outcomes(passed=1)
@@ -0,0 +1,33 @@
+from pathlib import Path
+import threading
+import time
+
+import pytest
+
+from prestest.lock import FileLock
+
+
+def test_file_lock_is_exclusive(tmpdir):
+    path = Path(tmpdir.join("cluster.lock"))
+    events = []
+
+    def hold():
+        with FileLock(path):
+            events.append("enter")
+            time.sleep(0.2)
+            events.append("exit")
+
+    threads = [threading.Thread(target=hold) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert events == ["enter", "exit"] * 3
+
+
+def test_file_lock_raise_on_timeout(tmpdir):
+    path = Path(tmpdir.join("cluster.lock"))
+    with FileLock(path):
+        with pytest.raises(TimeoutError):
+            FileLock(path, timeout=0.2).acquire()
@@ -0,0 +1,120 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from prestest.catalog import CatalogConfig
+from prestest.container import Container
+from prestest.lite import LiteDBManager
+from prestest.mounts import FIXTURE_MOUNT, OVERRIDE_FILE, FixtureMount, external_table_query
+from tests.fakes import attach_fakes, patch_subprocess
+
+COMPOSE = """version: "3"
+services:
+  presto-coordinator:
+    image: shawnzhu/prestodb:0.181
+"""
+
+CREATE_SAMPLE = """CREATE TABLE sandbox.sample (
+    col1 INT,
+    col2 STRING
+)
+ROW FORMAT DELIMITED
+FIELDS TERMINATED BY ','
+STORED AS TEXTFILE
+"""
+
+
+@pytest.fixture()
+def fixture_folder(tmpdir):
+    folder = Path(tmpdir.join("fixtures"))
+    (folder / "sample").mkdir(parents=True)
+    (folder / "sample" / "part-0.csv").write_text("1,abc\n2,cba\n")
+    (folder / "sample" / "part-1.csv").write_text("3,xyz\n")
+    (folder / "events" / "ds=2020-01-01").mkdir(parents=True)
+    (folder / "events" / "ds=2020-01-01" / "part-0.csv").write_text("1,abc\n")
+    return folder
+
+
+@pytest.fixture()
+def container(tmpdir, monkeypatch):
+    docker_folder = Path(tmpdir.join("docker-hive"))
+    docker_folder.mkdir()
+    (docker_folder / "docker-compose.yml").write_text(COMPOSE)
+    popen_calls = patch_subprocess(monkeypatch)
+    container = Container(docker_folder)
+    attach_fakes(container)
+    container.popen_calls = popen_calls
+    yield container
+    container.state.stop_watching()
+
+
+def test_fixture_mount_location_and_override(fixture_folder, tmpdir):
+    mount = FixtureMount(fixture_folder)
+    assert mount.location("sample") == f"file://{FIXTURE_MOUNT}/sample"
+    assert mount.location(fixture_folder / "events" / "ds=2020-01-01") == f"file://{FIXTURE_MOUNT}/events/ds=2020-01-01"
+    with pytest.raises(ValueError):
+        mount.location("../")
+    with pytest.raises(ValueError):
+        mount.location("sample/part-0.csv")
+
+    folder = Path(tmpdir.join("mounts"))
+    compose_file = Path(tmpdir.join("docker-compose.yml"))
+    compose_file.write_text(COMPOSE)
+    assert mount.write(folder, compose_file)
+    override = json.loads((folder / OVERRIDE_FILE).read_text())
+    assert override["version"] == "3"
+    assert sorted(override["services"]) == ["hive-metastore", "hive-server", "presto-coordinator"]
+    assert all(service["volumes"] == [f"{fixture_folder}:{FIXTURE_MOUNT}:ro"]
+               for service in override["services"].values())
+    assert not mount.write(folder, compose_file)
+
+
+def test_external_table_query():
+    query = external_table_query(CREATE_SAMPLE, "file:///prestest/fixtures/sample")
+    assert query.startswith("CREATE EXTERNAL TABLE sandbox.sample (")
+    assert query.endswith("STORED AS TEXTFILE\nLOCATION 'file:///prestest/fixtures/sample'")
+
+    query = external_table_query("create external table t (c INT) STORED AS ORC TBLPROPERTIES ('a'='b');", "file:///f")
+    assert query == "CREATE EXTERNAL TABLE t (c INT) STORED AS ORC LOCATION 'file:///f'\nTBLPROPERTIES ('a'='b')"
+
+    with pytest.raises(ValueError):
+        external_table_query(CREATE_SAMPLE + "LOCATION '/user/hive/sample'", "file:///f")
+    with pytest.raises(ValueError):
+        external_table_query("DROP TABLE t", "file:///f")
+
+
+def test_mount_fixtures_recreate_running_stack_with_overrides(container, fixture_folder):
+    assert container.mount_fixtures(fixture_folder)
+    mounts = container.compose.overrides
+    assert [file.name for file in mounts] == [OVERRIDE_FILE]
+    assert container.popen_calls == [container.compose.command("up -d")]
+    assert not container.mount_fixtures(fixture_folder), "nothing changed"
+
+    container.configure_catalog(CatalogConfig().with_table_modification())
+    assert len(container.compose.overrides) == 2 and container.compose.overrides[1] == mounts[0]
+    assert container.mount_fixtures(None)
+    assert container.popen_calls[-1].endswith(f"-f '{container.compose.overrides[0]}' up -d")
+    assert len(container.compose.overrides) == 1
+
+
+def test_create_external_table_without_copying_data(fake_db_manager, fixture_folder):
+    with pytest.raises(RuntimeError):
+        fake_db_manager.create_external_table("sandbox.sample", CREATE_SAMPLE, "sample")
+
+    fake_db_manager.container.fixture_mount = FixtureMount(fixture_folder)
+    fake_db_manager.create_external_table("sandbox.sample", CREATE_SAMPLE, "sample")
+    fake_db_manager.create_external_table("sandbox.events", CREATE_SAMPLE.replace(
+        "sample (", "events (").replace("ROW FORMAT", "PARTITIONED BY (ds STRING)\nROW FORMAT"), "events")
+
+    queries = fake_db_manager.hive_client.queries
+    assert f"LOCATION 'file://{FIXTURE_MOUNT}/sample'" in queries[2] and queries[2].startswith("CREATE EXTERNAL TABLE")
+    assert queries[-1] == "MSCK REPAIR TABLE sandbox.events"
+    assert "MSCK REPAIR TABLE sandbox.sample" not in queries
+    assert "put_archive" not in fake_db_manager.container.api_client.calls
+
+
+def test_lite_create_external_table(fixture_folder):
+    db_manager = LiteDBManager()
+    db_manager.create_external_table("sandbox.sample", CREATE_SAMPLE, "sample", mount=FixtureMount(fixture_folder))
+    assert db_manager.read_sql("SELECT * FROM sandbox.sample").values.tolist() == [[1, "abc"], [2, "cba"], [3, "xyz"]]
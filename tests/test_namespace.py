@@ -0,0 +1,42 @@
+from prestest.namespace import Namespace
+
+
+def test_rewrite_keep_query_without_suffix():
+    namespace = Namespace()
+    namespace.register("sandbox")
+    query = "SELECT * FROM sandbox.test_table"
+    assert namespace.rewrite(query) == query
+
+
+def test_rewrite_translate_registered_schemas_only():
+    namespace = Namespace("gw1")
+    namespace.register("sandbox")
+    query = "SELECT * FROM sandbox.a JOIN hive.sandbox.b ON 1 = 1 JOIN system.runtime.nodes ON 1 = 1"
+
+    assert namespace.rewrite(query) == \
+        "SELECT * FROM sandbox_gw1.a JOIN hive.sandbox_gw1.b ON 1 = 1 JOIN system.runtime.nodes ON 1 = 1"
+    assert namespace.table("sandbox.a") == "sandbox_gw1.a"
+
+
+def test_rewrite_register_created_database_and_translate_database_statements():
+    namespace = Namespace("gw0")
+    assert namespace.rewrite("CREATE DATABASE IF NOT EXISTS sandbox") == "CREATE DATABASE IF NOT EXISTS sandbox_gw0"
+    assert namespace.rewrite("DROP DATABASE IF EXISTS sandbox CASCADE") == \
+        "DROP DATABASE IF EXISTS sandbox_gw0 CASCADE"
+    assert namespace.rewrite("DROP DATABASE other") == "DROP DATABASE other"
+
+
+def test_rewrite_is_idempotent():
+    namespace = Namespace("gw0")
+    namespace.register("sandbox")
+    query = namespace.rewrite("INSERT INTO sandbox.t SELECT * FROM sandbox.s")
+    assert namespace.rewrite(query) == query
+
+
+def test_rewrite_skip_string_literals():
+    namespace = Namespace("gw0")
+    namespace.register("sandbox")
+    query = "SELECT 'sandbox.a', 'it''s sandbox.b', 'o\\'sandbox.c' FROM sandbox.t WHERE s = 'CREATE DATABASE x'"
+    assert namespace.rewrite(query) == \
+        "SELECT 'sandbox.a', 'it''s sandbox.b', 'o\\'sandbox.c' FROM sandbox_gw0.t WHERE s = 'CREATE DATABASE x'"
+    assert namespace.schemas == {"sandbox"}
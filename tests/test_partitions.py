@@ -0,0 +1,127 @@
+from pathlib import Path
+import threading
+
+import pytest
+
+from prestest.lite import LiteDBManager
+from prestest.partitions import add_partition_queries, parse_partition_path, partition_files, partition_path
+from tests.fakes import sqlite_engine
+
+CREATE_EVENTS = """CREATE TABLE sandbox.events (
+    id INT,
+    name STRING
+)
+PARTITIONED BY (ds STRING, country STRING)
+ROW FORMAT DELIMITED
+FIELDS TERMINATED BY ','
+STORED AS TEXTFILE
+"""
+
+LOCATION = "hdfs://namenode:8020/user/hive/warehouse/sandbox.db/events"
+
+
+@pytest.fixture()
+def events(tmpdir):
+    root = Path(tmpdir.join("events"))
+    for i, (ds, country) in enumerate([("2020-01-01", "us"), ("2020-01-01", "ca"), ("2020-01-02", "us")]):
+        folder = root / f"ds={ds}" / f"country={country}"
+        folder.mkdir(parents=True)
+        (folder / "part-0.csv").write_text(f"{i},event_{i}\n")
+    (root / "ds=2020-01-02" / "country=us" / "_SUCCESS").write_text("")
+    return root
+
+
+@pytest.fixture()
+def hdfs_commands(fake_db_manager):
+    commands = []
+    fake_db_manager.container.api_client.exec_handlers["hdfs"] = \
+        lambda c, cmd: commands.append((threading.current_thread().name, cmd[2:])) or (0, b"", b"")
+    return commands
+
+
+def test_partition_files_from_folder_and_mapping(events, tmpdir):
+    partitions = partition_files(events)
+    assert [partition_path(spec) for spec, _ in partitions] == \
+        ["ds=2020-01-01/country=ca", "ds=2020-01-01/country=us", "ds=2020-01-02/country=us"]
+    assert [file.name for _, files in partitions for file in files] == ["part-0.csv"] * 3, "_SUCCESS is ignored"
+
+    file = events / "ds=2020-01-01" / "country=us" / "part-0.csv"
+    partitions = partition_files({"ds=2020-01-01/country=us": file, (("ds", "2020/01/02"), ("country", "us")): [file]})
+    assert [partition_path(spec) for spec, _ in partitions] == \
+        ["ds=2020%2F01%2F02/country=us", "ds=2020-01-01/country=us"]
+
+    with pytest.raises(ValueError):
+        partition_files({"ds=2020-01-01": file, "country=us": file})
+    with pytest.raises(ValueError):
+        partition_files(events / "ds=2020-01-01" / "country=us")
+
+
+def test_add_partition_queries_in_batches():
+    partitions = [({"ds": f"2020-01-0{i}"}, f"{LOCATION}/ds=2020-01-0{i}") for i in range(1, 6)]
+    queries = add_partition_queries("sandbox.events", partitions, batch=2)
+    assert len(queries) == 3
+    assert queries[0] == f"ALTER TABLE sandbox.events ADD IF NOT EXISTS PARTITION (`ds`='2020-01-01') LOCATION " \
+                         f"'{LOCATION}/ds=2020-01-01' PARTITION (`ds`='2020-01-02') LOCATION '{LOCATION}/ds=2020-01-02'"
+
+
+def test_add_partition_queries_escape_values():
+    partitions = parse_partition_path("country=o%27neil"), f"{LOCATION}/country=o%27neil"
+    assert add_partition_queries("sandbox.events", [partitions]) == \
+        [f"ALTER TABLE sandbox.events ADD IF NOT EXISTS PARTITION (`country`='o\\'neil') LOCATION "
+         f"'{LOCATION}/country=o%27neil'"]
+
+
+def test_create_partitioned_table_put_concurrently_and_register_in_bulk(fake_db_manager, hdfs_commands, events):
+    assert fake_db_manager.create_partitioned_table("sandbox.events", CREATE_EVENTS, events, concurrency=3)
+
+    api = fake_db_manager.container.api_client
+    assert api.calls.count("put_archive") == 1, "all partition files should be staged in one archive"
+    mkdir, puts = hdfs_commands[0][1], [cmd for _, cmd in hdfs_commands[1:]]
+    folders = [f"{LOCATION}/{path}" for path in
+               ["ds=2020-01-01/country=ca", "ds=2020-01-01/country=us", "ds=2020-01-02/country=us"]]
+    assert mkdir == ["-mkdir", "-p"] + folders
+    assert sorted(put[-1] for put in puts) == folders
+    assert all(put[:2] == ["-put", "-f"] and api.uploaded[put[2]] for put in puts)
+    assert all(name.startswith("prestest-partitions") for name, _ in hdfs_commands[1:])
+
+    queries = fake_db_manager.hive_client.queries
+    assert not [q for q in queries if q.startswith("LOAD DATA")]
+    adds = [q for q in queries if " ADD IF NOT EXISTS " in q]
+    assert len(adds) == 1 and adds[0].count("PARTITION (") == 3
+
+
+def test_create_partitioned_table_msck_and_memoize(fake_db_manager, hdfs_commands, events):
+    assert fake_db_manager.create_partitioned_table("sandbox.events", CREATE_EVENTS, events, register="msck",
+                                                    memoize=True)
+    assert not fake_db_manager.create_partitioned_table("sandbox.events", CREATE_EVENTS, events, register="msck",
+                                                        memoize=True)
+    queries = fake_db_manager.hive_client.queries
+    assert queries.count("MSCK REPAIR TABLE sandbox.events") == 1
+    assert not [q for q in queries if " ADD IF NOT EXISTS " in q]
+
+    (events / "ds=2020-01-03" / "country=us").mkdir(parents=True)
+    (events / "ds=2020-01-03" / "country=us" / "part-0.csv").write_text("3,event_3\n")
+    assert fake_db_manager.create_partitioned_table("sandbox.events", CREATE_EVENTS, events, memoize=True)
+
+    with pytest.raises(ValueError):
+        fake_db_manager.create_partitioned_table("sandbox.events", CREATE_EVENTS, events, register="load")
+
+
+def test_create_partitioned_table_on_sqlalchemy_engine(fake_db_manager, hdfs_commands, events):
+    hive = fake_db_manager.hive_client
+    fake_db_manager.hive_client = sqlite_engine(hive)
+
+    assert fake_db_manager.create_partitioned_table("sandbox.events", CREATE_EVENTS, events, memoize=True)
+    assert hdfs_commands[0][1][2] == f"{LOCATION}/ds=2020-01-01/country=ca", "location should be read from hive"
+    assert not fake_db_manager.create_partitioned_table("sandbox.events", CREATE_EVENTS, events, memoize=True), \
+        "fingerprint should be read from hive"
+    assert len([q for q in hive.queries if q.startswith("DESCRIBE FORMATTED")]) == 1
+
+
+def test_lite_create_partitioned_table(events):
+    db_manager = LiteDBManager()
+    db_manager.create_partitioned_table("sandbox.events", CREATE_EVENTS, events)
+
+    result = db_manager.read_sql("SELECT * FROM sandbox.events ORDER BY id")
+    assert result.values.tolist() == [[0, "event_0", "2020-01-01", "us"], [1, "event_1", "2020-01-01", "ca"],
+                                      [2, "event_2", "2020-01-02", "us"]]
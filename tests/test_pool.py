@@ -0,0 +1,96 @@
+from pathlib import Path
+import threading
+
+import pytest
+
+from prestest.pool import ClusterPool
+from tests.fakes import FakeAPIClient, attach_fakes, compose_stack, patch_subprocess
+from tests.test_cluster import COMPOSE, IMAGES
+
+
+@pytest.fixture()
+def docker_folder(tmpdir):
+    folder = Path(tmpdir.join("docker-hive"))
+    folder.mkdir()
+    (folder / "docker-compose.yml").write_text(COMPOSE)
+    return folder
+
+
+@pytest.fixture()
+def popen_calls(monkeypatch):
+    return patch_subprocess(monkeypatch)
+
+
+def make_pool(docker_folder, tmpdir, size=2, **kwargs):
+    pool = ClusterPool(docker_folder, size, state_folder=Path(tmpdir.join("state")), **kwargs)
+    for container in pool.containers:
+        attach_fakes(container, FakeAPIClient(compose_stack(container.project)), images=IMAGES)
+    return pool
+
+
+def test_pool_members_are_independent_projects(docker_folder, tmpdir, popen_calls):
+    pool = make_pool(docker_folder, tmpdir)
+    assert [c.project for c in pool.containers] == ["prestest-0", "prestest-1"]
+    assert [c.compose.presto_url for c in pool.containers] == ["presto://localhost:8180", "presto://localhost:8280"]
+
+    assert pool.start() == [True, True]
+    assert sorted(command.split()[2] for command in popen_calls) == ["prestest-0", "prestest-1"]
+    assert pool.start() == [False, False], "running stacks should be attached to"
+    pool.close()
+
+
+def test_lease_hand_out_each_stack_once(docker_folder, tmpdir, popen_calls):
+    pool = make_pool(docker_folder, tmpdir)
+    # another process, such as a pytest-xdist worker, sharing the same stacks
+    other = make_pool(docker_folder, tmpdir)
+
+    first = pool.lease()
+    second = other.lease()
+    assert {first.container.project, second.container.project} == {"prestest-0", "prestest-1"}
+    with pytest.raises(TimeoutError):
+        pool.lease(timeout=0.2, poll_interval=0.05)
+
+    second.release()
+    with pool.lease(timeout=1) as third:
+        assert third.container.project == second.container.project
+    first.release()
+    first.release()
+    pool.close()
+    other.close()
+
+
+def test_returned_stack_restored_in_background(docker_folder, tmpdir, popen_calls):
+    pool = make_pool(docker_folder, tmpdir, size=1, snapshot="fixtures")
+    restoring, restored = threading.Event(), threading.Event()
+
+    def restore(name):
+        restoring.wait(5)
+        restored.set()
+
+    pool.managers[0].restore = restore
+    lease = pool.lease()
+    lease.release()
+    with pytest.raises(TimeoutError):
+        pool.lease(timeout=0.2, poll_interval=0.05)
+
+    restoring.set()
+    pool.wait(timeout=5)
+    assert restored.is_set()
+    pool.lease(timeout=1).release()
+    pool.close()
+
+
+def test_failed_recycle_restart_stack_at_next_lease(docker_folder, tmpdir, popen_calls):
+    pool = make_pool(docker_folder, tmpdir, size=1, reset=True)
+
+    def reset():
+        raise RuntimeError("cannot reset")
+
+    pool.managers[0].reset = reset
+    pool.lease().release()
+    pool.wait(timeout=5)
+
+    starts = len(popen_calls)
+    pool.lease(timeout=1).release()
+    assert len(popen_calls) == starts + 1
+    pool.close()
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+import pytest
+
+from prestest.presto import PrestoError, StatementClient, decode_column, fetch_arrow, fetch_dataframe, iter_batches
+from tests.fakes import FakePrestoServer
+
+COLUMNS = [("col1", "integer"), ("col2", "varchar(3)"), ("col3", "double"), ("col4", "boolean"), ("col5", "date")]
+
+ROWS = [[1, "abc", 1.5, True, "2020-01-01"], [2, "cba", None, False, "2020-01-02"], [3, None, 2.5, True, None]]
+
+
+@pytest.fixture()
+def server():
+    with FakePrestoServer(COLUMNS, ROWS, page_size=2) as server:
+        yield server
+
+
+def test_fetch_dataframe_decode_typed_columns(server):
+    result = fetch_dataframe(StatementClient(server.url), "SELECT * FROM sandbox.test_table")
+    expected = pd.DataFrame({"col1": np.array([1, 2, 3], dtype=np.int64),
+                             "col2": np.array(["abc", "cba", None], dtype=object),
+                             "col3": [1.5, np.nan, 2.5],
+                             "col4": [True, False, True],
+                             "col5": np.array(["2020-01-01", "2020-01-02", None], dtype="datetime64[D]")})
+    assert_frame_equal(result, expected, check_dtype=False)
+    assert result["col1"].dtype == np.int64
+    assert result["col3"].dtype == np.float64
+    assert result["col4"].dtype == np.bool_
+    assert server.requests == 2
+
+
+def test_fetch_dataframe_keep_columns_of_empty_result():
+    with FakePrestoServer(COLUMNS, []) as server:
+        result = fetch_dataframe(StatementClient(server.url), "SELECT * FROM sandbox.empty")
+    assert list(result.columns) == [name for name, _ in COLUMNS]
+    assert len(result) == 0
+
+
+def test_decode_column_use_nullable_types_for_missing_integers():
+    result = decode_column([1, None, 3], "bigint")
+    assert isinstance(result, pd.arrays.IntegerArray)
+    assert result.isna().tolist() == [False, True, False]
+
+
+def test_pages_raise_presto_error(server):
+    with pytest.raises(PrestoError):
+        fetch_dataframe(StatementClient(server.url), "SELECT FAIL")
+
+
+def test_pages_cancel_query_when_closed_early():
+    rows = [[i, "x", 0.0, True, "2020-01-01"] for i in range(100)]
+    with FakePrestoServer(COLUMNS, rows, page_size=10) as server:
+        pages = StatementClient(server.url).pages("SELECT * FROM big")
+        next(pages)
+        pages.close()
+
+        assert len(server.cancelled) == 1
+        assert server.requests < 10
+
+
+def test_fetch_arrow_return_arrow_table(server):
+    pa = pytest.importorskip("pyarrow")
+    result = fetch_arrow(StatementClient(server.url), "SELECT * FROM sandbox.test_table")
+    assert isinstance(result, pa.Table)
+    assert result.column("col1").type == pa.int64()
+    assert result.column("col2").to_pylist() == ["abc", "cba", None]
+
+
+def test_iter_batches_yield_fixed_size_batches():
+    rows = [[i, "x", float(i), i % 2 == 0, "2020-01-01"] for i in range(25)]
+    with FakePrestoServer(COLUMNS, rows, page_size=7) as server:
+        batches = list(iter_batches(StatementClient(server.url), "SELECT * FROM big", batch_rows=10))
+
+    assert [len(columns["col1"]) for _, columns in batches] == [10, 10, 5]
+    assert np.concatenate([columns["col1"] for _, columns in batches]).tolist() == list(range(25))
+
+
+def test_iter_batches_cancel_query_when_consumer_stops():
+    rows = [[i, "x", 0.0, True, "2020-01-01"] for i in range(1000)]
+    with FakePrestoServer(COLUMNS, rows, page_size=10) as server:
+        for _ in iter_batches(StatementClient(server.url), "SELECT * FROM big", batch_rows=20):
+            break
+
+        assert len(server.cancelled) == 1
+        assert server.requests < 10
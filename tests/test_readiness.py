@@ -0,0 +1,112 @@
+from pathlib import Path
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from thrift.transport.TTransport import TTransportException
+
+from prestest.container import Container
+from prestest import engines
+from prestest.readiness import NotReady, Readiness, probe_hive, probe_presto
+from prestest.state import WaitPolicy
+from tests.fakes import FakeEngine, FakePrestoServer, attach_fakes, patch_subprocess
+
+FAST = WaitPolicy(timeout=2, initial_delay=0.01, max_delay=0.05, jitter=0.5)
+
+
+class FlakyProbe:
+    """fail `failures` times, then pass"""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("connection refused")
+
+
+def test_wait_probe_services_in_parallel():
+    barrier = threading.Barrier(2, timeout=2)
+    readiness = Readiness({"presto": barrier.wait, "hive": barrier.wait}, FAST)
+    assert readiness.wait()
+
+
+def test_wait_retry_until_ready_and_cache_result():
+    presto, hive = FlakyProbe(failures=3), FlakyProbe()
+    readiness = Readiness({"presto": presto, "hive": hive}, FAST)
+
+    assert readiness.wait()
+    assert (presto.calls, hive.calls) == (4, 1)
+    assert readiness.wait()
+    assert readiness.is_ready()
+    assert (presto.calls, hive.calls) == (4, 1), "ready services should not be probed again"
+
+    readiness.invalidate(["hive"])
+    assert readiness.wait()
+    assert (presto.calls, hive.calls) == (4, 2)
+
+
+def test_wait_timeout_keep_last_error():
+    readiness = Readiness({"presto": FlakyProbe(failures=1000)}, WaitPolicy(timeout=0.1, initial_delay=0.01))
+    assert not readiness.wait()
+    assert isinstance(readiness.errors["presto"], ConnectionError)
+    assert not readiness.is_ready()
+
+
+def test_probe_presto_check_info_and_active_workers():
+    with FakePrestoServer([("_col0", "bigint")], [[1]]) as server:
+        probe_presto(server.url)
+        assert "system.runtime.nodes" in server.queries[-1]
+
+        with pytest.raises(NotReady):
+            probe_presto(server.url, min_workers=2)
+
+        server.info = {"starting": True}
+        with pytest.raises(NotReady):
+            probe_presto(server.url)
+
+
+def test_start_wait_for_readiness(tmpdir, monkeypatch):
+    patch_subprocess(monkeypatch)
+    container = Container(Path(tmpdir))
+    attach_fakes(container)
+    presto = FlakyProbe(failures=2)
+    container.readiness = Readiness({"presto": presto}, FAST)
+
+    container.start()
+    assert presto.calls == 3
+    container.start()
+    assert presto.calls == 3, "a running stack should not be probed again"
+    assert container.is_presto_started()
+
+    container.stop()
+    assert not container.readiness.is_ready()
+    container.readiness.probes["presto"] = FlakyProbe(failures=1000)
+    container.readiness.policy = WaitPolicy(timeout=0.1, initial_delay=0.01)
+    with pytest.raises(RuntimeError):
+        container.start()
+
+
+def test_create_database_wait_for_hive_after_connection_error(fake_db_manager, fake_engine):
+    hive = FlakyProbe(failures=2)
+    fake_db_manager.container.readiness = Readiness({"hive": hive}, FAST)
+    failures = [TTransportException(message="connection refused")]
+
+    def run(query):
+        if failures:
+            raise failures.pop()
+        return FakeEngine.run(fake_engine, query)
+
+    fake_engine.run = run
+
+    fake_db_manager.create_database("sandbox")
+    assert hive.calls == 3
+    assert fake_engine.queries == ["CREATE DATABASE IF NOT EXISTS sandbox"]
+
+
+def test_probe_hive_run_query_on_a_connection(monkeypatch):
+    monkeypatch.setattr(engines, "get_engine", lambda url: create_engine("sqlite://"))
+    with pytest.raises(OperationalError, match="SHOW DATABASES"):
+        probe_hive("hive://localhost:10000")  # sqlite cannot show databases, but the query reaches it
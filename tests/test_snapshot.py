@@ -0,0 +1,91 @@
+import io
+import json
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from prestest.container import Container, CONTAINER_NAMES
+from prestest.snapshot import SnapshotError, MANIFEST
+from tests.fakes import attach_fakes, patch_subprocess
+
+
+@pytest.fixture()
+def container(tmpdir, monkeypatch):
+    patch_subprocess(monkeypatch)
+    container = Container(Path(tmpdir.join("docker-hive")), snapshot_folder=Path(tmpdir.join("snapshots")))
+    api = attach_fakes(container)
+    api.stack[CONTAINER_NAMES["namenode"]].files["/hadoop/dfs/name/current/fsimage"] = b"fsimage"
+    api.stack[CONTAINER_NAMES["datanode"]].files["/hadoop/dfs/data/current/blk_1"] = b"123,abc"
+    api.stack[CONTAINER_NAMES["hive-metastore-postgresql"]].files["/var/lib/postgresql/data/base/1"] = b"tables"
+    yield container
+    container.state.stop_watching()
+
+
+def files_of(container, component):
+    return dict(container.api_client.stack[CONTAINER_NAMES[component]].files)
+
+
+def test_snapshot_and_restore_bring_back_warehouse(container):
+    container.snapshot("warehouse")
+    datanode = container.api_client.stack[CONTAINER_NAMES["datanode"]]
+    datanode.files["/hadoop/dfs/data/current/blk_1"] = b"changed"
+    datanode.files["/hadoop/dfs/data/current/blk_2"] = b"new block"
+
+    container.restore("warehouse")
+
+    assert files_of(container, "datanode") == {"/hadoop/dfs/data/current/blk_1": b"123,abc"}
+    assert files_of(container, "namenode") == {"/hadoop/dfs/name/current/fsimage": b"fsimage"}
+    assert files_of(container, "hive-metastore-postgresql") == {"/var/lib/postgresql/data/base/1": b"tables"}
+
+
+def test_snapshot_write_manifest(container):
+    container.snapshot("warehouse")
+    manifest = container.snapshots.manifest("warehouse")
+
+    assert container.snapshots.names() == ["warehouse"]
+    assert {entry["component"] for entry in manifest["archives"]} == \
+        {"namenode", "datanode", "hive-metastore-postgresql"}
+    assert manifest["images"]["datanode"] == "sha256:hive"
+
+
+def test_restore_raise_for_unknown_snapshot(container):
+    with pytest.raises(SnapshotError):
+        container.restore("unknown")
+
+
+def test_export_and_import_snapshot_roundtrip(container, tmpdir):
+    container.snapshot("warehouse")
+    artifact = container.export_snapshot("warehouse", Path(tmpdir))
+    assert artifact.name == "warehouse.prestest-snapshot-v1.tar.gz"
+
+    container.snapshots.delete("warehouse")
+    assert container.import_snapshot(artifact, name="ci") == "ci"
+    container.api_client.stack[CONTAINER_NAMES["datanode"]].files.clear()
+    container.restore("ci")
+
+    assert files_of(container, "datanode") == {"/hadoop/dfs/data/current/blk_1": b"123,abc"}
+
+
+def test_manifest_reject_unsupported_format_version(container):
+    container.snapshot("warehouse")
+    manifest_file = container.snapshots.path("warehouse") / MANIFEST
+    manifest = json.loads(manifest_file.read_text())
+    manifest["format_version"] = 0
+    manifest_file.write_text(json.dumps(manifest))
+
+    with pytest.raises(SnapshotError):
+        container.snapshots.manifest("warehouse")
+
+
+@pytest.mark.parametrize("name", ["/tmp/warehouse/manifest.json", "warehouse/../../escaped.json"])
+def test_import_reject_members_outside_snapshot(container, tmpdir, name):
+    artifact = Path(tmpdir.join("crafted.tar.gz"))
+    with tarfile.open(str(artifact), "w:gz") as tar:
+        info = tarfile.TarInfo(name)
+        info.size = 2
+        tar.addfile(info, io.BytesIO(b"{}"))
+
+    with pytest.raises(SnapshotError):
+        container.import_snapshot(artifact)
+    assert not Path(tmpdir.join("escaped.json")).exists()
@@ -0,0 +1,133 @@
+import threading
+from pathlib import Path, PurePosixPath
+
+import pytest
+
+from prestest.container import Container, TempContainerFile, TempContainerFolder
+from prestest.staging import StagingArea
+from tests.fakes import attach_fakes
+
+HIVE_SERVER = "docker-hive_hive-server_1"
+
+
+@pytest.fixture()
+def container(tmpdir):
+    container = Container(Path(tmpdir))
+    attach_fakes(container)
+    return container
+
+
+def write(tmpdir, name, content):
+    file = Path(tmpdir.join(name))
+    file.write_bytes(content)
+    return file
+
+
+def test_upload_identical_content_once(container, tmpdir):
+    file = write(tmpdir, "table.csv", b"1,abc\n")
+    copy = write(tmpdir, "copy.csv", b"1,abc\n")
+
+    with container.upload_temp_table_file(file) as first:
+        with container.upload_temp_table_file(copy) as second:
+            assert first == second
+    with container.upload_temp_table_file(file) as third:
+        assert third == first
+
+    api = container.api_client
+    assert api.calls.count("put_archive") == 1
+    assert api.stack[HIVE_SERVER].files[str(first)] == b"1,abc\n"
+    assert str(first).endswith(".csv")
+
+
+def test_upload_changed_file_again(container, tmpdir):
+    file = write(tmpdir, "table.csv", b"1,abc\n")
+    with container.upload_temp_table_file(file) as first:
+        pass
+    file.write_bytes(b"2,xyz\n")
+    with container.upload_temp_table_file(file) as second:
+        assert second != first
+
+    assert container.api_client.calls.count("put_archive") == 2
+
+
+def test_upload_multiple_files_uploads_missing_files_in_one_archive(container, tmpdir):
+    files = [write(tmpdir, f"table_{i}.csv", f"{i},abc\n".encode()) for i in range(3)]
+    with container.upload_temp_table_file(files[0]):
+        pass
+    with container.upload_temp_table_files(files) as staged:
+        assert len(set(staged)) == 3
+
+    assert container.api_client.calls.count("put_archive") == 2
+    assert container.staging().uploads == 2
+
+
+def test_evict_least_recently_used_unreferenced_files(container, tmpdir):
+    area = StagingArea(container, HIVE_SERVER, budget=16)
+    files = [write(tmpdir, f"table_{i}.csv", f"{i},abcd\n".encode()) for i in range(3)]  # 7 bytes each
+
+    first, = area.acquire([files[0]])
+    second, = area.acquire([files[1]])
+    area.release([second])
+    third, = area.acquire([files[2]])
+    assert len(area.files) == 3, "referenced files are never evicted"
+
+    area.release([first])
+    area.release([third])
+    assert list(area.files) == [first.name, third.name]
+    remaining = container.api_client.stack[HIVE_SERVER].files
+    assert str(first) in remaining and str(third) in remaining and str(second) not in remaining
+
+
+def test_forget_staged_files_of_recreated_container(container, tmpdir):
+    file = write(tmpdir, "table.csv", b"1,abc\n")
+    with container.upload_temp_table_file(file):
+        pass
+
+    container.api_client.stack[HIVE_SERVER].id = "recreated"
+    container.state.invalidate()
+    with container.upload_temp_table_file(file) as staged:
+        assert isinstance(staged, PurePosixPath)
+
+    assert container.api_client.calls.count("put_archive") == 2
+
+
+def test_concurrent_uploads_run_outside_the_lock(container, tmpdir, monkeypatch):
+    area = StagingArea(container, HIVE_SERVER)
+    files = [write(tmpdir, f"table_{i}.csv", f"{i},abc\n".encode()) for i in range(2)]
+    first_started, release_first = threading.Event(), threading.Event()
+    put_files = container.put_files
+
+    def slow_put_files(archive, *args, **kwargs):
+        if files[0] in archive.values():
+            first_started.set()
+            release_first.wait(10)
+        return put_files(archive, *args, **kwargs)
+
+    monkeypatch.setattr(container, "put_files", slow_put_files)
+    results = {}
+    first = threading.Thread(target=lambda: results.update(first=area.acquire([files[0]])))
+    first.start()
+    assert first_started.wait(10)
+
+    assert area.acquire([files[1]]), "another file should be uploaded while the first upload runs"
+    same = threading.Thread(target=lambda: results.update(same=area.acquire([files[0]])))
+    same.start()
+    same.join(0.2)
+    assert same.is_alive(), "the same file should wait for its upload in flight"
+
+    release_first.set()
+    first.join(10)
+    same.join(10)
+    assert results["first"] == results["same"]
+    assert area.uploads == 2 and area.files[results["first"][0].name].references == 2
+
+
+def test_deprecated_temp_container_classes_stage_files(container, tmpdir):
+    file = write(tmpdir, "table.csv", b"1,abc\n")
+    with pytest.warns(DeprecationWarning):
+        with TempContainerFile(container, file) as staged:
+            assert container.api_client.stack[HIVE_SERVER].files[str(staged)] == b"1,abc\n"
+    with pytest.warns(DeprecationWarning):
+        with TempContainerFolder(container, [file]) as files:
+            assert files == [staged]
+    assert container.api_client.calls.count("put_archive") == 1
@@ -0,0 +1,116 @@
+from pathlib import Path
+import threading
+import time
+
+from docker.errors import NotFound
+import pytest
+
+from prestest.container import Container, CONTAINER_NAMES
+from prestest.state import ClusterState, WaitPolicy
+from tests.fakes import FakeAPIClient, attach_fakes, patch_subprocess
+
+
+@pytest.fixture()
+def api():
+    return FakeAPIClient()
+
+
+@pytest.fixture()
+def state(api):
+    state = ClusterState(api, CONTAINER_NAMES, ttl=60)
+    yield state
+    state.stop_watching()
+
+
+@pytest.fixture()
+def container(tmpdir, api, monkeypatch):
+    patch_subprocess(monkeypatch)
+    container = Container(Path(tmpdir))
+    attach_fakes(container, api)
+    yield container
+    container.state.stop_watching()
+
+
+def test_refresh_use_single_list_call(state, api):
+    assert state.is_healthy()
+    assert state.is_started()
+    assert api.calls == ["containers"]
+
+
+def test_containers_cached_until_invalidated(state, api):
+    state.is_healthy()
+    api.set_health("unhealthy")
+    assert state.is_healthy(), "state should be served from cache"
+
+    state.invalidate()
+    assert not state.is_healthy()
+    assert api.calls == ["containers", "containers"]
+
+
+def test_containers_parse_health_status(state, api):
+    api.set_health("starting")
+    api.stack["docker-hive_namenode_1"].health = None
+    api.stack["docker-hive_datanode_1"].status = "exited"
+    containers = state.containers()
+
+    assert containers["hive-server"].health == "starting"
+    assert containers["namenode"].health is None
+    assert containers["datanode"].status == "exited"
+    assert not state.is_healthy()
+
+
+def test_watch_apply_events_without_list_call(state, api):
+    state.watch()
+    api.emit("docker-hive_hive-server_1", "health_status: unhealthy")
+    deadline = time.monotonic() + 5
+    while state.is_healthy() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert not state.is_healthy()
+    assert api.calls.count("containers") == 1
+
+
+def test_wait_until_healthy_return_on_last_health_event(state, api):
+    api.set_health("starting")
+    state.watch()
+
+    def become_healthy():
+        time.sleep(0.2)
+        for name in CONTAINER_NAMES.values():
+            api.emit(name, "health_status: healthy")
+
+    threading.Thread(target=become_healthy).start()
+    started = time.monotonic()
+    assert state.wait_until_healthy(WaitPolicy(timeout=30, initial_delay=20))
+    assert time.monotonic() - started < 5
+
+
+def test_wait_until_healthy_poll_with_backoff_when_not_watching(state, api):
+    api.set_health("starting")
+    policy = WaitPolicy(timeout=0.3, initial_delay=0.05, max_delay=0.1)
+
+    assert not state.wait_until_healthy(policy)
+    assert api.calls.count("containers") > 2
+
+
+def test_wait_policy_delays_back_off_until_max_delay():
+    delays = WaitPolicy(initial_delay=0.5, max_delay=3, backoff=2).delays()
+    assert [next(delays) for _ in range(5)] == [0.5, 1, 2, 3, 3]
+
+
+def test_start_raise_when_not_healthy_in_time(container, api):
+    api.set_health("starting")
+    with pytest.raises(RuntimeError):
+        container.start(wait_policy=WaitPolicy(timeout=0.2, initial_delay=0.05))
+
+
+def test_is_started_raise_not_found_for_missing_container(container, api):
+    del api.stack["docker-hive_hive-server_1"]
+    with pytest.raises(NotFound):
+        container.is_started()
+
+
+def test_state_shared_between_containers(container, api, tmpdir):
+    other = Container(Path(tmpdir))
+    attach_fakes(other, api)
+    assert other.state is container.state
@@ -0,0 +1,109 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from prestest.namespace import Namespace
+from prestest.teardown import DATABASE, TABLE, TeardownItem, TeardownQueue
+from tests.fakes import FakeEngine
+
+
+class BlockingEngine(FakeEngine):
+    """a FakeEngine which blocks background drops until `release` is set, and fails drops of tables named 'broken'"""
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def run(self, query):
+        if query.startswith("DROP") and threading.current_thread().name == "prestest-teardown":
+            self.release.wait(10)
+            if "broken" in query:
+                raise RuntimeError("hive is broken")
+        return super().run(query)
+
+
+@pytest.fixture()
+def fake_engine():
+    return BlockingEngine()
+
+
+@pytest.fixture()
+def fake_teardown():
+    return TeardownQueue()
+
+
+def drops(db_manager):
+    return [query for query in db_manager.hive_client.queries if query.startswith("DROP")]
+
+
+def test_batch_remove_duplicates_and_tables_of_dropped_databases(fake_db_manager):
+    items = [TeardownItem(fake_db_manager, TABLE, "sandbox.t1"),
+             TeardownItem(fake_db_manager, TABLE, "SANDBOX.T1"),
+             TeardownItem(fake_db_manager, TABLE, "tmp.t2"),
+             TeardownItem(fake_db_manager, DATABASE, "tmp"),
+             TeardownItem(fake_db_manager, DATABASE, "tmp")]
+    assert TeardownQueue._batch(items) == [items[0], items[3]]
+
+
+def test_drops_run_in_background_and_flush(fake_db_manager):
+    queue = fake_db_manager.teardown
+    queue.drop_table(fake_db_manager, "sandbox.t1")
+    queue.drop_table(fake_db_manager, "sandbox.broken")
+    queue.drop_database(fake_db_manager, "tmp")
+    assert queue.pending or queue.running, "drops should not block the caller"
+
+    fake_db_manager.hive_client.release.set()
+    errors = queue.flush(timeout=10)
+    assert not queue.pending and not queue.running
+    assert [error.item.name for error in errors] == ["sandbox.broken"]
+    assert "hive is broken" in str(errors[0])
+    assert queue.dropped == 2
+    assert "DROP DATABASE IF EXISTS tmp CASCADE" in drops(fake_db_manager)
+
+
+def test_recreate_table_cancel_queued_drop(fake_db_manager):
+    queue = fake_db_manager.teardown
+    queue.drop_table(fake_db_manager, "sandbox.t0")  # keeps the worker busy until released
+    with queue._condition:
+        assert queue._condition.wait_for(lambda: queue.running, 10)
+    queue.drop_table(fake_db_manager, "sandbox.t1")
+    queue.drop_database(fake_db_manager, "tmp")
+    fake_db_manager.drop_table("sandbox.t1")
+    assert [item.name for item in queue.running] == ["sandbox.t0"]
+    assert [item.name for item in queue.pending] == ["tmp"]
+
+    created = threading.Thread(target=fake_db_manager.create_database, args=("tmp",))
+    created.start()
+    created.join(0.2)
+    assert created.is_alive(), "creating a database should wait for its queued drop"
+    fake_db_manager.hive_client.release.set()
+    created.join(10)
+    queue.flush(timeout=10)
+
+    queries = fake_db_manager.hive_client.queries
+    assert drops(fake_db_manager).count("DROP TABLE IF EXISTS sandbox.t1") == 1
+    assert queries.index("DROP DATABASE IF EXISTS tmp CASCADE") < queries.index("CREATE DATABASE IF NOT EXISTS tmp")
+
+
+def test_drop_recorded_per_worker_databases(fake_db_manager, tmpdir):
+    fake_db_manager.namespace = Namespace("gw0")
+    file = Path(tmpdir) / "t.csv"
+    file.write_text("1\n")
+    queue = fake_db_manager.teardown
+    fake_db_manager.create_table("sandbox.t1", "CREATE TABLE sandbox.t1 (a INT)", file)
+    fake_db_manager.create_table("sandbox.t2", "CREATE TABLE sandbox.t2 (a INT)", file)
+    fake_db_manager.create_table("memo.t3", "CREATE TABLE memo.t3 (a INT)", file, memoize=True)
+    assert sorted(target for _, target in queue.databases) == ["memo_gw0", "sandbox_gw0"]
+
+    fake_db_manager.hive_client.release.set()
+    queue.drop_recorded_databases()
+    queue.flush(timeout=10)
+    assert not queue.databases
+    assert [query for query in drops(fake_db_manager) if query.startswith("DROP DATABASE")] == \
+        ["DROP DATABASE IF EXISTS sandbox_gw0 CASCADE"]
+
+
+def test_shared_databases_are_not_recorded(fake_db_manager):
+    queue = fake_db_manager.teardown
+    fake_db_manager.create_database("sandbox")
+    assert not queue.databases
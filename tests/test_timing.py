@@ -0,0 +1,99 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from prestest.container import Container
+from prestest.timing import Recorder, get_recorder, timed
+from tests.fakes import attach_fakes
+
+pytest_plugins = ["pytester"]
+
+
+@pytest.fixture()
+def recorder():
+    recorder = get_recorder()
+    recorder.clear()
+    recorder.enable()
+    yield recorder
+    recorder.disable()
+    recorder.clear()
+
+
+def test_span_summary_and_attribution():
+    recorder = Recorder()
+    recorder.enable()
+    recorder.test = "test_a"
+    with recorder.span("outer"):
+        with recorder.span("inner"):
+            pass
+        with recorder.span("inner"):
+            pass
+    recorder.test = None
+    with recorder.span("outer"):
+        pass
+
+    summary = {phase["name"]: phase for phase in recorder.summary()}
+    assert summary["inner"]["count"] == 2 and summary["outer"]["count"] == 2
+    assert list(recorder.by_test()) == ["test_a"]
+    assert recorder.by_test()["test_a"] == pytest.approx(recorder.spans[2].duration)
+
+
+def test_disabled_recorder_only_calls_hooks():
+    recorder = Recorder()
+    seen = []
+    recorder.add_hook(seen.append)
+    with recorder.span("phase", table="sandbox.table"):
+        pass
+
+    assert recorder.spans == []
+    assert seen[0].name == "phase" and seen[0].attrs == {"table": "sandbox.table"}
+
+
+def test_timed_record_errors(recorder):
+    @timed("failing")
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        fail()
+    assert recorder.spans[-1].name == "failing"
+    assert recorder.spans[-1].attrs == {"error": "ValueError"}
+
+
+def test_container_operations_are_recorded(recorder, tmpdir):
+    container = Container(Path(tmpdir))
+    attach_fakes(container)
+    container.execute_command(["test", "-d", "/tmp"])
+    container.start(until_started=True)
+
+    names = [span.name for span in recorder.spans]
+    assert "container.exec" in names
+    assert names.index("container.health_wait") < names.index("container.start")
+
+
+def test_export_chrome_trace(recorder, tmpdir):
+    with recorder.span("phase"):
+        pass
+    file = Path(tmpdir.join("trace.json"))
+    recorder.export_chrome_trace(file)
+
+    events = json.loads(file.read_text())["traceEvents"]
+    assert events[0]["name"] == "phase" and events[0]["ph"] == "X" and events[0]["ts"] == 0
+
+
+def test_plugin_report_slowest_phases_and_export_trace(pytester):
+    pytester.makeconftest('pytest_plugins = ["prestest.plugin"]')
+    pytester.makepyfile("""
+        from prestest.timing import span
+
+        def test_one():
+            with span("db.load_data"):
+                pass
+    """)
+    result = pytester.runpytest("-p", "no:prestest", "--prestest-durations=5", "--prestest-trace=trace.json",
+                                "--prestest-trace-format=json")
+
+    result.stdout.fnmatch_lines(["*slowest prestest phases*", "*1 calls*db.load_data", "*test_one*"])
+    spans = json.loads((pytester.path / "trace.json").read_text())
+    assert spans[0]["test"].endswith("::test_one")